@@ -0,0 +1,434 @@
+# -*- coding: utf-8 -*-
+"""
+기관 검사 데이터 일괄 가져오기/내보내기
+
+가져오기: 한 줄 = 한 환자의 한 검사일. 컬럼 이름은 저장 스키마(axl_storage.MODALITIES)와 같게 맞춥니다.
+  patient_id, date, [name, sex, dob], OD_mm, OS_mm, OD_sph, ..., OD_ct, OS_ct, remarks
+내보내기: 모든 환자를 한 줄 = 한 측정값(long format)으로, 성별/생년월일/검사 시 나이와 함께 기록합니다.
+  patient_id, sex, dob, date, age, kind, eye, measure, value, remarks
+예측: 내보내기와 같은 long format으로 모든 (환자, 눈)의 20세 예측치를 한 번에 계산합니다 (axl_predict.batch_predict).
+
+사용 예:
+  python axl_bulk.py import export.csv --root ./axl_data --workers 8
+  python axl_bulk.py import export.xlsx --id-col 患者ID --rejects rejects.csv
+  python axl_bulk.py export dataset.parquet --root ./axl_data
+  python axl_bulk.py predict al_at_20.csv --measure mm --mode recommend
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from axl_predict import PREDICT_MODES, TARGET_AGE, batch_predict
+from axl_storage import (
+    MODALITIES, INDEX_COLUMNS, INDEX_LOCK_FILE, get_backend, value_columns, remarks_lookup, remarks_to_str, safe_id,
+    bundle_lock, file_lock, compact_journal, load_frames, summarize_bundle,
+)
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    _HAS_PYARROW = True
+except ImportError:
+    pa = pq = None
+    _HAS_PYARROW = False
+
+try:
+    import openpyxl
+    _HAS_OPENPYXL = True
+except ImportError:
+    openpyxl = None
+    _HAS_OPENPYXL = False
+
+DEFAULT_CHUNKSIZE = 50_000
+DEFAULT_FLUSH_ROWS = 500_000
+META_COLUMNS = ["name", "sex", "dob"]
+
+# 이 컬럼 중 하나라도 값이 있으면 해당 모달리티의 행으로 봄. 어느 키에도 값이 없는 행은 "측정값 없음"으로 거부
+# (AXL 행의 K1/K2는 AXL 프레임에도 남고 각막곡률 프레임에도 들어감)
+KIND_KEYS = {
+    "axl": ["OD_mm", "OS_mm"],
+    "re": ["OD_sph", "OD_cyl", "OD_axis", "OS_sph", "OS_cyl", "OS_axis", "OD_SE", "OS_SE"],
+    "k": ["OD_K1", "OD_K2", "OD_meanK", "OS_K1", "OS_K2", "OS_meanK"],
+    "ct": ["OD_ct", "OS_ct"],
+}
+
+NUMERIC_COLUMNS = sorted({c for kind in MODALITIES for c in value_columns(kind)})
+KEY_COLUMNS = sorted({c for keys in KIND_KEYS.values() for c in keys})
+
+# =========================
+#  입력 읽기 (청크 단위)
+# =========================
+def _iter_excel_chunks(path: Path, chunksize: int) -> Iterator[pd.DataFrame]:
+    if not _HAS_OPENPYXL:
+        raise RuntimeError("Excel 파일을 읽으려면 openpyxl이 필요합니다: pip install openpyxl")
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = [str(h).strip() if h is not None else "" for h in next(rows, [])]
+        buf = []
+        for r in rows:
+            buf.append(r)
+            if len(buf) >= chunksize:
+                yield pd.DataFrame(buf, columns=header)
+                buf = []
+        if buf:
+            yield pd.DataFrame(buf, columns=header)
+    finally:
+        wb.close()
+
+def iter_chunks(path: Path, chunksize: int = DEFAULT_CHUNKSIZE) -> Iterator[pd.DataFrame]:
+    if path.suffix.lower() in (".xlsx", ".xlsm"):
+        yield from _iter_excel_chunks(path, chunksize)
+    else:
+        # 빈 셀은 NaN, remarks/ID는 문자열 그대로
+        yield from pd.read_csv(path, chunksize=chunksize, dtype=str, keep_default_na=False, na_values=[""])
+
+# =========================
+#  청크 정규화
+# =========================
+def normalize_chunk(chunk: pd.DataFrame, id_col: str = "patient_id"):
+    """
+    청크 하나를 정리해 (accepted, rejects) 반환.
+    accepted에는 patient_id(안전한 폴더 이름), date, 숫자 컬럼, remarks(리스트)가 들어갑니다.
+    """
+    chunk = chunk.rename(columns=lambda c: str(c).strip())
+    if id_col not in chunk.columns or "date" not in chunk.columns:
+        raise ValueError(f"필수 컬럼이 없습니다: {id_col}, date")
+    df = chunk.copy()
+    df["patient_id"] = df[id_col].astype("string").fillna("").map(safe_id)
+    df["date"] = pd.to_datetime(df["date"], errors="coerce")
+
+    reason = pd.Series("", index=df.index, dtype="object")
+    for c in NUMERIC_COLUMNS:
+        if c not in df.columns:
+            df[c] = np.nan
+            continue
+        raw = df[c]
+        df[c] = pd.to_numeric(raw, errors="coerce")
+        bad = df[c].isna() & raw.notna() & (raw.astype("string").str.strip() != "")
+        reason = reason.mask(bad & (reason == ""), f"숫자 형식 오류: {c}")
+    reason = reason.mask(df["date"].isna() & (reason == ""), "날짜 형식 오류")
+    reason = reason.mask((df["patient_id"] == "") & (reason == ""), "환자 ID 없음")
+    has_value = df[KEY_COLUMNS].notna().any(axis=1)
+    reason = reason.mask(~has_value & (reason == ""), "측정값 없음")
+
+    # RE의 등가구면(SE)이 비어 있으면 S + C/2로 채움
+    for eye in ("OD", "OS"):
+        se = df[f"{eye}_sph"] + df[f"{eye}_cyl"] / 2.0
+        df[f"{eye}_SE"] = df[f"{eye}_SE"].fillna(se)
+
+    df["remarks"] = remarks_lookup(df["remarks"]) if "remarks" in df.columns else [[] for _ in range(len(df))]
+
+    ok = reason == ""
+    rejects = chunk[~ok].assign(reject_reason=reason[~ok])
+    keep = ["patient_id", "date", *NUMERIC_COLUMNS, "remarks", *[c for c in META_COLUMNS if c in df.columns]]
+    return df.loc[ok, keep], rejects
+
+def split_by_kind(batch: pd.DataFrame) -> dict:
+    """
+    버퍼에 모인 행 전체를 모달리티별로 한 번에 나눔 -> {kind: {patient_id: DataFrame}}
+    같은 환자/날짜는 나중 행 우선 (drop_duplicates(keep="last")와 같음)
+    """
+    out = {}
+    for kind, keys in KIND_KEYS.items():
+        rows = batch.loc[batch[keys].notna().any(axis=1), ["patient_id", *MODALITIES[kind]["columns"]]]
+        if rows.empty:
+            continue
+        rows = (rows.sort_values(["patient_id", "date"], kind="stable")
+                    .drop_duplicates(subset=["patient_id", "date"], keep="last"))
+        out[kind] = {pid: g.drop(columns="patient_id") for pid, g in rows.groupby("patient_id", sort=False)}
+    return out
+
+def meta_updates(batch: pd.DataFrame) -> dict:
+    """환자별 마지막으로 값이 있는 이름/성별/생년월일 -> {patient_id: {col: value}}"""
+    cols = [c for c in META_COLUMNS if c in batch.columns]
+    if not cols:
+        return {}
+    meta = batch[["patient_id", *cols]].copy()
+    for c in cols:
+        meta[c] = meta[c].astype("string").str.strip().replace("", pd.NA)
+    if "dob" in cols:
+        meta["dob"] = pd.to_datetime(meta["dob"], errors="coerce").dt.strftime("%Y-%m-%d")
+    last = meta.groupby("patient_id", sort=False)[cols].last()
+    return {pid: {c: v for c, v in row.items() if pd.notna(v)} for pid, row in last.iterrows()}
+
+# =========================
+#  쓰기
+# =========================
+def write_patient(pdir: Path, frames: dict, meta_update: dict, backend) -> int:
+    """
+    환자 폴더(pdir) 한 곳의 번들에 행을 추가. 추가한 행 수 반환.
+    처음 만드는 환자는 스냅샷을 바로 쓰고, 기존 환자는 저널(SQLite는 행 단위)로 추가합니다.
+    """
+    if backend.uses_file_lock:
+        pdir.mkdir(parents=True, exist_ok=True)
+    with bundle_lock(pdir, backend):
+        old_meta = backend.read_meta(pdir)
+        # 기존 환자는 record가 저널 줄(SQLite는 같은 트랜잭션)에 버전을 올림
+        for kind, frame in frames.items():
+            if old_meta is None:
+                backend.write_frame(pdir, kind, frame)
+            else:
+                backend.record(pdir, kind, added=frame)
+        meta = dict(old_meta or {"sex": None, "dob": None, "current_age": None, "name": None})
+        meta.update(meta_update)
+        if old_meta is None:
+            backend.write_meta(pdir, meta)
+            backend.bump_version(pdir)
+        else:
+            backend.update_meta(pdir, meta)
+    return sum(len(f) for f in frames.values())
+
+def finalize_patient(pdir: Path, backend) -> dict:
+    """저널을 스냅샷으로 압축하고 색인 항목 반환 (환자 ID는 폴더 이름)"""
+    with bundle_lock(pdir, backend):
+        frames = compact_journal(pdir, backend) or load_frames(pdir, backend)
+        return summarize_bundle(pdir.name, backend.read_meta(pdir), frames)
+
+def _report(msg: str) -> None:
+    print(msg, file=sys.stderr, flush=True)
+
+def bulk_import(path: Path, root: Path, backend_name: Optional[str] = None, id_col: str = "patient_id",
+                chunksize: int = DEFAULT_CHUNKSIZE, workers: int = 4, rejects_path: Optional[Path] = None,
+                flush_rows: int = DEFAULT_FLUSH_ROWS, progress=_report) -> dict:
+    """
+    내보내기 파일 하나를 청크 단위로 읽어 환자별 번들에 추가.
+    반환: {"rows", "accepted", "rejected", "patients"}
+    """
+    backend = get_backend(backend_name)
+    root.mkdir(parents=True, exist_ok=True)
+    rejects_path = rejects_path or path.with_name(f"{path.stem}_rejects.csv")
+    rejects_path.unlink(missing_ok=True)
+    touched = set()
+    stats = {"rows": 0, "accepted": 0, "rejected": 0, "patients": 0}
+    t0 = time.monotonic()
+    buffer, buffered = [], 0
+
+    def flush(pool):
+        nonlocal buffer, buffered
+        if not buffer:
+            return
+        batch = pd.concat(buffer, ignore_index=True)
+        buffer, buffered = [], 0
+        by_kind = split_by_kind(batch)
+        metas = meta_updates(batch)
+        pids = batch["patient_id"].unique().tolist()
+        jobs = [(pid, {k: f[pid] for k, f in by_kind.items() if pid in f}, metas.get(pid, {})) for pid in pids]
+        for _ in pool.map(lambda j: write_patient(root / j[0], j[1], j[2], backend), jobs):
+            pass
+        touched.update(pids)
+        progress(f"  -> 환자 {len(pids):,}명 기록 ({time.monotonic() - t0:.1f}s)")
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for i, chunk in enumerate(iter_chunks(path, chunksize)):
+            accepted, rejects = normalize_chunk(chunk, id_col)
+            if not rejects.empty:
+                rejects.to_csv(rejects_path, mode="a", index=False, header=not rejects_path.exists())
+            buffer.append(accepted)
+            buffered += len(accepted)
+            stats["rows"] += len(chunk)
+            stats["accepted"] += len(accepted)
+            stats["rejected"] += len(rejects)
+            progress(f"[chunk {i + 1}] rows={stats['rows']:,} accepted={stats['accepted']:,} "
+                     f"rejected={stats['rejected']:,} ({time.monotonic() - t0:.1f}s)")
+            # 메모리 상한: 모인 행이 flush_rows를 넘으면 환자별로 기록
+            if buffered >= flush_rows:
+                flush(pool)
+        flush(pool)
+
+        summaries = list(pool.map(lambda pid: finalize_patient(root / pid, backend), sorted(touched)))
+
+        # 색인은 가져온 환자만 교체해 한 번에 기록
+        with file_lock(root / INDEX_LOCK_FILE) if backend.uses_file_lock else nullcontext():
+            index = backend.read_index(root)
+            if index is None:
+                # 색인이 없으면 이번에 가져오지 않은 기존 환자만 한 번 요약
+                others = [pid for pid in backend.list_ids(root) if pid not in touched]
+                index = pd.DataFrame(list(pool.map(lambda pid: finalize_patient(root / pid, backend), others)),
+                                     columns=INDEX_COLUMNS)
+            index = index[~index["patient_id"].isin(touched)]
+            backend.write_index(root, pd.concat([index, pd.DataFrame(summaries, columns=INDEX_COLUMNS)],
+                                                ignore_index=True))
+    stats["patients"] = len(touched)
+    progress(f"완료: {stats['accepted']:,}행 / 환자 {stats['patients']:,}명, 거부 {stats['rejected']:,}행"
+             + (f" -> {rejects_path}" if stats["rejected"] else "") + f" ({time.monotonic() - t0:.1f}s)")
+    return stats
+
+# =========================
+#  내보내기 (long format)
+# =========================
+EXPORT_COLUMNS = ["patient_id", "sex", "dob", "date", "age", "kind", "eye", "measure", "value", "remarks"]
+DEFAULT_EXPORT_BATCH = 256
+
+def patient_long_arrays(root: Path, pid: str, backend) -> Optional[dict]:
+    """
+    환자 한 명의 모든 모달리티를 long format 컬럼 배열로 (값이 있는 칸만).
+    DataFrame은 배치 단위로 한 번만 만들도록 numpy 배열 dict를 반환합니다.
+    """
+    pdir = root / pid
+    with bundle_lock(pdir, backend, shared=True):
+        frames = load_frames(pdir, backend)
+        meta = backend.read_meta(pdir) or {}
+    cols = {c: [] for c in ("date", "kind", "eye", "measure", "value", "remarks")}
+    for kind, df in frames.items():
+        if df is None or df.empty:
+            continue
+        value_cols = value_columns(kind)
+        values = df[value_cols].to_numpy(dtype="float64")
+        r, c = np.nonzero(~np.isnan(values))
+        if not len(r):
+            continue
+        names = np.array(value_cols, dtype=object)[c]
+        remarks = np.array([remarks_to_str(x) for x in df["remarks"]], dtype=object)
+        cols["date"].append(df["date"].to_numpy(dtype="datetime64[ns]")[r])
+        cols["kind"].append(np.full(len(r), kind, dtype=object))
+        cols["eye"].append(np.array([n[:2] for n in names], dtype=object))
+        cols["measure"].append(np.array([n[3:] for n in names], dtype=object))
+        cols["value"].append(values[r, c])
+        cols["remarks"].append(remarks[r])
+    if not cols["date"]:
+        return None
+    out = {k: np.concatenate(v) for k, v in cols.items()}
+    n = len(out["date"])
+    dob = pd.to_datetime(meta.get("dob"), errors="coerce")
+    out["patient_id"] = np.full(n, pid, dtype=object)
+    out["sex"] = np.full(n, meta.get("sex"), dtype=object)
+    out["dob"] = np.full(n, np.datetime64(dob, "ns") if pd.notna(dob) else np.datetime64("NaT", "ns"))
+    # _years_between과 같은 기준 (일수 / 365.25)
+    delta = out["date"] - out["dob"]
+    out["age"] = np.where(np.isnat(delta), np.nan, delta.astype("timedelta64[D]").astype("float64") / 365.25)
+    return out
+
+def _batch_frame(parts: List[dict]) -> pd.DataFrame:
+    return pd.DataFrame({c: np.concatenate([p[c] for p in parts]) for c in EXPORT_COLUMNS}, columns=EXPORT_COLUMNS)
+
+def _export_schema():
+    return pa.schema([
+        ("patient_id", pa.string()), ("sex", pa.string()), ("dob", pa.timestamp("ns")),
+        ("date", pa.timestamp("ns")), ("age", pa.float64()), ("kind", pa.string()), ("eye", pa.string()),
+        ("measure", pa.string()), ("value", pa.float64()), ("remarks", pa.string()),
+    ])
+
+def bulk_export(out_path: Path, root: Path, backend_name: Optional[str] = None, workers: int = 4,
+                batch_size: int = DEFAULT_EXPORT_BATCH, progress=_report) -> dict:
+    """
+    모든 환자 번들을 한 파일(.parquet 또는 .csv)로 내보내기.
+    환자 batch_size명씩 병렬로 읽어 바로 기록하므로 메모리는 배치 크기만큼만 사용합니다.
+    반환: {"patients", "rows"}
+    """
+    backend = get_backend(backend_name)
+    as_parquet = out_path.suffix.lower() == ".parquet"
+    if as_parquet and not _HAS_PYARROW:
+        raise RuntimeError("Parquet로 내보내려면 pyarrow가 필요합니다 (또는 .csv 경로 지정)")
+    pids = backend.list_ids(root)
+    stats = {"patients": 0, "rows": 0}
+    t0 = time.monotonic()
+    out_path.unlink(missing_ok=True)
+    writer = pq.ParquetWriter(out_path, _export_schema()) if as_parquet else None
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for start in range(0, len(pids), batch_size):
+                batch = pids[start:start + batch_size]
+                parts = [p for p in pool.map(lambda pid: patient_long_arrays(root, pid, backend), batch) if p]
+                if parts:
+                    df = _batch_frame(parts)
+                    if writer is not None:
+                        writer.write_table(pa.Table.from_pandas(df, schema=_export_schema(), preserve_index=False))
+                    else:
+                        df.to_csv(out_path, mode="a", index=False, header=stats["rows"] == 0,
+                                  date_format="%Y-%m-%d")
+                    stats["rows"] += len(df)
+                stats["patients"] += len(batch)
+                progress(f"[export] patients={stats['patients']:,}/{len(pids):,} rows={stats['rows']:,} "
+                         f"({time.monotonic() - t0:.1f}s)")
+    finally:
+        if writer is not None:
+            writer.close()
+    progress(f"완료: 환자 {stats['patients']:,}명, {stats['rows']:,}행 -> {out_path} ({time.monotonic() - t0:.1f}s)")
+    return stats
+
+# =========================
+#  20세 예측 리포트
+# =========================
+PREDICT_GROUP_COLUMNS = ["patient_id", "sex", "kind", "eye", "measure"]
+
+def bulk_predict(out_path: Path, root: Path, backend_name: Optional[str] = None, workers: int = 4,
+                 batch_size: int = DEFAULT_EXPORT_BATCH, measures: Optional[List[str]] = None,
+                 mode: str = "recommend", target_age: float = TARGET_AGE, progress=_report) -> dict:
+    """
+    모든 환자의 (모달리티, 눈, 측정값)별 20세 예측을 CSV로. 환자 batch_size명씩 long format으로 읽어
+    배치마다 batch_predict 한 번으로 적합합니다. measures 기본값은 안축장(mm)과 등가구면(SE).
+    반환: {"patients", "groups"}
+    """
+    backend = get_backend(backend_name)
+    measures = measures or ["mm", "SE"]
+    pids = backend.list_ids(root)
+    stats = {"patients": 0, "groups": 0}
+    t0 = time.monotonic()
+    out_path.unlink(missing_ok=True)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for start in range(0, len(pids), batch_size):
+            batch = pids[start:start + batch_size]
+            parts = [p for p in pool.map(lambda pid: patient_long_arrays(root, pid, backend), batch) if p]
+            if parts:
+                df = _batch_frame(parts)
+                df = df[df["measure"].isin(measures)]
+                report = batch_predict(df, mode=mode, target_age=target_age, group_cols=PREDICT_GROUP_COLUMNS)
+                report.to_csv(out_path, mode="a", index=False, header=stats["groups"] == 0)
+                stats["groups"] += len(report)
+            stats["patients"] += len(batch)
+            progress(f"[predict] patients={stats['patients']:,}/{len(pids):,} groups={stats['groups']:,} "
+                     f"({time.monotonic() - t0:.1f}s)")
+    progress(f"완료: 환자 {stats['patients']:,}명, {stats['groups']:,}그룹 -> {out_path} ({time.monotonic() - t0:.1f}s)")
+    return stats
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="환자 번들 일괄 가져오기/내보내기")
+    ap.add_argument("--root", type=Path, default=Path("./axl_data"), help="데이터 루트 (기본: ./axl_data)")
+    ap.add_argument("--backend", choices=["csv", "parquet", "sqlite"], default=None,
+                    help="저장 형식 (기본: AXL_STORAGE_BACKEND 또는 parquet)")
+    ap.add_argument("--workers", type=int, default=4)
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    ap_in = sub.add_parser("import", help="검사 내보내기 CSV/Excel을 환자 번들로 가져오기")
+    ap_in.add_argument("input", type=Path)
+    ap_in.add_argument("--id-col", default="patient_id")
+    ap_in.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+    ap_in.add_argument("--flush-rows", type=int, default=DEFAULT_FLUSH_ROWS,
+                       help="이만큼 행이 모이면 환자별로 기록 (메모리 상한)")
+    ap_in.add_argument("--rejects", type=Path, default=None, help="거부 행 CSV (기본: <입력>_rejects.csv)")
+
+    ap_out = sub.add_parser("export", help="모든 환자를 long format 데이터셋(.parquet/.csv)으로 내보내기")
+    ap_out.add_argument("output", type=Path)
+    ap_out.add_argument("--batch-size", type=int, default=DEFAULT_EXPORT_BATCH,
+                        help="한 번에 읽어 기록할 환자 수 (메모리 상한)")
+
+    ap_pred = sub.add_parser("predict", help="모든 환자의 20세 예측치를 CSV로 (환자 x 눈 x 측정값)")
+    ap_pred.add_argument("output", type=Path)
+    ap_pred.add_argument("--measure", nargs="+", default=["mm", "SE"], help="측정값 (기본: mm SE)")
+    ap_pred.add_argument("--mode", choices=PREDICT_MODES, default="recommend")
+    ap_pred.add_argument("--target-age", type=float, default=TARGET_AGE)
+    ap_pred.add_argument("--batch-size", type=int, default=DEFAULT_EXPORT_BATCH)
+
+    args = ap.parse_args(argv)
+    if args.command == "import":
+        bulk_import(args.input, args.root, args.backend, args.id_col, args.chunksize, args.workers, args.rejects,
+                    args.flush_rows)
+    elif args.command == "predict":
+        bulk_predict(args.output, args.root, args.backend, args.workers, args.batch_size, args.measure,
+                     args.mode, args.target_age)
+    else:
+        bulk_export(args.output, args.root, args.backend, args.workers, args.batch_size)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
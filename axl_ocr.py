@@ -0,0 +1,1443 @@
+# -*- coding: utf-8 -*-
+"""
+안축장도/자동굴절계 인쇄물 OCR (여러 장을 프로세스 풀로 일괄 처리)
+"""
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import re
+import shlex
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import date
+from pathlib import Path
+from typing import Callable, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
+import pytesseract
+from PIL import Image
+
+from axl_storage import atomic_write
+
+# 선택: tesserocr가 있으면 프로세스 안에 모델을 올려 두고 재사용
+try:
+    import tesserocr
+    _HAS_TESSEROCR = True
+except ImportError:
+    tesserocr = None
+    _HAS_TESSEROCR = False
+
+# 선택: PDF 텍스트 레이어(pypdf), 페이지 래스터화(pypdfium2)
+try:
+    from pypdf import PdfReader
+    _HAS_PYPDF = True
+except ImportError:
+    PdfReader = None
+    _HAS_PYPDF = False
+
+try:
+    import pypdfium2 as pdfium
+    _HAS_PDFIUM = True
+except ImportError:
+    pdfium = None
+    _HAS_PDFIUM = False
+
+IMAGE_SUFFIXES = (".png", ".jpg", ".jpeg")
+# 일괄 OCR 폴더에서 읽는 확장자 (PDF 보고서 포함)
+DOCUMENT_SUFFIXES = IMAGE_SUFFIXES + (".pdf",)
+OCR_LANG = "eng"
+# 일괄 OCR에서 한 번에 tesseract로 넘기는 최대 장 수
+BATCH_CHUNK = 16
+# 일괄 OCR 검토표에서 기본 선택(추가)할 최소 신뢰도
+MIN_CONFIDENCE = 0.6
+
+# =========================
+#  OCR 전처리 (해상도 정규화, 기울기 보정, 적응형 이진화, 글자 영역 자르기)
+# =========================
+# 키를 빼거나 None/False로 두면 해당 단계를 건너뜁니다. OCR 캐시 키에 포함됩니다.
+PREPROCESS_DEFAULTS = {
+    "target_dpi": 300,        # 파일에 DPI 정보가 있으면 이 해상도로 맞춤
+    "max_side": 2400,         # DPI 정보가 없는 경우(휴대폰 사진 등) 긴 변 상한 (px)
+    "deskew": True,           # ±MAX_SKEW_DEG 범위 기울기 보정
+    "threshold": "adaptive",  # "adaptive" | "otsu" | None
+    "crop_text": False,       # 글자가 있는 영역 경계로 자르기
+}
+# 템플릿 영역(이미 잘라 확대한 작은 이미지)은 이진화만
+ROI_PREPROCESS = {"threshold": "adaptive"}
+MAX_SKEW_DEG = 5.0
+
+def _target_scale(img: Image.Image, target_dpi: Optional[int], max_side: Optional[int]) -> float:
+    scale = 1.0
+    dpi = img.info.get("dpi")
+    if target_dpi and dpi and dpi[0] and dpi[0] > 1:
+        # 저해상도 스캔은 최대 2배까지만 확대
+        scale = min(target_dpi / float(dpi[0]), 2.0)
+    if max_side and max(img.size) * scale > max_side:
+        scale = max_side / float(max(img.size))
+    return scale
+
+def otsu_level(arr: np.ndarray) -> int:
+    hist = np.bincount(arr.ravel(), minlength=256).astype(np.float64)
+    w0 = np.cumsum(hist)
+    m0 = np.cumsum(hist * np.arange(256))
+    w1 = w0[-1] - w0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        between = (m0[-1] * w0 - m0 * w0[-1]) ** 2 / (w0 * w1)
+    return int(np.nanargmax(between[:-1]))
+
+def adaptive_threshold(arr: np.ndarray, block: Optional[int] = None, t: float = 0.15) -> np.ndarray:
+    """
+    적분 영상으로 구한 주변 평균보다 t 이상 어두우면 글자(0) (Bradley-Roth).
+    조명이 고르지 않은 휴대폰 사진에서 전역 임계값보다 안정적입니다.
+    """
+    h, w = arr.shape
+    block = block or max(15, (min(h, w) // 16) | 1)
+    r = block // 2
+    ii = np.zeros((h + 1, w + 1), dtype=np.float64)
+    ii[1:, 1:] = arr.cumsum(axis=0, dtype=np.float64).cumsum(axis=1)
+    y0, y1 = np.clip(np.arange(h) - r, 0, h), np.clip(np.arange(h) + r + 1, 0, h)
+    x0, x1 = np.clip(np.arange(w) - r, 0, w), np.clip(np.arange(w) + r + 1, 0, w)
+    band = ii[y1] - ii[y0]
+    total = band[:, x1] - band[:, x0]
+    area = np.outer(y1 - y0, x1 - x0)
+    return np.where(arr * area <= total * (1.0 - t), 0, 255).astype(np.uint8)
+
+def estimate_skew(img: Image.Image) -> float:
+    """행 투영 분산이 가장 큰 회전각 (도). 축소·이진화한 사본으로 거친 탐색 후 0.1도 단위로 세분"""
+    small = img.copy()
+    small.thumbnail((1000, 1000))
+    # 조명 그라데이션이 행 투영을 지배하지 않도록 적응형 이진화로 글자만 남김
+    ink = Image.fromarray(255 - adaptive_threshold(np.asarray(small)))
+
+    def score(angle: float) -> float:
+        rows = np.asarray(ink.rotate(angle, resample=Image.NEAREST, fillcolor=0)).sum(axis=1, dtype=np.float64)
+        return float(np.var(rows))
+
+    best = max(np.arange(-MAX_SKEW_DEG, MAX_SKEW_DEG + 1e-9, 0.5), key=score)
+    return float(max(np.arange(best - 0.4, best + 0.41, 0.1), key=score))
+
+def crop_to_text(arr: np.ndarray, margin: int = 20, ink: Optional[np.ndarray] = None) -> np.ndarray:
+    """글자 픽셀(기본: 이진화 영상의 검은 픽셀)이 있는 행/열의 경계 상자로 자르기"""
+    ink = arr < 128 if ink is None else ink
+    rows = np.flatnonzero(ink.sum(axis=1) >= max(2, arr.shape[1] // 500))
+    cols = np.flatnonzero(ink.sum(axis=0) >= max(2, arr.shape[0] // 500))
+    if not len(rows) or not len(cols):
+        return arr
+    return arr[max(rows[0] - margin, 0):rows[-1] + margin + 1, max(cols[0] - margin, 0):cols[-1] + margin + 1]
+
+def preprocess_image(img: Image.Image, options: Optional[dict] = None) -> Image.Image:
+    """회색조 이미지에 PREPROCESS_DEFAULTS 형식의 전처리를 순서대로 적용"""
+    opts = PREPROCESS_DEFAULTS if options is None else options
+    scale = _target_scale(img, opts.get("target_dpi"), opts.get("max_side"))
+    if abs(scale - 1.0) > 0.02:
+        size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+        img = img.resize(size, Image.LANCZOS, reducing_gap=2.0 if scale < 1 else None)
+    if opts.get("deskew"):
+        angle = estimate_skew(img)
+        if abs(angle) >= 0.1:
+            img = img.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+    method = opts.get("threshold")
+    if not method and not opts.get("crop_text"):
+        return img
+    arr = np.asarray(img)
+    if method == "adaptive":
+        arr = adaptive_threshold(arr)
+    elif method == "otsu":
+        arr = np.where(arr < otsu_level(arr), 0, 255).astype(np.uint8)
+    if opts.get("crop_text"):
+        arr = crop_to_text(arr, ink=None if method else arr < otsu_level(arr))
+    return Image.fromarray(arr)
+
+def load_ocr_image(source: Union[bytes, str, Path], preprocess: Optional[dict] = None) -> Image.Image:
+    """회색조로 열고 전처리. JPEG은 draft로 필요한 해상도 근처까지만 디코딩 (12MP 사진 대비)"""
+    img = Image.open(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
+    opts = PREPROCESS_DEFAULTS if preprocess is None else preprocess
+    if img.format == "JPEG":
+        scale = _target_scale(img, opts.get("target_dpi"), opts.get("max_side"))
+        if scale < 1.0:
+            img.draft("L", (int(img.width * scale), int(img.height * scale)))
+    return preprocess_image(img.convert("L"), opts)
+
+# =========================
+#  OCR 엔진 (tesserocr 상주 API / tesseract CLI)
+# =========================
+# image_to_data 결과 형식은 pytesseract Output.DICT와 같게 맞춥니다.
+_TSV_INT_COLUMNS = ("level", "page_num", "block_num", "par_num", "line_num", "word_num",
+                    "left", "top", "width", "height")
+
+def parse_tsv(tsv: str) -> List[dict]:
+    """tesseract TSV 출력 -> 페이지별 image_to_data 딕셔너리 목록 (page_num 순)"""
+    lines = tsv.splitlines()
+    if not lines:
+        return []
+    header = lines[0].split("\t")
+    pages: dict = {}
+    for line in lines[1:]:
+        cells = line.split("\t")
+        if len(cells) < len(header):
+            cells += [""] * (len(header) - len(cells))
+        row = dict(zip(header, cells))
+        page = pages.setdefault(int(row["page_num"]), {k: [] for k in header})
+        for k in header:
+            v = row[k]
+            page[k].append(int(v) if k in _TSV_INT_COLUMNS else float(v) if k == "conf" else v)
+    return [pages[k] for k in sorted(pages)]
+
+def _empty_data() -> dict:
+    return {k: [] for k in _TSV_INT_COLUMNS + ("conf", "text")}
+
+class OcrEngine:
+    """OCR 엔진 공통 인터페이스. 파서는 image_to_string / image_to_data 결과만 사용합니다."""
+    name = "base"
+    # True면 여러 장을 한 번의 호출로 처리 (batch_image_to_data)
+    supports_batch = False
+
+    def image_to_string(self, img: Image.Image, lang: str = OCR_LANG, config: str = "") -> str:
+        raise NotImplementedError
+
+    def image_to_data(self, img: Image.Image, lang: str = OCR_LANG, config: str = "") -> dict:
+        raise NotImplementedError
+
+    def batch_image_to_data(self, images: List[Image.Image], lang: str = OCR_LANG, config: str = "") -> List[dict]:
+        return [self.image_to_data(img, lang, config) for img in images]
+
+class CliEngine(OcrEngine):
+    """
+    tesseract 실행 파일. 한 장씩은 pytesseract(호출마다 프로세스 생성),
+    여러 장은 목록 파일 한 번으로 처리해 프로세스 생성과 모델 로드를 한 번만 합니다.
+    """
+    name = "cli"
+    supports_batch = True
+
+    def image_to_string(self, img, lang=OCR_LANG, config=""):
+        return pytesseract.image_to_string(img, lang=lang, config=config)
+
+    def image_to_data(self, img, lang=OCR_LANG, config=""):
+        return pytesseract.image_to_data(img, lang=lang, config=config, output_type=pytesseract.Output.DICT)
+
+    def batch_image_to_data(self, images, lang=OCR_LANG, config=""):
+        if len(images) < 2:
+            return [self.image_to_data(img, lang, config) for img in images]
+        with tempfile.TemporaryDirectory(prefix="axl_ocr_") as tmp:
+            paths = []
+            for i, img in enumerate(images):
+                paths.append(os.path.join(tmp, f"{i:05d}.png"))
+                img.save(paths[-1])
+            list_file = os.path.join(tmp, "images.txt")
+            with open(list_file, "w", encoding="utf-8") as f:
+                f.write("\n".join(paths) + "\n")
+            cmd = [pytesseract.pytesseract.tesseract_cmd, list_file, "stdout", "-l", lang, *shlex.split(config), "tsv"]
+            proc = subprocess.run(cmd, capture_output=True)
+        if proc.returncode != 0:
+            raise pytesseract.TesseractError(proc.returncode, proc.stderr.decode("utf-8", "replace"))
+        pages = parse_tsv(proc.stdout.decode("utf-8", "replace"))
+        # 글자가 없는 페이지도 자리를 지키도록 page_num(1부터) 기준으로 배치
+        out = [_empty_data() for _ in images]
+        for page in pages:
+            n = page["page_num"][0] - 1 if page["page_num"] else -1
+            if 0 <= n < len(out):
+                out[n] = page
+        return out
+
+class TesserocrEngine(OcrEngine):
+    """
+    tesserocr 상주 API. (스레드, 언어, 설정)마다 PyTessBaseAPI를 한 번만 만들고 재사용합니다.
+    API 객체는 스레드 안전하지 않으므로 스레드별로 둡니다.
+    """
+    name = "tesserocr"
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _api(self, lang: str, config: str):
+        apis = getattr(self._local, "apis", None)
+        if apis is None:
+            apis = self._local.apis = {}
+        api = apis.get((lang, config))
+        if api is None:
+            args = shlex.split(config)
+            psm = tesserocr.PSM.AUTO
+            api_vars = {}
+            for i, arg in enumerate(args):
+                if arg == "--psm":
+                    psm = int(args[i + 1])
+                elif arg == "-c":
+                    k, _, v = args[i + 1].partition("=")
+                    api_vars[k] = v
+            api = tesserocr.PyTessBaseAPI(lang=lang, psm=psm)
+            for k, v in api_vars.items():
+                api.SetVariable(k, v)
+            apis[(lang, config)] = api
+        return api
+
+    def image_to_string(self, img, lang=OCR_LANG, config=""):
+        api = self._api(lang, config)
+        api.SetImage(img)
+        return api.GetUTF8Text()
+
+    def image_to_data(self, img, lang=OCR_LANG, config=""):
+        api = self._api(lang, config)
+        api.SetImage(img)
+        pages = parse_tsv("\t".join(("level",) + _TSV_INT_COLUMNS[1:] + ("conf", "text")) + "\n" + api.GetTSVText(0))
+        return pages[0] if pages else _empty_data()
+
+OCR_ENGINES = {"cli": CliEngine, "tesserocr": TesserocrEngine}
+_ENGINE_CACHE: dict = {}
+
+def get_engine(name: Optional[str] = None) -> OcrEngine:
+    """AXL_OCR_ENGINE(cli/tesserocr) 또는 tesserocr가 설치되어 있으면 tesserocr, 없으면 cli"""
+    name = (name or os.environ.get("AXL_OCR_ENGINE") or ("tesserocr" if _HAS_TESSEROCR else "cli")).lower()
+    if name not in OCR_ENGINES:
+        raise ValueError(f"지원하지 않는 OCR 엔진: {name}")
+    if name == "tesserocr" and not _HAS_TESSEROCR:
+        raise RuntimeError("tesserocr 엔진을 사용하려면 tesserocr를 설치해야 합니다.")
+    if name not in _ENGINE_CACHE:
+        _ENGINE_CACHE[name] = OCR_ENGINES[name]()
+    return _ENGINE_CACHE[name]
+
+# =========================
+#  OCR 결과 캐시 (이미지 내용 해시 + OCR 파라미터)
+# =========================
+OCR_CACHE_SIZE = 128
+# 설정하면 메모리 캐시 외에 디스크에도 결과를 보관 (프로세스/재시작 간 공유)
+OCR_CACHE_DIR_ENV = "AXL_OCR_CACHE_DIR"
+
+def _read_bytes(source: Union[bytes, str, Path]) -> bytes:
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if hasattr(source, "getvalue"):  # Streamlit UploadedFile / BytesIO
+        return source.getvalue()
+    return Path(source).read_bytes()
+
+def ocr_cache_key(image_bytes: bytes, **params) -> str:
+    """이미지 바이트의 SHA-256에 OCR 파라미터를 더한 캐시 키"""
+    h = hashlib.sha256(image_bytes)
+    h.update(json.dumps(params, sort_keys=True, default=str).encode("utf-8"))
+    return h.hexdigest()
+
+class OcrCache:
+    """
+    LRU 메모리 캐시 + 선택적 디스크 캐시(<키>.json).
+    Streamlit 재실행이나 같은 인쇄물 재업로드 시 tesseract를 다시 돌리지 않기 위함입니다.
+    """
+    def __init__(self, maxsize: int = OCR_CACHE_SIZE, cache_dir: Optional[Union[str, Path]] = None):
+        self.maxsize = maxsize
+        self.cache_dir = Path(cache_dir).expanduser() if cache_dir else None
+        self._items: "OrderedDict[str, object]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _disk_path(self, key: str) -> Optional[Path]:
+        return self.cache_dir / f"{key}.json" if self.cache_dir else None
+
+    def get(self, key: str):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+        f = self._disk_path(key)
+        if f is None or not f.exists():
+            return None
+        try:
+            value = json.loads(f.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        self._remember(key, value)
+        return value
+
+    def put(self, key: str, value) -> None:
+        self._remember(key, value)
+        f = self._disk_path(key)
+        if f is None:
+            return
+        try:
+            f.parent.mkdir(parents=True, exist_ok=True)
+            def _dump(tmp: Path):
+                tmp.write_text(json.dumps(value, ensure_ascii=False), encoding="utf-8")
+            atomic_write(f, _dump)
+        except OSError:
+            pass  # 디스크 캐시는 최선 노력
+
+    def _remember(self, key: str, value) -> None:
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+OCR_CACHE = OcrCache(cache_dir=os.environ.get(OCR_CACHE_DIR_ENV))
+
+def _ocr_key(image_bytes: bytes, op: str, lang: str, config: str, preprocess: dict) -> str:
+    return ocr_cache_key(image_bytes, op=op, lang=lang, config=config, preprocess=preprocess, engine=get_engine().name)
+
+def ocr_image_text(source, lang: str = OCR_LANG, config: str = "", preprocess: Optional[dict] = None) -> str:
+    """image_to_string 결과 (캐시 사용)"""
+    image_bytes = _read_bytes(source)
+    preprocess = PREPROCESS_DEFAULTS if preprocess is None else preprocess
+    key = _ocr_key(image_bytes, "string", lang, config, preprocess)
+    text = OCR_CACHE.get(key)
+    if text is None:
+        text = get_engine().image_to_string(load_ocr_image(image_bytes, preprocess), lang=lang, config=config)
+        OCR_CACHE.put(key, text)
+    return text
+
+def ocr_image_data(source, lang: str = OCR_LANG, config: str = "", preprocess: Optional[dict] = None) -> dict:
+    """image_to_data(DICT) 결과 (캐시 사용)"""
+    image_bytes = _read_bytes(source)
+    preprocess = PREPROCESS_DEFAULTS if preprocess is None else preprocess
+    key = _ocr_key(image_bytes, "data", lang, config, preprocess)
+    data = OCR_CACHE.get(key)
+    if data is None:
+        data = get_engine().image_to_data(load_ocr_image(image_bytes, preprocess), lang=lang, config=config)
+        OCR_CACHE.put(key, data)
+    return data
+
+# =========================
+#  안축장도 이미지 OCR 함수
+# =========================
+def parse_axl_image_ocr(ocr_text: str) -> tuple:
+    """
+    안축장도 이미지의 OCR 텍스트에서 OD, OS AL 값을 추출합니다.
+    
+    Args:
+        ocr_text: OCR로 추출된 텍스트
+    
+    Returns:
+        tuple: (od_al_mm, os_al_mm, success) - 우안 AL, 좌안 AL, 성공 여부
+    """
+    try:
+        # OCR 텍스트 전처리
+        text = ocr_text.replace("\r", "").replace("\t", " ")
+        text = text.translate(str.maketrans({"−": "-", "–": "-", "—": "-", "‑": "-"}))
+        
+        od_al = None
+        os_al = None
+        
+        # 방법 1: 좌우 분할 방식 (이미지가 좌우로 나뉘어 있는 경우)
+        lines = text.split('\n')
+        
+        # 각 라인에서 OD와 OS 영역을 좌우로 구분
+        od_candidates = []
+        os_candidates = []
+        
+        for line in lines:
+            line = line.strip()
+            if not line or len(line) < 10:  # 너무 짧은 라인 제외
+                continue
+            
+            # AL이 포함된 라인만 처리
+            if 'AL' in line.upper():
+                # 라인을 중간 지점으로 나누어 좌우 구분
+                mid_point = len(line) // 2
+                left_part = line[:mid_point]
+                right_part = line[mid_point:]
+                
+                # 좌측(OD)에서 AL 값 찾기
+                od_matches = re.findall(r'(\d{1,2}\.\d{2})\s*mm', left_part, re.IGNORECASE)
+                for match in od_matches:
+                    val = float(match)
+                    if 15.0 <= val <= 35.0:
+                        od_candidates.append(val)
+                
+                # 우측(OS)에서 AL 값 찾기
+                os_matches = re.findall(r'(\d{1,2}\.\d{2})\s*mm', right_part, re.IGNORECASE)
+                for match in os_matches:
+                    val = float(match)
+                    if 15.0 <= val <= 35.0:
+                        os_candidates.append(val)
+        
+        # 가장 적절한 값 선택 (첫 번째 값 우선)
+        if od_candidates:
+            od_al = od_candidates[0]
+        if os_candidates:
+            os_al = os_candidates[0]
+        
+        # 방법 2: 텍스트 블록 기반 분석 (OD, OS 키워드로 구분)
+        if od_al is None or os_al is None:
+            od_section = []
+            os_section = []
+            current_section = None
+            
+            for line in lines:
+                line = line.strip()
+                if not line:
+                    continue
+                    
+                # OD 섹션 감지 (더 엄격한 패턴)
+                if re.search(r'\bOD\b.*right', line, re.IGNORECASE) or re.search(r'^\s*OD\s*$', line, re.IGNORECASE):
+                    current_section = 'OD'
+                    od_section.append(line)
+                # OS 섹션 감지 (더 엄격한 패턴)
+                elif re.search(r'\bOS\b.*left', line, re.IGNORECASE) or re.search(r'^\s*OS\s*$', line, re.IGNORECASE):
+                    current_section = 'OS'
+                    os_section.append(line)
+                # 현재 섹션에 라인 추가 (단, AL이 포함된 라인만)
+                elif current_section == 'OD' and 'AL' in line.upper():
+                    od_section.append(line)
+                elif current_section == 'OS' and 'AL' in line.upper():
+                    os_section.append(line)
+            
+            # OD 섹션에서 AL 값 추출
+            if od_section and od_al is None:
+                for line in od_section:
+                    al_matches = re.findall(r'(\d{1,2}\.\d{2})\s*mm', line, re.IGNORECASE)
+                    for match in al_matches:
+                        val = float(match)
+                        if 15.0 <= val <= 35.0:
+                            od_al = val
+                            break
+                    if od_al:
+                        break
+            
+            # OS 섹션에서 AL 값 추출
+            if os_section and os_al is None:
+                for line in os_section:
+                    al_matches = re.findall(r'(\d{1,2}\.\d{2})\s*mm', line, re.IGNORECASE)
+                    for match in al_matches:
+                        val = float(match)
+                        if 15.0 <= val <= 35.0:
+                            os_al = val
+                            break
+                    if os_al:
+                        break
+        
+        # 방법 3: 모든 AL 값을 위치순으로 추출 (위치 기반)
+        if od_al is None or os_al is None:
+            all_al_positions = []
+            
+            # AL: XX.XX mm 패턴으로 모든 값과 위치 추출
+            for match in re.finditer(r'AL[:\s]*(\d{1,2}\.\d{2})\s*mm', text, re.IGNORECASE):
+                val = float(match.group(1))
+                if 15.0 <= val <= 35.0:
+                    all_al_positions.append((val, match.start()))
+            
+            # 일반 XX.XX mm 패턴으로 추가 추출 (AL 근처에 있는 것들)
+            if len(all_al_positions) < 2:
+                for line in lines:
+                    if 'AL' in line.upper():
+                        for match in re.finditer(r'(\d{1,2}\.\d{2})\s*mm', line, re.IGNORECASE):
+                            val = float(match.group(1))
+                            if 15.0 <= val <= 35.0:
+                                line_pos = text.find(line)
+                                if line_pos >= 0:
+                                    all_al_positions.append((val, line_pos + match.start()))
+            
+            # 중복 제거 및 위치순 정렬
+            unique_positions = []
+            for val, pos in all_al_positions:
+                if not any(abs(existing_pos - pos) < 50 and existing_val == val 
+                          for existing_val, existing_pos in unique_positions):
+                    unique_positions.append((val, pos))
+            
+            unique_positions.sort(key=lambda x: x[1])
+            
+            # 첫 번째는 OD, 두 번째는 OS로 할당
+            if len(unique_positions) >= 2:
+                if od_al is None:
+                    od_al = unique_positions[0][0]
+                if os_al is None:
+                    os_al = unique_positions[1][0]
+            elif len(unique_positions) == 1 and od_al is None:
+                od_al = unique_positions[0][0]
+        
+        # 방법 4: 특정 패턴으로 직접 매칭
+        if od_al is None or os_al is None:
+            # 23.70과 24.09 같은 특정 값들을 직접 찾기
+            specific_values = re.findall(r'(\d{2}\.\d{2})\s*mm', text, re.IGNORECASE)
+            valid_values = [float(v) for v in specific_values if 15.0 <= float(v) <= 35.0]
+            
+            # 중복 제거하면서 순서 유지
+            unique_values = []
+            for val in valid_values:
+                if val not in unique_values:
+                    unique_values.append(val)
+            
+            if len(unique_values) >= 2:
+                if od_al is None:
+                    od_al = unique_values[0]
+                if os_al is None:
+                    os_al = unique_values[1]
+            elif len(unique_values) == 1 and od_al is None:
+                od_al = unique_values[0]
+        
+        success = od_al is not None or os_al is not None
+        return (od_al, os_al, success)
+        
+    except Exception as e:
+        return (None, None, False)
+
+_AL_LABEL_RE = re.compile(r'^AL[:.]?$', re.IGNORECASE)
+# 단어 전체가 AL 값이어야 함: "23.45", "23.45mm", "AL:23.45" (123.45, +21.50, 21.50D 같은 IOL 도수는 제외)
+_AL_VALUE_RE = re.compile(r'^(?:AL[:=]?)?(\d{2}\.\d{2})(?:mm)?[,;]?$', re.IGNORECASE)
+_OD_RE = re.compile(r'^(OD|R|RIGHT)[:.]?$', re.IGNORECASE)
+_OS_RE = re.compile(r'^(OS|L|LEFT)[:.]?$', re.IGNORECASE)
+
+def _words(data: dict) -> List[dict]:
+    """image_to_data 결과에서 글자가 있는 단어 상자만 (중심 좌표 포함)"""
+    words = []
+    for i, text in enumerate(data.get("text", [])):
+        text = (text or "").strip()
+        if not text:
+            continue
+        left, top, width, height = (int(data[k][i]) for k in ("left", "top", "width", "height"))
+        words.append({"text": text, "left": left, "top": top, "width": width, "height": height,
+                      "cx": left + width / 2.0, "cy": top + height / 2.0, "conf": float(data["conf"][i])})
+    return words
+
+def _al_value(word: dict) -> Optional[float]:
+    m = _AL_VALUE_RE.search(word["text"])
+    if not m:
+        return None
+    val = float(m.group(1))
+    return val if 15.0 <= val <= 35.0 else None
+
+def _eye_assigner(words: List[dict]) -> Callable[[dict], str]:
+    """
+    단어 -> "od"/"os". 머리글 OD·OS가 모두 있으면 두 머리글이 좌우로 놓였으면 가운데로, 위아래로 놓였으면
+    아래 머리글의 윗변으로 나누고(각 구역은 머리글에서 아래로 이어짐), 없으면 글자 영역 가운데를 기준으로
+    왼쪽 OD, 오른쪽 OS.
+    """
+    od = next((w for w in words if _OD_RE.match(w["text"])), None)
+    os_ = next((w for w in words if _OS_RE.match(w["text"])), None)
+    if od is not None and os_ is not None:
+        if abs(od["cx"] - os_["cx"]) >= abs(od["cy"] - os_["cy"]):
+            mid, axis, od_first = (od["cx"] + os_["cx"]) / 2.0, "cx", od["cx"] < os_["cx"]
+        else:
+            od_first = od["cy"] < os_["cy"]
+            mid, axis = (os_ if od_first else od)["top"], "cy"
+        return lambda w: "od" if (w[axis] < mid) == od_first else "os"
+    mid = (min(w["left"] for w in words) + max(w["left"] + w["width"] for w in words)) / 2.0
+    return lambda w: "od" if w["cx"] < mid else "os"
+
+def parse_axl_boxes(data: dict) -> dict:
+    """
+    image_to_data 단어 상자로 AL 추출 -> {"od_al", "os_al", "od_conf", "os_conf", "success"}.
+    값은 "AL" 라벨과 가장 가까운(같은 줄 오른쪽 또는 바로 아래) 숫자를 택하고,
+    좌표로 OD/OS에 배정합니다 (_eye_assigner). 라벨이 없으면 mm 값의 위치만으로 배정합니다.
+    """
+    out = {"od_al": None, "os_al": None, "od_conf": None, "os_conf": None, "success": False}
+    words = _words(data)
+    if not words:
+        return out
+    eye_of = _eye_assigner(words)
+    values = [(w, v) for w in words for v in [_al_value(w)] if v is not None]
+    if not values:
+        return out
+
+    pairs = []  # (위에서부터 순서, 눈, 값 단어, 값)
+    labels = [w for w in words if _AL_LABEL_RE.match(w["text"]) or w["text"].upper().startswith("AL:")]
+    for label in labels:
+        h = max(label["height"], 1)
+        best, best_d = None, None
+        for w, v in values:
+            dy = abs(w["cy"] - label["cy"])
+            dx = w["left"] - (label["left"] + label["width"])
+            same_line = dy <= h and -h <= dx
+            below = 0 < w["cy"] - label["cy"] <= 2.5 * h and abs(w["left"] - label["left"]) <= 4 * h
+            if w is not label and not (same_line or below):
+                continue
+            d = 0.0 if w is label else (max(dx, 0) + 3 * dy)  # "AL:23.45" 처럼 붙은 경우는 거리 0
+            if best_d is None or d < best_d:
+                best, best_d = (w, v), d
+        if best is not None:
+            w, v = best
+            pairs.append((label["top"], eye_of(w), w, v))
+    if not pairs:
+        pairs = [(w["top"], eye_of(w), w, v) for w, v in values
+                 if "mm" in w["text"].lower() or any(
+                     n["text"].lower().startswith("mm") and abs(n["cy"] - w["cy"]) <= w["height"]
+                     and 0 <= n["left"] - (w["left"] + w["width"]) <= 2 * w["height"] for n in words)]
+    # 눈마다 가장 위의 값 (인쇄물에서 AL이 먼저 나오고 아래는 다른 계측값/평균)
+    for _, eye, w, v in sorted(pairs, key=lambda p: p[0]):
+        if out[f"{eye}_al"] is None:
+            out[f"{eye}_al"] = v
+            out[f"{eye}_conf"] = w["conf"] / 100.0 if w["conf"] >= 0 else None
+    out["success"] = out["od_al"] is not None or out["os_al"] is not None
+    return out
+
+# =========================
+#  자동굴절계 인쇄물 파서 (REF.DATA 블럭)
+# =========================
+_DASHES = str.maketrans({"−": "-", "–": "-", "—": "-", "‑": "-"})
+_REF_BLOCK_RE = re.compile(r'REF[.\s]?DATA(.*?)(KRT[.\s]?DATA|PD:|$)', re.S | re.I)
+# OCR이 <L>을 <b>로 읽는 경우가 많음
+_LEFT_MARK_FIX_RE = re.compile(r'<\s*b\b', re.I)
+_EYE_SECTION_RE = {
+    "R": re.compile(r'<R>(.*?)(?=<L>|S\.E\.|PD:|$)', re.S | re.I),
+    "L": re.compile(r'<L>(.*?)(?=S\.E\.|PD:|$)', re.S | re.I),
+}
+# S C A: 소수점이 빠진 3~4자리(-225 = -2.25) 또는 소수 둘째 자리까지
+_SCA_RE = re.compile(r'([+-]?\d{1,2}\.\d{2}|[+-]?\d{3,4})\s+([+-]?\d{1,2}\.\d{2}|[+-]?\d{3,4})\s+(\d{1,3})\b')
+_SKIP_LINE_RE = re.compile(r'\b(WD|PD|MM|AVE|ic|Ss)\b', re.I)
+_AVE_LINE_RE = re.compile(r'\bAVE\b', re.I)
+
+class Refraction(NamedTuple):
+    sph: float
+    cyl: float
+    axis: int
+
+    @property
+    def se(self) -> float:
+        return self.sph + self.cyl / 2.0
+
+@dataclass
+class RefractorReading:
+    """자동굴절계 인쇄물 한 장의 파싱 결과. od/os는 측정 순서대로의 후보, *_ave는 AVE 행"""
+    date: Optional[date] = None
+    od: List[Refraction] = field(default_factory=list)
+    os: List[Refraction] = field(default_factory=list)
+    od_ave: Optional[Refraction] = None
+    os_ave: Optional[Refraction] = None
+    # False면 REF.DATA 블럭을 못 찾아 전체 텍스트의 3-수치 행에서 추정한 값
+    from_ref_block: bool = True
+
+    @property
+    def od_final(self) -> Optional[Refraction]:
+        """대표값: AVE 행이 있으면 AVE, 없으면 마지막 측정치"""
+        return self.od_ave or (self.od[-1] if self.od else None)
+
+    @property
+    def os_final(self) -> Optional[Refraction]:
+        return self.os_ave or (self.os[-1] if self.os else None)
+
+    @property
+    def success(self) -> bool:
+        return bool(self.od or self.os or self.od_ave or self.os_ave)
+
+def _diopter(token: str) -> float:
+    """소수점이 빠진 토큰은 1/100 D 단위 (-050 = -0.50, -225 = -2.25)"""
+    val = float(token)
+    return val if "." in token else val / 100.0
+
+def parse_refraction_line(line: str) -> Optional[Refraction]:
+    """한 줄에서 S C A 세 값 (원주는 마이너스 표기로 통일, 범위 밖이면 None)"""
+    m = _SCA_RE.search(line)
+    if not m:
+        return None
+    s_val, c_val, a_val = _diopter(m.group(1)), _diopter(m.group(2)), int(m.group(3))
+    if c_val > 0:
+        c_val = -c_val
+    if abs(s_val) <= 30 and abs(c_val) <= 15 and 0 <= a_val <= 180:
+        return Refraction(round(s_val, 2), round(c_val, 2), a_val)
+    return None
+
+def _eye_rows(block: str, eye: str) -> Tuple[List[Refraction], Optional[Refraction]]:
+    m = _EYE_SECTION_RE[eye].search(block)
+    if not m:
+        return [], None
+    rows, ave = [], None
+    for line in m.group(1).split("\n"):
+        line = line.strip()
+        if not line:
+            continue
+        if _AVE_LINE_RE.search(line):
+            ave = parse_refraction_line(line) or ave
+        elif not _SKIP_LINE_RE.search(line):
+            r = parse_refraction_line(line)
+            if r:
+                rows.append(r)
+    return rows, ave
+
+def parse_refractor_text(ocr_text: str) -> RefractorReading:
+    """
+    자동굴절계 인쇄물 OCR 텍스트 -> RefractorReading.
+    REF.DATA 블럭의 <R>/<L> 구역에서 측정 행과 AVE 행을 읽고, 블럭이 없거나 비어 있으면
+    전체 텍스트의 3-수치 행 중 마지막을 우안, 그 앞을 좌안으로 봅니다.
+    """
+    text = (ocr_text or "").replace("\r", "").replace("\t", " ").translate(_DASHES)
+    reading = RefractorReading(date=find_exam_date(text))
+    m = _REF_BLOCK_RE.search(text)
+    block = _LEFT_MARK_FIX_RE.sub("<L>", m.group(1)) if m else ""
+    reading.od, reading.od_ave = _eye_rows(block, "R")
+    reading.os, reading.os_ave = _eye_rows(block, "L")
+    if not reading.success:
+        triples = [r for r in (parse_refraction_line(line) for line in text.split("\n")) if r]
+        reading.from_ref_block = False
+        if triples:
+            reading.od = [triples[-1]]
+        if len(triples) >= 2:
+            reading.os = [triples[-2]]
+    return reading
+
+# =========================
+#  각막곡률(KRT.DATA) / 각막두께 파서
+# =========================
+_KRT_BLOCK_RE = re.compile(r'KRT[.\s]?DATA(.*?)(PD:|REF[.\s]?DATA|$)', re.S | re.I)
+_KRT_SECTION_RE = {
+    "R": re.compile(r'<R>(.*?)(?=<L>|$)', re.S | re.I),
+    "L": re.compile(r'<L>(.*?)$', re.S | re.I),
+}
+_KRT_LINE_RE = re.compile(r'^\s*(R1|R2|K1|K2|AVE|MEAN|KM)\b[:\s]*(.*)$', re.I)
+_NUMBER_RE = re.compile(r'\d+(?:\.\d+)?')
+# 각막 굴절률 1.3375 기준 환산 (D = 337.5 / mm)
+KERATOMETRIC_CONSTANT = 337.5
+
+class Keratometry(NamedTuple):
+    k1: float               # 약주경선 (D)
+    k2: float               # 강주경선 (D)
+    mean_k: float
+    axis: Optional[int]     # K1 축
+
+@dataclass
+class KeratometryReading:
+    date: Optional[date] = None
+    od: Optional[Keratometry] = None
+    os: Optional[Keratometry] = None
+
+    @property
+    def success(self) -> bool:
+        return self.od is not None or self.os is not None
+
+def _krt_values(rest: str) -> Tuple[Optional[float], Optional[float], Optional[int]]:
+    """R1/R2/AVE 행 나머지에서 (곡률반경 mm, 굴절력 D, 축). 소수점이 빠진 토큰은 1/100 단위로 해석"""
+    mm = diopter = axis = None
+    for tok in _NUMBER_RE.findall(rest):
+        if "." in tok:
+            val = float(tok)
+        elif len(tok) <= 3 and int(tok) <= 180 and axis is None and (mm is not None or diopter is not None):
+            axis = int(tok)
+            continue
+        else:
+            val = int(tok) / 100.0
+        if 5.0 <= val <= 10.0 and mm is None:
+            mm = val
+        elif 30.0 <= val <= 60.0 and diopter is None:
+            diopter = val
+    if diopter is None and mm is not None:
+        diopter = round(KERATOMETRIC_CONSTANT / mm, 2)
+    return mm, diopter, axis
+
+def _keratometry(section: str) -> Optional[Keratometry]:
+    rows = {}
+    for line in section.split("\n"):
+        m = _KRT_LINE_RE.match(line)
+        if m:
+            label = {"K1": "R1", "K2": "R2", "MEAN": "AVE", "KM": "AVE"}.get(m.group(1).upper(), m.group(1).upper())
+            rows.setdefault(label, _krt_values(m.group(2)))
+    if "R1" not in rows or "R2" not in rows or rows["R1"][1] is None or rows["R2"][1] is None:
+        return None
+    (_, k1, ax1), (_, k2, ax2) = rows["R1"], rows["R2"]
+    if k1 > k2:  # K1은 약주경선
+        k1, k2, ax1 = k2, k1, ax2
+    ave = rows.get("AVE", (None, None, None))[1]
+    mean_k = ave if ave is not None else round((k1 + k2) / 2.0, 2)
+    return Keratometry(k1, k2, mean_k, ax1)
+
+def parse_keratometry_text(ocr_text: str) -> KeratometryReading:
+    """
+    KRT.DATA 블럭(<R>/<L> 구역의 R1, R2, AVE 행) 또는 K1/K2 라벨 행에서 각막곡률 추출.
+    굴절력(D)이 없으면 곡률반경(mm)에서 환산합니다.
+    """
+    text = (ocr_text or "").replace("\r", "").replace("\t", " ").translate(_DASHES)
+    reading = KeratometryReading(date=find_exam_date(text))
+    m = _KRT_BLOCK_RE.search(text)
+    block = _LEFT_MARK_FIX_RE.sub("<L>", m.group(1) if m else text)
+    sections = {eye: rx.search(block) for eye, rx in _KRT_SECTION_RE.items()}
+    if sections["R"] or sections["L"]:
+        reading.od = _keratometry(sections["R"].group(1)) if sections["R"] else None
+        reading.os = _keratometry(sections["L"].group(1)) if sections["L"] else None
+    else:
+        # 눈 구분 표시가 없으면 한 눈 측정으로 보고 우안에 배정
+        reading.od = _keratometry(block)
+    return reading
+
+_PACHY_KEYWORD_RE = re.compile(r'CCT|PACHY|THICK|\bCT\b|角膜厚|각막두께', re.I)
+_PACHY_VALUE_RE = re.compile(r'(?<![\d.])(\d{3})(?![\d.])\s*(µm|μm|um)?', re.I)
+_PACHY_OD_RE = re.compile(r'<R>|\bOD\b|\bR\b|RIGHT|右', re.I)
+_PACHY_OS_RE = re.compile(r'<L>|<b>|\bOS\b|\bL\b|LEFT|左', re.I)
+
+@dataclass
+class PachymetryReading:
+    date: Optional[date] = None
+    od_ct: Optional[float] = None
+    os_ct: Optional[float] = None
+
+    @property
+    def success(self) -> bool:
+        return self.od_ct is not None or self.os_ct is not None
+
+def parse_pachymetry_text(ocr_text: str) -> PachymetryReading:
+    """
+    중심각막두께(µm): CCT/PACHY 등 키워드가 있는 줄과 그 아래로 이어지는 줄, 또는 µm 단위가 붙은 350~800 값.
+    값은 바로 앞에 연달아 나온 눈 표시(OD/<R>/R, OS/<L>/L)에 순서대로 배정하고 (R/L CCT 548 551),
+    표시 하나 뒤에 값이 여럿이거나 표시가 없으면 순서대로 OD, OS.
+    """
+    text = (ocr_text or "").replace("\r", "").replace("\t", " ")
+    reading = PachymetryReading(date=find_exam_date(text))
+    tokens, pos, in_block = [], 0, False
+    for line in text.split("\n"):
+        keyword = _PACHY_KEYWORD_RE.search(line) is not None
+        marks = [(pos + m.start(), "od") for m in _PACHY_OD_RE.finditer(line)] + \
+                [(pos + m.start(), "os") for m in _PACHY_OS_RE.finditer(line)]
+        vals = [(pos + m.start(), float(m.group(1))) for m in _PACHY_VALUE_RE.finditer(line)
+                if 350 <= int(m.group(1)) <= 800 and (keyword or in_block or m.group(2))]
+        # 키워드 줄 아래로 값이나 눈 표시가 있는 줄이 이어지는 동안은 같은 블록 (Pachymetry (um) / R 548 / L 551)
+        in_block = keyword or (in_block and bool(vals or marks))
+        tokens += marks + vals
+        pos += len(line) + 1
+    # (연달아 나온 눈 표시, 그 뒤의 값들) 묶음
+    groups = []
+    for _, tok in sorted(tokens):
+        if isinstance(tok, str):
+            if not groups or groups[-1][1]:
+                groups.append(([], []))
+            groups[-1][0].append(tok)
+        else:
+            if not groups:
+                groups.append(([], []))
+            groups[-1][1].append(tok)
+    for eyes, vals in groups:
+        if len(vals) <= len(eyes):
+            eyes = eyes[len(eyes) - len(vals):]
+        elif len(eyes) < 2:
+            eyes = []
+        for i, val in enumerate(vals):
+            eye = eyes[i] if i < len(eyes) else ("od" if reading.od_ct is None else "os")
+            if getattr(reading, f"{eye}_ct") is None:
+                setattr(reading, f"{eye}_ct", val)
+    return reading
+
+# =========================
+#  기기별 레이아웃 템플릿 (관심 영역만 OCR)
+# =========================
+# 영역 상자는 페이지 크기에 대한 비율 (x0, y0, x1, y1). 스캔 해상도와 무관하게 적용됩니다.
+# 좌표는 각 기기 표준 인쇄물 기준의 대략값이므로 기관 양식에 맞게 조정해서 사용하세요.
+DEVICE_TEMPLATES = {
+    "iolmaster700": {
+        "label": "IOLMaster 700",
+        "regions": {"od_al": (0.06, 0.20, 0.48, 0.27), "os_al": (0.54, 0.20, 0.96, 0.27),
+                    "date": (0.58, 0.04, 0.96, 0.10)},
+    },
+    "lenstar": {
+        "label": "Lenstar",
+        "regions": {"od_al": (0.05, 0.30, 0.46, 0.36), "os_al": (0.54, 0.30, 0.95, 0.36),
+                    "date": (0.05, 0.04, 0.50, 0.09)},
+    },
+    "myah": {
+        "label": "Myah",
+        "regions": {"od_al": (0.08, 0.34, 0.46, 0.42), "os_al": (0.54, 0.34, 0.92, 0.42),
+                    "date": (0.55, 0.03, 0.95, 0.08)},
+    },
+    "autorefractor": {
+        "label": "自動屈折計",
+        "regions": {"date": (0.00, 0.02, 1.00, 0.08), "od_ref": (0.00, 0.14, 1.00, 0.36),
+                    "os_ref": (0.00, 0.37, 1.00, 0.59), "krt": (0.00, 0.60, 1.00, 0.92)},
+    },
+}
+AXL_DEVICES = [k for k, t in DEVICE_TEMPLATES.items() if "od_al" in t["regions"]]
+
+# 영역 종류(이름의 마지막 부분)별 tesseract 설정: 한 줄(psm 7) + 숫자 화이트리스트
+_REGION_CONFIG = {
+    "al": "--psm 7 -c tessedit_char_whitelist=0123456789.",
+    "date": "--psm 7 -c tessedit_char_whitelist=0123456789-./",
+    "ref": "--psm 6 -c tessedit_char_whitelist=0123456789+-.",
+    # R1/R2/AVE 라벨과 <R>/<L> 표시가 필요하므로 화이트리스트 없음
+    "krt": "--psm 6",
+}
+# 작은 영역은 확대해야 tesseract 인식률이 올라감
+ROI_SCALE = 2
+
+def crop_region(img: Image.Image, box: Tuple[float, float, float, float]) -> Image.Image:
+    w, h = img.size
+    x0, y0, x1, y1 = box
+    crop = img.crop((int(x0 * w), int(y0 * h), int(x1 * w), int(y1 * h)))
+    if ROI_SCALE != 1:
+        crop = crop.resize((crop.width * ROI_SCALE, crop.height * ROI_SCALE), Image.LANCZOS)
+    return crop
+
+def _png_bytes(img: Image.Image) -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+def ocr_regions(source, device: str) -> dict:
+    """
+    템플릿 영역만 잘라 OCR -> {영역 이름: {"text", "conf"}}.
+    영역마다 OCR 캐시를 거치므로 같은 인쇄물은 다시 읽지 않습니다.
+    """
+    regions = DEVICE_TEMPLATES[device]["regions"]
+    # 페이지는 해상도/기울기만 맞추고 (비율 좌표가 어긋나지 않도록 자르기 없음) 영역별로 이진화
+    img = load_ocr_image(_read_bytes(source), dict(PREPROCESS_DEFAULTS, threshold=None, crop_text=False))
+    out = {}
+    for region, box in regions.items():
+        config = _REGION_CONFIG[region.rsplit("_", 1)[-1]]
+        data = ocr_image_data(_png_bytes(crop_region(img, box)), config=config, preprocess=ROI_PREPROCESS)
+        words = [(w.strip(), float(c)) for w, c in zip(data["text"], data["conf"]) if w and w.strip()]
+        confs = [c for _, c in words if c >= 0]
+        out[region] = {
+            "text": _data_to_text(data) if region.endswith(("ref", "krt")) else " ".join(w for w, _ in words),
+            "conf": min(confs) / 100.0 if confs else None,
+        }
+    return out
+
+def parse_al_value(text: str) -> Optional[float]:
+    """영역 OCR 결과에서 AL 값 (소수점이 빠진 4자리도 허용)"""
+    m = re.search(r'(\d{2})[.,](\d{2})', text or "") or re.search(r'\b(\d{2})(\d{2})\b', text or "")
+    if not m:
+        return None
+    val = float(f"{m.group(1)}.{m.group(2)}")
+    return val if 15.0 <= val <= 35.0 else None
+
+def refractor_text_from_regions(regions: dict) -> str:
+    """자동굴절계 영역 OCR 결과를 전체 페이지 파서가 기대하는 REF.DATA / KRT.DATA 배치로 조립"""
+    return "\n".join([
+        regions.get("date", {}).get("text", ""),
+        "REF.DATA",
+        "<R>", regions.get("od_ref", {}).get("text", ""),
+        "<L>", regions.get("os_ref", {}).get("text", ""),
+        "KRT.DATA", regions.get("krt", {}).get("text", ""),
+    ])
+
+# =========================
+#  PDF 보고서 (텍스트 레이어 우선, 없으면 페이지 래스터화 + OCR)
+# =========================
+# 이보다 글자가 적은 페이지는 스캔본으로 보고 OCR
+PDF_MIN_TEXT_CHARS = 20
+PDF_RENDER_DPI = 300
+
+def is_pdf(data: bytes) -> bool:
+    return data[:5] == b"%PDF-"
+
+def _require_pdf_reader() -> None:
+    if not (_HAS_PYPDF or _HAS_PDFIUM):
+        raise RuntimeError("PDF를 읽으려면 pypdf 또는 pypdfium2를 설치해야 합니다.")
+
+def pdf_page_texts(data: bytes) -> List[str]:
+    """페이지별 텍스트 레이어 (없으면 빈 문자열)"""
+    _require_pdf_reader()
+    if _HAS_PYPDF:
+        return [page.extract_text() or "" for page in PdfReader(io.BytesIO(data)).pages]
+    pdf = pdfium.PdfDocument(data)
+    return [pdf[i].get_textpage().get_text_range() or "" for i in range(len(pdf))]
+
+def pdf_page_image(data: bytes, index: int, dpi: int = PDF_RENDER_DPI) -> Image.Image:
+    """
+    페이지 한 장을 이미지로. pypdfium2가 있으면 렌더링하고, 없으면 pypdf로 페이지에 들어 있는
+    가장 큰 스캔 이미지를 꺼냅니다.
+    """
+    _require_pdf_reader()
+    if _HAS_PDFIUM:
+        img = pdfium.PdfDocument(data)[index].render(scale=dpi / 72.0).to_pil().convert("L")
+        img.info["dpi"] = (dpi, dpi)
+        return img
+    images = PdfReader(io.BytesIO(data)).pages[index].images
+    if not images:
+        raise RuntimeError("스캔 PDF를 래스터화하려면 pypdfium2를 설치해야 합니다.")
+    return max((im.image for im in images), key=lambda im: im.width * im.height).convert("L")
+
+def _page_png(data: bytes, index: int) -> bytes:
+    img = pdf_page_image(data, index)
+    buf = io.BytesIO()
+    img.save(buf, format="PNG", dpi=img.info.get("dpi", (PDF_RENDER_DPI, PDF_RENDER_DPI)))
+    return buf.getvalue()
+
+def _has_text_layer(text: str) -> bool:
+    return len("".join(text.split())) >= PDF_MIN_TEXT_CHARS
+
+def ocr_pdf_text(data: bytes, lang: str = OCR_LANG, config: str = "") -> str:
+    """PDF 전체 텍스트: 텍스트 레이어가 있는 페이지는 그대로, 스캔 페이지만 래스터화해 OCR (페이지 사이 \\f)"""
+    key = _ocr_key(data, "pdf", lang, config, PREPROCESS_DEFAULTS)
+    text = OCR_CACHE.get(key)
+    if text is None:
+        pages = pdf_page_texts(data)
+        text = "\n\f\n".join(
+            page if _has_text_layer(page) else ocr_image_text(_page_png(data, i), lang=lang, config=config)
+            for i, page in enumerate(pages)
+        )
+        OCR_CACHE.put(key, text)
+    return text
+
+def ocr_document_text(source, lang: str = OCR_LANG, config: str = "") -> str:
+    """이미지면 ocr_image_text, PDF면 ocr_pdf_text"""
+    data = _read_bytes(source)
+    return ocr_pdf_text(data, lang, config) if is_pdf(data) else ocr_image_text(data, lang=lang, config=config)
+
+def _document_text_key(data: bytes, lang: str, config: str) -> str:
+    return _ocr_key(data, "pdf" if is_pdf(data) else "string", lang, config, PREPROCESS_DEFAULTS)
+
+def text_layer_data(text: str, char_width: int = 10, line_height: int = 20) -> dict:
+    """
+    텍스트 레이어를 image_to_data 형식으로 (신뢰도 100, 글자 위치를 고정폭 좌표로 환산).
+    단어 상자 파서(parse_axl_boxes)를 스캔본과 똑같이 쓰기 위한 것입니다.
+    """
+    data = _empty_data()
+    for line_num, line in enumerate(text.splitlines(), start=1):
+        for word_num, m in enumerate(re.finditer(r'\S+', line), start=1):
+            values = (5, 1, 1, 1, line_num, word_num, m.start() * char_width, line_num * line_height,
+                      len(m.group()) * char_width, line_height)
+            for col, value in zip(_TSV_INT_COLUMNS, values):
+                data[col].append(value)
+            data["conf"].append(100.0)
+            data["text"].append(m.group())
+    return data
+
+def ocr_axl_pdf(name: str, data: bytes) -> dict:
+    """
+    PDF 보고서에서 AL: 텍스트 레이어가 있는 페이지는 OCR 없이(신뢰도 1.0), 스캔 페이지는 래스터화해
+    OCR한 뒤 둘 다 같은 단어 상자 파서로 읽습니다. 값이 나온 첫 페이지를 사용합니다.
+    """
+    texts = []
+    for i, page in enumerate(pdf_page_texts(data)):
+        page_data = text_layer_data(page) if _has_text_layer(page) else ocr_image_data(_page_png(data, i))
+        result = _axl_result_from_data(_empty_result(name), page_data)
+        texts.append(result["text"])
+        if result["od_al"] is not None or result["os_al"] is not None:
+            result["text"] = "\n\f\n".join(texts)
+            return result
+    result = _empty_result(name)
+    result.update(text="\n\f\n".join(texts), error="AL 값을 찾지 못했습니다")
+    return result
+
+# =========================
+#  일괄 OCR (프로세스 풀)
+# =========================
+_DATE_RE = re.compile(r'(\d{4}[-./]\d{1,2}[-./]\d{1,2})')
+
+def find_exam_date(ocr_text: str) -> Optional[date]:
+    """인쇄물 텍스트의 첫 YYYY-MM-DD(./ 구분 포함) 날짜"""
+    m = _DATE_RE.search(ocr_text or "")
+    if not m:
+        return None
+    try:
+        return date(*(int(x) for x in re.split(r'[-./]', m.group(1))))
+    except ValueError:
+        return None
+
+def _data_to_text(data: dict) -> str:
+    """image_to_data 결과를 줄 단위 텍스트로 (image_to_string과 같은 줄 구성)"""
+    lines, key, words = [], None, []
+    for i, word in enumerate(data["text"]):
+        line_key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        if line_key != key:
+            if words:
+                lines.append(" ".join(words))
+            key, words = line_key, []
+        if word and word.strip():
+            words.append(word.strip())
+    if words:
+        lines.append(" ".join(words))
+    return "\n".join(lines)
+
+def _value_confidence(data: dict, value: Optional[float]) -> Optional[float]:
+    """추출한 값이 들어 있는 단어의 tesseract 신뢰도 (0~1)"""
+    if value is None:
+        return None
+    token = f"{value:.2f}"
+    confs = [float(c) for w, c in zip(data["text"], data["conf"]) if token in (w or "") and float(c) >= 0]
+    return max(confs) / 100.0 if confs else None
+
+def _ocr_axl_roi(source, device: str) -> dict:
+    regions = ocr_regions(source, device)
+    od_al, os_al = parse_al_value(regions["od_al"]["text"]), parse_al_value(regions["os_al"]["text"])
+    return {
+        "date": find_exam_date(regions["date"]["text"]) if "date" in regions else None,
+        "od_al": od_al, "os_al": os_al,
+        "od_conf": regions["od_al"]["conf"] if od_al is not None else None,
+        "os_conf": regions["os_al"]["conf"] if os_al is not None else None,
+        "text": "\n".join(f"{k}: {v['text']}" for k, v in regions.items()),
+    }
+
+def _confidence(od_al, os_al, od_conf, os_conf) -> float:
+    confs = [c for c in (od_conf, os_conf) if c is not None]
+    # 한쪽 눈만 읽힌 경우는 절반으로 취급
+    return (min(confs) if confs else 0.0) * (1.0 if od_al is not None and os_al is not None else 0.5)
+
+def _empty_result(name: str) -> dict:
+    return {"file": name, "date": None, "od_al": None, "os_al": None,
+            "od_conf": None, "os_conf": None, "confidence": 0.0, "text": "", "error": None}
+
+def _axl_result_from_data(result: dict, data: dict) -> dict:
+    """
+    전체 페이지 image_to_data 결과에서 AL 추출. 단어 상자 기반(parse_axl_boxes)을 우선하고,
+    상자로 한 눈도 못 찾았을 때만 텍스트 휴리스틱(parse_axl_image_ocr)으로 넘어갑니다.
+    """
+    text = _data_to_text(data)
+    boxes = parse_axl_boxes(data)
+    if boxes["success"]:
+        od_al, os_al, success = boxes["od_al"], boxes["os_al"], True
+        od_conf, os_conf = boxes["od_conf"], boxes["os_conf"]
+    else:
+        od_al, os_al, success = parse_axl_image_ocr(text)
+        od_conf, os_conf = _value_confidence(data, od_al), _value_confidence(data, os_al)
+    result.update(
+        date=find_exam_date(text), od_al=od_al, os_al=os_al, od_conf=od_conf, os_conf=os_conf,
+        confidence=_confidence(od_al, os_al, od_conf, os_conf), text=text,
+    )
+    if not success:
+        result["error"] = "AL 값을 찾지 못했습니다"
+    return result
+
+def ocr_axl_image(name: str, source: Union[bytes, str, Path], device: Optional[str] = None) -> dict:
+    """
+    인쇄물 한 장 OCR -> {"file", "date", "od_al", "os_al", "od_conf", "os_conf", "confidence", "text", "error"}
+    device를 주면 템플릿 영역만 읽고, 두 눈 모두 못 읽었을 때만 전체 페이지 OCR로 넘어갑니다.
+    PDF는 템플릿 대신 ocr_axl_pdf(페이지별 텍스트 레이어/OCR)로 처리합니다.
+    프로세스 풀 작업 함수이므로 예외는 error 필드로 돌려줍니다.
+    """
+    result = _empty_result(name)
+    try:
+        data = _read_bytes(source)
+        if is_pdf(data):
+            return ocr_axl_pdf(name, data)
+        if device:
+            roi = _ocr_axl_roi(source, device)
+            if roi["od_al"] is not None or roi["os_al"] is not None:
+                result.update(roi, confidence=_confidence(roi["od_al"], roi["os_al"], roi["od_conf"], roi["os_conf"]))
+                return result
+        _axl_result_from_data(result, ocr_image_data(source))
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+def ocr_axl_chunk(chunk: List[Tuple[str, bytes]], device: Optional[str] = None) -> List[dict]:
+    """
+    여러 장을 한 작업 단위로 OCR. 엔진이 일괄 처리를 지원하면(cli) 전체 페이지 OCR을
+    tesseract 한 번 실행으로 끝내고, 아니면(tesserocr 상주 API, 템플릿 영역) 한 장씩 처리합니다.
+    """
+    engine = get_engine()
+    if device or not engine.supports_batch or len(chunk) < 2:
+        return [ocr_axl_image(name, data, device) for name, data in chunk]
+    results = [_empty_result(name) for name, _ in chunk]
+    todo, images = [], []
+    for i, (name, data) in enumerate(chunk):
+        if is_pdf(data):
+            results[i] = ocr_axl_image(name, data)
+            continue
+        key = _ocr_key(data, "data", OCR_LANG, "", PREPROCESS_DEFAULTS)
+        cached = OCR_CACHE.get(key)
+        if cached is not None:
+            _axl_result_from_data(results[i], cached)
+            continue
+        try:
+            images.append(load_ocr_image(data))
+            todo.append((i, key))
+        except Exception as e:
+            results[i]["error"] = str(e)
+    if images:
+        try:
+            datas = engine.batch_image_to_data(images, OCR_LANG)
+        except Exception as e:
+            for i, _ in todo:
+                results[i]["error"] = str(e)
+            return results
+        for (i, key), data in zip(todo, datas):
+            OCR_CACHE.put(key, data)
+            _axl_result_from_data(results[i], data)
+    return results
+
+def list_image_files(directory: Union[str, Path]) -> List[Path]:
+    d = Path(directory).expanduser()
+    if not d.is_dir():
+        return []
+    return sorted(p for p in d.iterdir() if p.suffix.lower() in DOCUMENT_SUFFIXES)
+
+def _pipeline_params(device: Optional[str]) -> dict:
+    """결과 캐시 키에 넣을 OCR 설정: 엔진, 전처리(전체 페이지/영역), 기기 템플릿"""
+    return {"lang": OCR_LANG, "engine": get_engine().name, "preprocess": PREPROCESS_DEFAULTS,
+            "roi_preprocess": ROI_PREPROCESS if device else None, "device": device,
+            "template": DEVICE_TEMPLATES.get(device)}
+
+def _axl_result_key(image_bytes: bytes, device: Optional[str]) -> str:
+    return ocr_cache_key(image_bytes, op="axl_result", **_pipeline_params(device))
+
+def _cached_axl_result(key: str, name: str) -> Optional[dict]:
+    cached = OCR_CACHE.get(key)
+    if cached is None:
+        return None
+    return dict(cached, file=name, date=date.fromisoformat(cached["date"]) if cached["date"] else None)
+
+def _cache_axl_result(key: str, res: dict) -> None:
+    if res["error"] is None or res["text"]:  # tesseract 실행 실패 등은 캐시하지 않음
+        OCR_CACHE.put(key, dict(res, date=res["date"].isoformat() if res["date"] else None))
+
+def batch_ocr_axl(items: Iterable[Tuple[str, Union[bytes, str, Path]]], max_workers: Optional[int] = None,
+                  progress: Optional[Callable[[int, int], None]] = None, device: Optional[str] = None) -> List[dict]:
+    """
+    (파일 이름, 바이트 또는 경로) 목록을 프로세스 풀에서 OCR.
+    결과는 입력 순서대로 반환하고, progress(완료 수, 전체 수)를 호출합니다.
+    백그라운드 작업 스레드에서도 불리므로 워커는 fork가 아닌 spawn으로 띄웁니다
+    (스레드가 있는 프로세스를 fork하면 자식이 잠금을 쥔 채 멈출 수 있음).
+    """
+    items = [(name, _read_bytes(src)) for name, src in items]
+    if not items:
+        return []
+    results: List[Optional[dict]] = [None] * len(items)
+    # 이미 OCR한 인쇄물은 풀에 보내지 않음 (워커의 메모리 캐시는 부모와 공유되지 않으므로 여기서 확인)
+    keys = [_axl_result_key(b, device) for _, b in items]
+    pending = []
+    for i, (name, _) in enumerate(items):
+        results[i] = _cached_axl_result(keys[i], name)
+        if results[i] is None:
+            pending.append(i)
+    n_done = len(items) - len(pending)
+    if progress and n_done:
+        progress(n_done, len(items))
+    if not pending:
+        return results
+    max_workers = max_workers or min(len(pending), os.cpu_count() or 1)
+    # 작업 단위를 묶어 tesseract 실행/모델 로드 횟수를 줄이되, 워커마다 최소 한 묶음은 돌도록 나눔
+    size = max(1, min(BATCH_CHUNK, -(-len(pending) // max_workers)))
+    chunks = [pending[k:k + size] for k in range(0, len(pending), size)]
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = {pool.submit(ocr_axl_chunk, [items[i] for i in chunk], device): chunk for chunk in chunks}
+        for fut in as_completed(futures):
+            chunk = futures[fut]
+            for i, res in zip(chunk, fut.result()):
+                results[i] = res
+                _cache_axl_result(keys[i], res)
+            n_done += len(chunk)
+            if progress:
+                progress(n_done, len(items))
+    return results
+
+# =========================
+#  백그라운드 OCR 작업 (서버 프로세스가 소유하는 스레드 풀)
+# =========================
+# tesseract는 별도 프로세스로 실행되므로 스레드에서 돌려도 Streamlit 스크립트를 막지 않습니다.
+OCR_JOB_WORKERS = 2
+# 끝난 작업을 보관하는 개수 (세션이 결과를 가져가기 전까지 필요)
+OCR_JOB_HISTORY = 64
+
+class OcrJob:
+    """백그라운드 OCR 작업 상태: queued -> running -> done / error"""
+    def __init__(self, key: str, total: int = 1):
+        self.key = key
+        self.status = "queued"
+        self.done = 0
+        self.total = total
+        self.result = None
+        self.error: Optional[str] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "error")
+
+    @property
+    def fraction(self) -> float:
+        return self.done / self.total if self.total else 0.0
+
+    def set_progress(self, done: int, total: int) -> None:
+        self.done, self.total = done, total
+
+    def get(self):
+        """완료된 결과 (실패한 작업이면 RuntimeError)"""
+        if self.status == "error":
+            raise RuntimeError(self.error)
+        return self.result
+
+_JOB_POOL: Optional[ThreadPoolExecutor] = None
+_JOBS: "OrderedDict[str, OcrJob]" = OrderedDict()
+_JOBS_LOCK = threading.Lock()
+
+def _job_pool() -> ThreadPoolExecutor:
+    global _JOB_POOL
+    if _JOB_POOL is None:
+        _JOB_POOL = ThreadPoolExecutor(max_workers=OCR_JOB_WORKERS, thread_name_prefix="axl-ocr")
+    return _JOB_POOL
+
+def _run_job(job: OcrJob, fn: Callable, args: tuple, kwargs: dict) -> None:
+    job.status = "running"
+    try:
+        job.result = fn(*args, **kwargs)
+        job.done, job.status = job.total, "done"
+    except Exception as e:
+        job.error, job.status = str(e), "error"
+    job.finished_at = time.time()
+
+def _prune_jobs() -> None:
+    finished = [k for k, j in _JOBS.items() if j.finished]
+    for k in finished[:max(0, len(finished) - OCR_JOB_HISTORY)]:
+        del _JOBS[k]
+
+def submit_job(key: str, fn: Callable, *args, total: int = 1, progress: bool = False, **kwargs) -> OcrJob:
+    """
+    fn(*args, **kwargs)를 백그라운드에서 실행. 같은 key의 작업이 이미 있으면 그 작업을 돌려줍니다
+    (Streamlit 재실행마다 다시 제출되지 않도록). progress=True면 fn에 progress 콜백을 넘깁니다.
+    """
+    with _JOBS_LOCK:
+        job = _JOBS.get(key)
+        if job is not None:
+            return job
+        job = _JOBS[key] = OcrJob(key, total)
+        _prune_jobs()
+    if progress:
+        kwargs["progress"] = job.set_progress
+    _job_pool().submit(_run_job, job, fn, args, kwargs)
+    return job
+
+def get_job(key: Optional[str]) -> Optional[OcrJob]:
+    with _JOBS_LOCK:
+        return _JOBS.get(key) if key else None
+
+def discard_job(key: Optional[str]) -> None:
+    """끝난 작업 기록 삭제 (실패한 작업 재시도용)"""
+    with _JOBS_LOCK:
+        job = _JOBS.get(key) if key else None
+        if job is not None and job.finished:
+            del _JOBS[key]
+
+def submit_text_job(source, lang: str = OCR_LANG, config: str = "") -> OcrJob:
+    """
+    이미지/PDF 한 장의 전체 텍스트 작업 (ocr_document_text). 키가 OCR 캐시 키와 같아 같은 파일은
+    세션 간에도 공유되고, 캐시에 이미 있으면 풀을 거치지 않고 완료된 작업을 돌려줍니다.
+    """
+    data = _read_bytes(source)
+    key = _document_text_key(data, lang, config)
+    text = OCR_CACHE.get(key)
+    if text is not None:
+        return _done_job(key, text)
+    return submit_job(key, ocr_document_text, data, lang=lang, config=config)
+
+def _done_job(key: str, result) -> OcrJob:
+    job = OcrJob(key)
+    job.result, job.done, job.status, job.finished_at = result, 1, "done", time.time()
+    return job
+
+def _ocr_axl_cached(key: str, name: str, image_bytes: bytes, device: Optional[str]) -> dict:
+    res = ocr_axl_image(name, image_bytes, device)
+    _cache_axl_result(key, res)
+    return res
+
+def submit_axl_job(source, device: Optional[str] = None, name: str = "") -> OcrJob:
+    """안축장도 한 장을 ocr_axl_image로 (기기 템플릿 영역 OCR 포함). 결과는 일괄 OCR과 같은 캐시를 사용"""
+    image_bytes = _read_bytes(source)
+    key = _axl_result_key(image_bytes, device)
+    cached = _cached_axl_result(key, name)
+    if cached is not None:
+        return _done_job(key, cached)
+    return submit_job(key, _ocr_axl_cached, key, name, image_bytes, device)
+
+def submit_roi_job(source, device: str) -> OcrJob:
+    """
+    기기 템플릿 영역 OCR 작업 -> job.result = ocr_regions 결과.
+    PDF는 페이지 배치가 인쇄물과 달라 템플릿 대신 submit_text_job(텍스트 레이어/전체 OCR)을 쓰세요.
+    """
+    image_bytes = _read_bytes(source)
+    key = ocr_cache_key(image_bytes, op="roi", **_pipeline_params(device))
+    cached = OCR_CACHE.get(key)
+    if cached is not None:
+        return _done_job(key, cached)
+    def _run():
+        regions = ocr_regions(image_bytes, device)
+        OCR_CACHE.put(key, regions)
+        return regions
+    return submit_job(key, _run)
+
+def submit_batch_job(items: Iterable[Tuple[str, Union[bytes, str, Path]]], device: Optional[str] = None) -> OcrJob:
+    """batch_ocr_axl을 백그라운드 작업으로 (진행 상황은 job.done / job.total)"""
+    items = list(items)
+    return submit_job(uuid.uuid4().hex, batch_ocr_axl, items, total=len(items), progress=True, device=device)
@@ -0,0 +1,607 @@
+# -*- coding: utf-8 -*-
+"""
+20세 예측 모델 (안축장/굴절 추세)
+
+한 계열용: trend_and_predict(선형/로그 회귀), recommendation_predict(설명력 높은 모델 + 치료조정)
+  둘 다 20세 예측치의 95% 예측구간(pi_low/pi_high, t 분포)을 붙이고, bootstrap=B를 주면
+  점들을 B번 재표본해 한 번의 NumPy 연산으로 적합한 부트스트랩 구간(boot_low/boot_high)도 붙입니다.
+일괄용: batch_predict -- long format 표(patient_id, eye, age, value, remarks)의 모든 (환자, 눈) 그룹을
+  np.bincount 기반 닫힌 형태 최소제곱으로 한 번에 적합합니다. 결과는 한 계열용 함수와 같습니다.
+
+사용 예:
+  from axl_predict import batch_predict
+  report = batch_predict(long_df[long_df["measure"] == "mm"], mode="recommend")
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from functools import lru_cache
+from types import MappingProxyType
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from axl_storage import remarks_lookup
+
+TARGET_AGE = 20.0
+PREDICT_MODES = ("linear", "log", "recommend")
+PREDICT_COLUMNS = ["n", "slope", "intercept", "r2", "pred_at_20", "last_age", "last_value", "delta_to_20",
+                   "pi_low", "pi_high", "valid"]
+
+# 예측구간 수준. t 분포 임계값은 scipy 없이 표로 (양측 95%, 자유도 1~30, 그 이상은 1/df 보간)
+PI_LEVEL = 0.95
+_T_95 = np.array([12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+                  2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+                  2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042])
+_T_95_TAIL = ([0.0, 1 / 120, 1 / 60, 1 / 40, 1 / 30], [1.960, 1.980, 2.000, 2.021, 2.042])
+
+BOOTSTRAP_SAMPLES = 2000
+
+# 치료/관리 옵션별 진행 속도 조정 계수 (작을수록 억제 강함)
+TREATMENT_FACTORS = {
+    "0.125% AT": 0.7,
+    "low-dose AT": 0.8,
+    "OK-lens": 0.6,
+    "DIMS": 0.65,
+    "HAL": 0.65,
+}
+
+# =========================
+#  예측구간
+# =========================
+def t_critical(dof) -> np.ndarray:
+    """양측 95% t 임계값 (dof < 1이면 NaN)"""
+    dof = np.asarray(dof, dtype=float)
+    safe = np.clip(np.nan_to_num(dof, nan=0.0), 1, None)
+    table = _T_95[np.clip(safe.astype(int), 1, len(_T_95)) - 1]
+    t = np.where(safe > len(_T_95), np.interp(1.0 / safe, *_T_95_TAIL), table)
+    return np.where(dof >= 1, t, np.nan)
+
+def _pi_half_width(n, x_mean, sxx, resid_sd, x0):
+    """새 관측 하나의 95% 예측구간 반폭: t * s * sqrt(1 + 1/n + (x0 - x̄)² / Sxx)"""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return t_critical(np.asarray(n) - 2) * resid_sd * np.sqrt(1.0 + 1.0 / n + (x0 - x_mean) ** 2 / sxx)
+
+def _x_scale(ages, mode: str):
+    return np.log(ages) if mode == "log" else np.asarray(ages, dtype=float)
+
+def prediction_band(res: dict, ages) -> tuple:
+    """
+    추세선(치료조정 전) 주변 95% 예측구간 -> (low, high) 배열. 상세 그래프 음영용.
+    점이 3개 미만이면(잔차 자유도 0) NaN.
+    """
+    ages = np.asarray(ages, dtype=float)
+    if not res.get("valid"):
+        return np.full(ages.shape, np.nan), np.full(ages.shape, np.nan)
+    if res["mode"] == "centile":
+        return _centile_band(res, ages)
+    X = _x_scale(ages, res["mode"])
+    fit = res["slope"] * X + res["intercept"]
+    half = _pi_half_width(res["n"], res["x_mean"], res["sxx"], res["resid_sd"], X)
+    return fit - half, fit + half
+
+def _centile_band(res: dict, ages: np.ndarray) -> tuple:
+    """백분위 추적: 예측구간 z 폭을 모든 나이의 노모그램 궤적에 그대로 적용"""
+    if not np.isfinite(res["z_sd"]):
+        return np.full(ages.shape, np.nan), np.full(ages.shape, np.nan)
+    n = res["n"]
+    half = float(t_critical(n - 1) * res["z_sd"] * np.sqrt(1.0 + 1.0 / n))
+    return (nomogram_al(res["sex"], ages, res["z_last"] - half),
+            nomogram_al(res["sex"], ages, res["z_last"] + half))
+
+def bootstrap_interval(x_age, y, target_age: float = TARGET_AGE, mode: str = "linear",
+                       n_boot: int = BOOTSTRAP_SAMPLES, seed: int = 0) -> tuple:
+    """
+    부트스트랩 95% 예측구간 (치료조정 전). 점(나이, 값) 쌍을 n_boot번 복원추출한 (n_boot, n) 배열을
+    한 번에 닫힌 형태로 적합하고, 각 적합의 20세 값에 원래 적합의 잔차 하나를 더해 분위수를 냅니다.
+    모든 표본의 나이가 같아 적합이 안 되는 재표본은 버립니다. 점이 3개 미만이면 (NaN, NaN).
+    """
+    x = np.asarray(x_age, dtype=float)
+    yv = np.asarray(y, dtype=float)
+    mask = np.isfinite(x) & np.isfinite(yv)
+    if mode == "log":
+        mask &= x > 0
+    X, yv = _x_scale(x[mask], mode), yv[mask]
+    n = X.size
+    if n < 3 or np.ptp(X) == 0:
+        return np.nan, np.nan
+    b, a = np.polyfit(X, yv, 1)
+    # 잔차는 자유도 보정(sqrt(n / (n - 2)))해 재사용
+    resid = (yv - (b * X + a)) * np.sqrt(n / (n - 2))
+
+    rng = np.random.default_rng(seed)
+    idx = rng.integers(0, n, size=(n_boot, n))
+    Xb, yb = X[idx], yv[idx]
+    dx = Xb - Xb.mean(axis=1, keepdims=True)
+    sxx = np.einsum("ij,ij->i", dx, dx)
+    ok = sxx > 0
+    slope = np.einsum("ij,ij->i", dx[ok], yb[ok]) / sxx[ok]
+    intercept = yb[ok].mean(axis=1) - slope * Xb[ok].mean(axis=1)
+    X20 = np.log(target_age) if mode == "log" else target_age
+    draws = slope * X20 + intercept + resid[rng.integers(0, n, size=slope.size)]
+    if draws.size == 0:
+        return np.nan, np.nan
+    alpha = (1.0 - PI_LEVEL) / 2
+    low, high = np.quantile(draws, [alpha, 1.0 - alpha])
+    return float(low), float(high)
+
+# =========================
+#  한 계열
+# =========================
+def trend_and_predict(x_age: pd.Series, y: pd.Series, target_age: float = TARGET_AGE, mode: str = "linear",
+                      bootstrap: int = 0):
+    """
+    y = b*X + a (X = 나이 또는 log(나이)) 적합과 20세 예측.
+    pi_low/pi_high: 20세 값의 95% 예측구간 (점 3개 이상), n/x_mean/sxx/resid_sd: prediction_band용 적합 통계.
+    bootstrap > 0이면 그 횟수만큼 재표본한 boot_low/boot_high도 추가합니다.
+    """
+    res = {"slope": np.nan, "intercept": np.nan, "r2": np.nan,
+           "pred_at_20": np.nan, "last_age": np.nan, "last_value": np.nan,
+           "delta_to_20": np.nan, "pi_low": np.nan, "pi_high": np.nan, "valid": False,
+           "mode": mode, "n": 0, "x_mean": np.nan, "sxx": np.nan, "resid_sd": np.nan}
+    if bootstrap:
+        res.update(boot_low=np.nan, boot_high=np.nan)
+    try:
+        x = np.array(x_age, dtype=float)
+        yv = np.array(y, dtype=float)
+
+        if mode == "log":
+            mask = np.isfinite(x) & np.isfinite(yv) & (x > 0)
+            X = np.log(x[mask]); yv = yv[mask]
+        else:
+            mask = np.isfinite(x) & np.isfinite(yv)
+            X = x[mask]; yv = yv[mask]
+
+        # 점이 2개 미만이거나 모두 같은 나이면 기울기가 정해지지 않음
+        if X.size < 2 or np.ptp(X) == 0:
+            return res
+
+        b, a = np.polyfit(X, yv, 1)  # y = b*X + a
+        y_hat = b * X + a
+        ss_res = np.sum((yv - y_hat) ** 2)
+        ss_tot = np.sum((yv - np.mean(yv)) ** 2)
+        r2 = 1.0 - ss_res / ss_tot if ss_tot > 0 else np.nan
+
+        X20 = np.log(target_age) if mode == "log" else target_age
+        pred_20 = b * X20 + a
+
+        last_age = float(x[mask][-1]); last_val = float(yv[-1])
+        delta = float(pred_20 - last_val) if last_age < target_age else 0.0
+
+        n = int(X.size)
+        x_mean = float(np.mean(X))
+        sxx = float(np.sum((X - x_mean) ** 2))
+        resid_sd = float(np.sqrt(ss_res / (n - 2))) if n > 2 else np.nan
+        half = float(_pi_half_width(n, x_mean, sxx, resid_sd, X20))
+
+        res.update({"slope": float(b), "intercept": float(a), "r2": float(r2),
+                    "pred_at_20": float(pred_20), "last_age": last_age,
+                    "last_value": last_val, "delta_to_20": delta,
+                    "pi_low": float(pred_20 - half), "pi_high": float(pred_20 + half), "valid": True,
+                    "n": n, "x_mean": x_mean, "sxx": sxx, "resid_sd": resid_sd})
+        if bootstrap:
+            low, high = bootstrap_interval(x_age, y, target_age, mode, n_boot=bootstrap)
+            res.update(boot_low=low, boot_high=high)
+        return res
+    except Exception:
+        return res
+
+# =========================
+#  노모그램 백분위 (안축장)
+# =========================
+# 아이저노 백분위 데이터 (정확한 데이터) -- 모듈을 읽을 때 한 번만 만듭니다
+# 남성 데이터 (실제 아이저노 백분위)
+_MALE_NOMOGRAM = {
+    "age": [4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18],
+    "p3": [21.26, 21.49, 21.71, 21.91, 22.09, 22.27, 22.42, 22.56, 22.68, 22.78, 22.86, 22.91, 22.94, 22.95, 22.92],
+    "p5": [21.41, 21.64, 21.86, 22.07, 22.26, 22.44, 22.60, 22.75, 22.88, 22.99, 23.08, 23.15, 23.20, 23.23, 23.22],
+    "p10": [21.63, 21.87, 22.10, 22.32, 22.53, 22.72, 22.89, 23.05, 23.20, 23.33, 23.44, 23.53, 23.60, 23.66, 23.69],
+    "p25": [21.99, 22.26, 22.51, 22.75, 22.998, 23.19, 23.40, 23.58, 23.76, 23.92, 24.06, 24.19, 24.31, 24.41, 24.50],
+    "p50": [22.39, 22.69, 22.97, 23.25, 23.51, 23.76, 23.99, 24.22, 24.43, 24.62, 24.81, 24.98, 25.13, 25.28, 25.41],
+    "p75": [22.78, 23.12, 23.45, 23.76, 24.07, 24.36, 24.64, 24.90, 25.15, 25.39, 25.61, 25.82, 26.01, 26.18, 26.35],
+    "p90": [23.13, 23.51, 23.88, 24.24, 24.60, 24.93, 25.26, 25.57, 25.86, 26.14, 26.39, 26.63, 26.84, 27.04, 27.21],
+    "p95": [23.33, 23.74, 24.15, 24.54, 24.92, 25.30, 25.65, 25.99, 26.31, 26.61, 26.89, 27.14, 27.36, 27.56, 27.74],
+}
+
+# 여성 데이터 (실제 아이저노 백분위)
+_FEMALE_NOMOGRAM = {
+    "age": [4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18],
+    "p3": [20.74, 20.96, 21.17, 21.37, 21.56, 21.73, 21.89, 22.04, 22.18, 22.29, 22.40, 22.48, 22.55, 22.59, 22.61],
+    "p5": [20.87, 21.11, 21.33, 21.53, 21.73, 21.92, 22.09, 22.25, 22.39, 22.53, 22.64, 22.74, 22.82, 22.89, 22.93],
+    "p10": [21.08, 21.33, 21.56, 21.79, 22.00, 22.21, 22.40, 22.57, 22.73, 22.88, 23.02, 23.14, 23.24, 23.33, 23.41],
+    "p25": [21.41, 21.69, 21.96, 22.22, 22.46, 22.70, 22.92, 23.12, 23.31, 23.49, 23.66, 23.81, 23.95, 24.08, 24.19],
+    "p50": [21.78, 22.10, 22.41, 22.70, 22.98, 23.25, 23.51, 23.75, 23.97, 24.19, 24.39, 24.57, 24.75, 24.91, 25.05],
+    "p75": [22.14, 22.50, 22.85, 23.19, 23.51, 23.82, 24.11, 24.39, 24.65, 24.90, 25.13, 25.34, 25.54, 25.73, 25.89],
+    "p90": [22.46, 22.87, 23.26, 23.63, 23.99, 24.34, 24.67, 24.98, 25.28, 25.55, 25.81, 26.05, 26.27, 26.46, 26.64],
+    "p95": [22.66, 23.08, 23.50, 23.90, 24.28, 24.65, 25.01, 25.34, 25.66, 25.95, 26.22, 26.47, 26.70, 26.90, 27.08],
+}
+
+NOMOGRAM_CENTILES = (3, 5, 10, 25, 50, 75, 90, 95)
+# 각 백분위 곡선의 표준정규 z (Φ⁻¹(p/100))
+NOMOGRAM_Z = np.array([-1.880794, -1.644854, -1.281552, -0.674490, 0.0, 0.674490, 1.281552, 1.644854])
+NOMOGRAM_SEXES = ("M", "F")
+
+# 연속 노모그램 격자: 나이(세) x z, 나이 x 안축장(mm). 격자 밖 조회는 가장자리 값으로 고정
+SURFACE_AGE_RANGE = (3.0, 21.0, 0.05)
+SURFACE_Z_RANGE = (-4.0, 4.0, 0.01)
+SURFACE_AL_RANGE = (16.0, 32.0, 0.01)
+
+@lru_cache(maxsize=1)
+def get_axial_length_nomogram():
+    """
+    아이저노 백분위 데이터 (남성, 여성). 'age', 'p3' ~ 'p95' -> 튜플.
+    한 번 만든 읽기 전용 매핑을 계속 돌려주므로 차트에서 여러 번 불러도 다시 만들지 않습니다.
+    """
+    return tuple(MappingProxyType({k: tuple(v) for k, v in data.items()})
+                 for data in (_MALE_NOMOGRAM, _FEMALE_NOMOGRAM))
+
+_SEX_ALIASES = {"M": ("男", "남", "男性", "남성", "m", "male"), "F": ("女", "여", "女性", "여성", "f", "female")}
+_SEX_LOOKUP = {alias: sex for sex, aliases in _SEX_ALIASES.items() for alias in aliases + (sex,)}
+
+def normalize_sex(value) -> Optional[str]:
+    """'男' / '남' / 'M' / 'male' -> 'M', '女' / '여' / 'F' / 'female' -> 'F', 그 외 None"""
+    if not isinstance(value, str):
+        return None
+    value = value.strip()
+    return _SEX_LOOKUP.get(value) or _SEX_LOOKUP.get(value.lower())
+
+def is_male(value) -> bool:
+    return normalize_sex(value) == "M"
+
+def _sex_codes(sex, n: int) -> np.ndarray:
+    """성별(스칼라 또는 배열) -> 0(M) / 1(F) / -1(알 수 없음)"""
+    if np.ndim(sex) == 0:
+        return np.full(n, {"M": 0, "F": 1}.get(normalize_sex(sex), -1), dtype=int)
+    # 코호트: 고유 표기만 정규화해 되돌려 붙임
+    uniques, inverse = np.unique(np.asarray(sex, dtype=object).astype(str), return_inverse=True)
+    codes = np.array([{"M": 0, "F": 1}.get(normalize_sex(u), -1) for u in uniques], dtype=int)
+    return codes[inverse.reshape(-1)]
+
+def _pchip(x: np.ndarray, y: np.ndarray, xq: np.ndarray) -> np.ndarray:
+    """
+    단조 3차 에르미트 보간(Fritsch-Carlson PCHIP). y: (len(x), ...) 열마다 보간해 (len(xq), ...).
+    곡선이 표 값 사이에서 튀지 않고 단조성이 유지되며, x 범위 밖은 끝 기울기로 직선 연장합니다.
+    """
+    h = np.diff(x)
+    delta = np.diff(y, axis=0) / h.reshape((-1,) + (1,) * (y.ndim - 1))
+    d = np.zeros_like(y)
+    w1 = (2 * h[1:] + h[:-1]).reshape((-1,) + (1,) * (y.ndim - 1))
+    w2 = (h[1:] + 2 * h[:-1]).reshape(w1.shape)
+    same_sign = delta[:-1] * delta[1:] > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        d[1:-1] = np.where(same_sign, (w1 + w2) / (w1 / delta[:-1] + w2 / delta[1:]), 0.0)
+    for end, h0, h1, m0, m1 in ((0, h[0], h[1], delta[0], delta[1]), (-1, h[-1], h[-2], delta[-1], delta[-2])):
+        e = ((2 * h0 + h1) * m0 - h0 * m1) / (h0 + h1)
+        e = np.where(np.sign(e) != np.sign(m0), 0.0, e)
+        d[end] = np.where((np.sign(m0) != np.sign(m1)) & (np.abs(e) > np.abs(3 * m0)), 3 * m0, e)
+
+    xq = np.asarray(xq, dtype=float)
+    i = np.clip(np.searchsorted(x, xq, side="right") - 1, 0, len(x) - 2)
+    hi = h[i].reshape((-1,) + (1,) * (y.ndim - 1))
+    t = ((xq - x[i]) / h[i]).reshape(hi.shape)
+    inside = (t >= 0) & (t <= 1)
+    tc = np.clip(t, 0, 1)
+    h00, h10 = (1 + 2 * tc) * (1 - tc) ** 2, tc * (1 - tc) ** 2
+    h01, h11 = tc ** 2 * (3 - 2 * tc), tc ** 2 * (tc - 1)
+    out = h00 * y[i] + h10 * hi * d[i] + h01 * y[i + 1] + h11 * hi * d[i + 1]
+    # 범위 밖: 끝점에서 끝 기울기로 직선
+    left = y[0] + (xq.reshape(hi.shape) - x[0]) * d[0]
+    right = y[-1] + (xq.reshape(hi.shape) - x[-1]) * d[-1]
+    return np.where(inside, out, np.where(t < 0, left, right))
+
+def _grid(spec) -> np.ndarray:
+    start, stop, step = spec
+    return start + step * np.arange(int(round((stop - start) / step)) + 1)
+
+@dataclass(frozen=True)
+class NomogramSurface:
+    """
+    미리 계산한 연속 노모그램 (성별 2 x 나이 격자 x z 또는 안축장 격자, float32).
+    al_by_z[s, i, j]: 나이 ages[i], z zs[j]의 안축장, z_by_al[s, i, k]: 나이 ages[i], 안축장 als[k]의 z.
+    조회는 격자 위치 계산 + 이중 선형 보간뿐이라 크기와 무관하게 O(1)입니다.
+    """
+    ages: np.ndarray
+    zs: np.ndarray
+    als: np.ndarray
+    al_by_z: np.ndarray
+    z_by_al: np.ndarray
+
+@lru_cache(maxsize=1)
+def nomogram_surface() -> NomogramSurface:
+    """
+    표(4~18세, p3~p95)에서 격자를 한 번 만듭니다. 나이 방향은 PCHIP, 백분위 방향은 z 공간 PCHIP,
+    p3 아래/p95 위는 p5~p95 폭으로 추정한 SD로 직선 연장합니다. 꼬리의 SD는 나이에 따라 아래쪽은 누적 최솟값,
+    위쪽은 누적 최댓값을 써서 꼬리가 p3/p95 곡선보다 빨리 줄지 않게 합니다. z_by_al은 al_by_z 각 행의 역함수(±4에서 고정).
+    """
+    male, female = get_axial_length_nomogram()
+    table_ages = np.array(male["age"], dtype=float)
+    ages, zs, als = _grid(SURFACE_AGE_RANGE), _grid(SURFACE_Z_RANGE), _grid(SURFACE_AL_RANGE)
+    al_by_z = np.empty((2, ages.size, zs.size))
+    z_by_al = np.empty((2, ages.size, als.size))
+    inner = (zs >= NOMOGRAM_Z[0]) & (zs <= NOMOGRAM_Z[-1])
+    for s, data in enumerate((male, female)):
+        table = np.array([data[f"p{c}"] for c in NOMOGRAM_CENTILES]).T    # (나이 15, 백분위 8)
+        curves = _pchip(table_ages, table, ages)                            # (나이 격자, 8)
+        sd = (curves[:, -1] - curves[:, 1]) / (NOMOGRAM_Z[-1] - NOMOGRAM_Z[1])
+        surface = np.empty((ages.size, zs.size))
+        surface[:, inner] = _pchip(NOMOGRAM_Z, curves.T, zs[inner]).T
+        low, high = zs < NOMOGRAM_Z[0], zs > NOMOGRAM_Z[-1]
+        surface[:, low] = curves[:, :1] + (zs[low] - NOMOGRAM_Z[0]) * np.minimum.accumulate(sd)[:, None]
+        surface[:, high] = curves[:, -1:] + (zs[high] - NOMOGRAM_Z[-1]) * np.maximum.accumulate(sd)[:, None]
+        al_by_z[s] = surface
+        z_by_al[s] = [np.interp(als, row, zs) for row in surface]
+    al_by_z, z_by_al = al_by_z.astype(np.float32), z_by_al.astype(np.float32)
+    al_by_z.flags.writeable = False
+    z_by_al.flags.writeable = False
+    return NomogramSurface(ages, zs, als, al_by_z, z_by_al)
+
+def _grid_pos(grid: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """등간격 격자에서 (왼쪽 칸 번호, 칸 안 비율). 격자 밖은 가장자리로 고정"""
+    pos = np.clip((np.nan_to_num(values) - grid[0]) / (grid[1] - grid[0]), 0, grid.size - 1)
+    i = np.minimum(pos.astype(int), grid.size - 2)
+    return i, pos - i
+
+def _surface_lookup(table: np.ndarray, col_grid: np.ndarray, sex, ages, values) -> np.ndarray:
+    """table[성별, 나이, 값] 격자의 이중 선형 보간 (성별/나이/값이 없으면 NaN)"""
+    surface = nomogram_surface()
+    ages = np.atleast_1d(np.asarray(ages, dtype=float))
+    values = np.broadcast_to(np.asarray(values, dtype=float), ages.shape)
+    codes = _sex_codes(sex, ages.size)
+    s = np.clip(codes, 0, 1)
+    i, t = _grid_pos(surface.ages, ages)
+    j, u = _grid_pos(col_grid, values)
+    out = ((1 - t) * ((1 - u) * table[s, i, j] + u * table[s, i, j + 1])
+           + t * ((1 - u) * table[s, i + 1, j] + u * table[s, i + 1, j + 1]))
+    return np.where((codes >= 0) & np.isfinite(ages) & np.isfinite(values), out, np.nan)
+
+def al_zscore(sex, ages, al) -> np.ndarray:
+    """
+    (성별, 나이, 안축장) -> 연속 z (±4에서 고정). 미리 계산한 노모그램 격자에서 조회합니다.
+    sex는 하나 또는 ages와 같은 길이의 배열 (코호트 전체를 한 번에).
+    """
+    surface = nomogram_surface()
+    return _surface_lookup(surface.z_by_al, surface.als, sex, ages, al)
+
+def _normal_cdf(z) -> np.ndarray:
+    """표준정규 누적분포 (Abramowitz-Stegun 7.1.26 erf 근사, 오차 < 1e-7)"""
+    z = np.asarray(z, dtype=float)
+    x = np.abs(z) / np.sqrt(2.0)
+    t = 1.0 / (1.0 + 0.3275911 * x)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    erf = 1.0 - poly * np.exp(-x * x)
+    return 0.5 * (1.0 + np.sign(z) * erf)
+
+def al_centile(sex, ages, al) -> np.ndarray:
+    """(성별, 나이, 안축장) -> 연속 백분위 (0~100). al_zscore의 정규 누적분포"""
+    return 100.0 * _normal_cdf(al_zscore(sex, ages, al))
+
+def nomogram_al(sex, ages, z) -> np.ndarray:
+    """al_zscore의 역: (성별, 나이, z) -> 그 백분위 궤적 위의 안축장 (mm)"""
+    surface = nomogram_surface()
+    return _surface_lookup(surface.al_by_z, surface.zs, sex, ages, z)
+
+def _crossings(c: np.ndarray, centiles: Sequence[int] = NOMOGRAM_CENTILES) -> List[Tuple[int, int, int]]:
+    """백분위 배열에서 연속한 두 값 사이에 있는 곡선 (centile_crossings 참고)"""
+    out = []
+    for k in np.flatnonzero(np.isfinite(c[:-1]) & np.isfinite(c[1:])):
+        lo, hi = sorted((c[k], c[k + 1]))
+        direction = 1 if c[k + 1] > c[k] else -1
+        out += [(int(k + 1), p, direction) for p in centiles if lo < p <= hi]
+    return out
+
+def centile_crossings(sex, ages, al, centiles: Sequence[int] = NOMOGRAM_CENTILES) -> List[Tuple[int, int, int]]:
+    """
+    연속한 두 측정 사이에 넘어간 백분위 곡선 -> [(뒤 측정의 위치, 백분위, +1 상향 / -1 하향)].
+    측정은 나이순으로 넘기세요.
+    """
+    return _crossings(al_centile(sex, ages, al), centiles)
+
+def centile_predict(x_age: pd.Series, y: pd.Series, sex, target_age: float = TARGET_AGE):
+    """
+    백분위 추적 예측: 측정값마다 노모그램 z를 구하고, 마지막 측정의 z(현재 백분위)를 유지한 채
+    목표 나이의 안축장을 예측합니다. 예측구간은 환자 z 값들의 흩어짐(t * sd_z * sqrt(1 + 1/n))으로,
+    z_slope는 1년당 z 변화(백분위를 가로지르는 속도, 참고용)입니다.
+    trend_and_predict와 같은 키에 z_last, centile_last, z_slope, z_sd, crossings(주요 백분위 곡선을
+    가로지른 횟수), sex를 더해 반환합니다.
+    """
+    res = {"slope": np.nan, "intercept": np.nan, "r2": np.nan,
+           "pred_at_20": np.nan, "last_age": np.nan, "last_value": np.nan,
+           "delta_to_20": np.nan, "pi_low": np.nan, "pi_high": np.nan, "valid": False,
+           "mode": "centile", "n": 0, "sex": normalize_sex(sex),
+           "z_last": np.nan, "centile_last": np.nan, "z_slope": np.nan, "z_sd": np.nan, "crossings": 0}
+    if res["sex"] is None:
+        return res
+    x = np.array(x_age, dtype=float)
+    yv = np.array(y, dtype=float)
+    mask = np.isfinite(x) & np.isfinite(yv) & (x > 0)
+    x, yv = x[mask], yv[mask]
+    if x.size < 1:
+        return res
+    z = al_zscore(res["sex"], x, yv)
+    n = int(z.size)
+    z_last = float(z[-1])
+    pred = float(nomogram_al(res["sex"], target_age, z_last)[0])
+    last_age, last_val = float(x[-1]), float(yv[-1])
+    res.update({"pred_at_20": pred, "last_age": last_age, "last_value": last_val,
+                "delta_to_20": pred - last_val if last_age < target_age else 0.0, "valid": True, "n": n,
+                "z_last": z_last, "centile_last": float(_normal_cdf(z_last) * 100.0),
+                "crossings": len(_crossings(100.0 * _normal_cdf(z)))})
+    if n >= 2 and np.ptp(x) > 0:
+        res["z_slope"] = float(np.polyfit(x, z, 1)[0])
+        res["z_sd"] = float(np.std(z, ddof=1))
+        half = float(t_critical(n - 1) * res["z_sd"] * np.sqrt(1.0 + 1.0 / n))
+        res["pi_low"], res["pi_high"] = (float(v) for v in nomogram_al(res["sex"], [target_age] * 2,
+                                                                       [z_last - half, z_last + half]))
+    return res
+
+# =========================
+#  추천(heuristic) 모델: 최적 회귀 + 치료조정
+# =========================
+def treatment_adjustment_factor(remarks: List[str]) -> float:
+    """
+    치료/관리 옵션에 따른 진행 속도 조정 계수(작을수록 억제 강함).
+    여러 옵션이 함께 있을 때는 가장 강한 억제를 적용합니다.
+    """
+    if not isinstance(remarks, list) or not remarks:
+        return 1.0
+    applied = [TREATMENT_FACTORS.get(r, 1.0) for r in remarks]
+    return float(min(applied)) if applied else 1.0
+
+def _adjust_towards_last(value, last_value, factor):
+    """치료조정: 마지막 값에서의 진행량에 계수를 곱함 (예측치와 구간 경계에 똑같이 적용)"""
+    return last_value + (value - last_value) * factor
+
+def recommendation_predict(x_age: pd.Series, y: pd.Series, remarks_series: pd.Series, target_age: float = TARGET_AGE,
+                           bootstrap: int = 0):
+    """
+    - 선형/로그 회귀 중 설명력이 더 높은 모델을 자동 선택
+    - 마지막 시점의 치료/관리(remarks)에 따라 진행(delta)을 조정 (예측구간 경계도 같은 방식으로 조정)
+    """
+    res_linear = trend_and_predict(x_age, y, target_age=target_age, mode="linear")
+    res_log = trend_and_predict(x_age, y, target_age=target_age, mode="log")
+
+    choose_log = False
+    if res_log.get("valid") and res_linear.get("valid"):
+        # r2 높은 모델 선택 (동률이나 NaN이면 선형 유지)
+        if res_log["r2"] > res_linear["r2"]:
+            choose_log = True
+    elif res_log.get("valid") and not res_linear.get("valid"):
+        choose_log = True
+
+    chosen = res_log if choose_log else res_linear
+    if bootstrap:
+        chosen["boot_low"], chosen["boot_high"] = (
+            bootstrap_interval(x_age, y, target_age, chosen["mode"], n_boot=bootstrap) if chosen.get("valid")
+            else (np.nan, np.nan))
+    if not chosen.get("valid"):
+        return chosen | {"chosen_mode": None, "adjust_factor": 1.0}
+
+    # remarks는 최근 행 기준으로 조정 (리스트/튜플/배열/"a; b" 문자열은 저장소와 같은 규칙으로 변환)
+    last_remarks = []
+    if isinstance(remarks_series, pd.Series) and len(remarks_series) > 0:
+        last_remarks = remarks_lookup(remarks_series.iloc[-1:]).iloc[0]
+
+    factor = treatment_adjustment_factor(last_remarks)
+
+    # 유효한 적합이면 마지막 나이/값은 항상 유한값 (값 0.0도 그대로 사용)
+    last_age, last_val, delta = chosen["last_age"], chosen["last_value"], chosen["delta_to_20"]
+
+    out = dict(chosen)
+    if last_age < target_age and np.isfinite(last_val):
+        pred_adj = float(last_val + delta * factor)
+        for key in ("pi_low", "pi_high", "boot_low", "boot_high"):
+            if key in out:
+                out[key] = float(_adjust_towards_last(out[key], last_val, factor))
+    else:
+        pred_adj = float(chosen["pred_at_20"])
+
+    out.update({
+        "pred_at_20": pred_adj,
+        "delta_to_20": float(delta * factor),
+        "chosen_mode": "log" if choose_log else "linear",
+        "adjust_factor": factor,
+    })
+    return out
+
+# =========================
+#  일괄 (그룹별 닫힌 형태 최소제곱)
+# =========================
+def _group_fit(codes: np.ndarray, n_groups: int, age: np.ndarray, value: np.ndarray,
+               target_age: float, mode: str) -> dict:
+    """
+    codes로 정렬된(같은 그룹 안에서는 입력 순서 유지) 배열에서 그룹별 y = b*X + a 적합.
+    trend_and_predict와 같은 마스크/마지막 점/유효 조건을 씁니다. 반환: 컬럼별 길이 n_groups 배열
+    """
+    mask = np.isfinite(age) & np.isfinite(value)
+    if mode == "log":
+        mask &= age > 0
+    c, x_age, y = codes[mask], age[mask], value[mask]
+    X = np.log(x_age) if mode == "log" else x_age
+
+    n = np.bincount(c, minlength=n_groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mx = np.bincount(c, X, n_groups) / n
+        my = np.bincount(c, y, n_groups) / n
+        # 그룹 평균을 뺀 뒤 제곱합 (np.polyfit과 같은 수치 정밀도)
+        dx, dy = X - mx[c], y - my[c]
+        sxx = np.bincount(c, dx * dx, n_groups)
+        sxy = np.bincount(c, dx * dy, n_groups)
+        syy = np.bincount(c, dy * dy, n_groups)
+        b = sxy / sxx
+        a = my - b * mx
+        ss_res = np.bincount(c, (y - (b[c] * X + a[c])) ** 2, n_groups)
+        r2 = np.where(syy > 0, 1.0 - ss_res / syy, np.nan)
+        resid_sd = np.where(n > 2, np.sqrt(ss_res / (n - 2)), np.nan)
+    X20 = np.log(target_age) if mode == "log" else target_age
+    pred = b * X20 + a
+    half = _pi_half_width(n, mx, sxx, resid_sd, X20)
+
+    # 그룹별 마지막 점 (그룹 안 입력 순서 기준)
+    last_age = np.full(n_groups, np.nan)
+    last_value = np.full(n_groups, np.nan)
+    ends = np.flatnonzero(np.r_[c[1:] != c[:-1], True]) if len(c) else np.empty(0, dtype=int)
+    last_age[c[ends]] = x_age[ends]
+    last_value[c[ends]] = y[ends]
+
+    valid = (n >= 2) & (sxx > 0)
+    out = {
+        "n": n,
+        "slope": b, "intercept": a, "r2": r2, "pred_at_20": pred,
+        "last_age": last_age, "last_value": last_value,
+        "delta_to_20": np.where(last_age < target_age, pred - last_value, 0.0),
+        "pi_low": pred - half, "pi_high": pred + half,
+    }
+    for col in PREDICT_COLUMNS[1:-1]:
+        out[col] = np.where(valid, out[col], np.nan)
+    out["valid"] = valid
+    return out
+
+def batch_predict(df: pd.DataFrame, mode: str = "recommend", target_age: float = TARGET_AGE,
+                  group_cols: Sequence[str] = ("patient_id", "eye"), age_col: str = "age",
+                  value_col: str = "value", remarks_col: str = "remarks") -> pd.DataFrame:
+    """
+    long format 표의 그룹(기본: 환자 x 눈)마다 20세 예측. Python 반복 없이 전체를 한 번에 적합합니다.
+    그룹 안의 행 순서를 측정 순서로 보므로(마지막 점, 마지막 치료) 날짜순으로 넘기세요.
+    mode: "linear" / "log" -> trend_and_predict와 같은 컬럼,
+          "recommend" -> recommendation_predict와 같이 chosen_mode, adjust_factor 추가
+    반환: 그룹 컬럼 + n(적합에 쓴 점 수) + PREDICT_COLUMNS, 그룹은 처음 나온 순서
+    """
+    if mode not in PREDICT_MODES:
+        raise ValueError(f"알 수 없는 예측 모드: {mode}")
+    group_cols = list(group_cols)
+    codes = df.groupby(group_cols, sort=False, dropna=False).ngroup().to_numpy()
+    n_groups = int(codes.max()) + 1 if len(codes) else 0
+    order = np.argsort(codes, kind="stable")
+    codes = codes[order]
+    age = df[age_col].to_numpy(dtype="float64")[order]
+    value = df[value_col].to_numpy(dtype="float64")[order]
+    first = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if len(codes) else np.empty(0, dtype=int)
+    keys = df[group_cols].iloc[order[first]].reset_index(drop=True)
+
+    if mode != "recommend":
+        return pd.concat([keys, pd.DataFrame(_group_fit(codes, n_groups, age, value, target_age, mode))], axis=1)
+
+    lin = _group_fit(codes, n_groups, age, value, target_age, "linear")
+    log = _group_fit(codes, n_groups, age, value, target_age, "log")
+    # r2 높은 모델 선택 (동률이나 NaN이면 선형 유지), 선형이 무효이고 로그만 유효하면 로그
+    choose_log = log["valid"] & (~lin["valid"] | (log["r2"] > lin["r2"]))
+    out = {col: np.where(choose_log, log[col], lin[col]) for col in PREDICT_COLUMNS}
+
+    # 치료조정 계수: 그룹의 마지막 행(결측 값 포함) remarks 기준
+    if remarks_col in df.columns and n_groups:
+        ends = np.r_[first[1:] - 1, len(codes) - 1]
+        last_remarks = remarks_lookup(df[remarks_col].iloc[order[ends]])
+        factor = np.array([treatment_adjustment_factor(r) for r in last_remarks], dtype=float)
+    else:
+        factor = np.ones(n_groups)
+    valid = out["valid"]
+    factor = np.where(valid, factor, 1.0)
+    adjust = valid & (out["last_age"] < target_age) & np.isfinite(out["last_value"])
+    out["pred_at_20"] = np.where(adjust, out["last_value"] + out["delta_to_20"] * factor, out["pred_at_20"])
+    for col in ("pi_low", "pi_high"):
+        out[col] = np.where(adjust, _adjust_towards_last(out[col], out["last_value"], factor), out[col])
+    out["delta_to_20"] = out["delta_to_20"] * factor
+    out["chosen_mode"] = np.where(valid, np.where(choose_log, "log", "linear"), None)
+    out["adjust_factor"] = factor
+    return pd.concat([keys, pd.DataFrame(out)], axis=1)
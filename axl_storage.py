@@ -0,0 +1,1187 @@
+# -*- coding: utf-8 -*-
+"""
+환자 번들 저장소 (안축장/굴절이상/각막곡률/각막두께 + meta)
+"""
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing, contextmanager, nullcontext
+from pathlib import Path
+from typing import Optional, List
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    _HAS_PYARROW = True
+except ImportError:
+    pa = pq = None
+    _HAS_PYARROW = False
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+def safe_id(pid: str) -> str:
+    """환자 ID를 폴더 이름으로 쓸 수 있는 문자만 남김"""
+    return "".join(c for c in (pid or "").strip() if c.isalnum() or c in ("-", "_"))
+
+REMARK_OPTIONS = ["0.125% AT", "low-dose AT", "OK-lens", "DIMS", "HAL", "MR", "CR"]
+
+def remarks_to_str(remarks):
+    return "; ".join(remarks) if isinstance(remarks, list) and remarks else ""
+
+def normalize_remarks(raw: str) -> List[str]:
+    if not isinstance(raw, str) or not raw.strip():
+        return []
+    tokens = [t.strip() for t in raw.replace("/", ",").replace(";", ",").split(",")]
+    tokens = [t for t in tokens if t]
+    canon = []
+    for t in tokens:
+        if t in REMARK_OPTIONS:
+            canon.append(t); continue
+        tl = t.lower()
+        if tl in ["mg", "myo", "uard"]:
+            canon.append("0.125% AT")
+        elif tl in ["at", "low-dose at", "low dose at", "atropine", "ldat"]:
+            canon.append("low-dose AT")
+        elif tl in ["ok", "ok lens", "ortho-k", "orthok", "ok-lens"]:
+            canon.append("OK-lens")
+        elif tl == "dims":
+            canon.append("DIMS")
+        elif tl == "hal":
+            canon.append("HAL")
+        elif tl in ["mr", "manifest refraction", "manifest"]:
+            canon.append("MR")
+        elif tl in ["cr", "cycloplegic refraction", "cycloplegic", "auto"]:
+            canon.append("CR")
+    out = []
+    for x in REMARK_OPTIONS:
+        if x in canon and x not in out:
+            out.append(x)
+    return out
+
+def _as_remark_list(x) -> List[str]:
+    if isinstance(x, list):
+        return [str(r) for r in x]
+    if isinstance(x, (tuple, np.ndarray)):
+        return [str(r) for r in x]
+    if isinstance(x, str):
+        return normalize_remarks(x)
+    return []
+
+def remarks_lookup(values: pd.Series) -> pd.Series:
+    """
+    remarks 컬럼을 리스트로 일괄 변환.
+    문자열은 고유값만 normalize_remarks로 한 번씩 파싱한 뒤 조회표로 매핑합니다.
+    """
+    raw = values.tolist()
+    table = {u: normalize_remarks(u) for u in {v for v in raw if isinstance(v, str)}}
+    # 같은 리스트 객체를 공유하지 않도록 행마다 복사
+    out = [list(table[v]) if isinstance(v, str) else _as_remark_list(v) for v in raw]
+    return pd.Series(out, index=values.index, dtype="object")
+
+# =========================
+#  모달리티 스키마 (파일/컬럼/타입/기본값)
+# =========================
+def _schema(stem: str, values: List[str]) -> dict:
+    return {
+        "stem": stem,
+        "columns": ["date", *values, "remarks"],
+        "dtypes": {"date": "datetime64[ns]", **{c: "float64" for c in values}, "remarks": "object"},
+        "defaults": {"date": pd.NaT, **{c: np.nan for c in values}, "remarks": list},
+    }
+
+# kind -> 파일 이름(확장자 제외), 컬럼 순서, dtype, 기본값. 세션 키는 f"data_{kind}"
+MODALITIES = {
+    "axl": _schema("data", ["OD_mm","OS_mm","OD_K1","OD_K2","OD_meanK","OS_K1","OS_K2","OS_meanK"]),
+    "re":  _schema("re_data", ["OD_sph","OD_cyl","OD_axis","OS_sph","OS_cyl","OS_axis","OD_SE","OS_SE"]),
+    "k":   _schema("k_data", ["OD_K1","OD_K2","OD_meanK","OS_K1","OS_K2","OS_meanK"]),
+    "ct":  _schema("ct_data", ["OD_ct","OS_ct"]),
+}
+
+def value_columns(kind: str) -> List[str]:
+    return [c for c in MODALITIES[kind]["columns"] if c not in ("date", "remarks")]
+
+def empty_frame(kind: str) -> pd.DataFrame:
+    """스키마 dtype을 갖춘 빈 프레임"""
+    spec = MODALITIES[kind]
+    return pd.DataFrame(columns=spec["columns"]).astype(spec["dtypes"])
+
+def _coerce_frame(kind: str, df: pd.DataFrame) -> pd.DataFrame:
+    """읽어온 프레임을 스키마 컬럼/타입에 맞춰 정리 (컬럼 단위 한 번씩, 새 프레임은 한 번에 생성)"""
+    spec = MODALITIES[kind]
+    n = len(df)
+    cols = {}
+    for c, dtype in spec["dtypes"].items():
+        if c not in df.columns:
+            default = spec["defaults"][c]
+            if callable(default):
+                cols[c] = np.empty(n, dtype=object)
+                for i in range(n):
+                    cols[c][i] = default()
+            else:
+                cols[c] = np.full(n, default, dtype=dtype)
+        elif c == "remarks":
+            cols[c] = remarks_lookup(df[c]).to_numpy()
+        elif df[c].dtype == dtype:
+            cols[c] = df[c].to_numpy()
+        elif c == "date":
+            cols[c] = pd.to_datetime(df[c], errors="coerce").to_numpy(dtype=dtype)
+        else:
+            # 빈 셀("")이 object 타입으로 남지 않도록 숫자로 변환
+            cols[c] = pd.to_numeric(df[c], errors="coerce").to_numpy(dtype=dtype)
+    out = pd.DataFrame(cols, index=df.index, columns=spec["columns"])
+    return out.sort_values("date")
+
+def _prepare_for_write(kind: str, df: pd.DataFrame) -> pd.DataFrame:
+    out = df.copy()
+    if "remarks" not in out.columns:
+        out["remarks"] = [[] for _ in range(len(out))]
+    out = _coerce_frame(kind, out)
+    return out.reset_index(drop=True)
+
+# =========================
+#  원자적 쓰기 / 환자별 잠금
+# =========================
+LOCK_FILE = ".lock"
+VERSION_FILE = "version"
+LOCK_TIMEOUT = 10.0
+_LOCK_POLL = 0.05
+
+class BundleLockTimeout(TimeoutError):
+    pass
+
+def atomic_write(path: Path, write_fn) -> None:
+    """
+    임시 파일에 쓰고 fsync 후 os.replace로 교체.
+    동시에 읽는 쪽이나 중간에 중단된 경우에도 반쯤 쓴 파일이 보이지 않습니다.
+    """
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{time.monotonic_ns()}.tmp")
+    try:
+        write_fn(tmp)
+        with open(tmp, "rb+") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+    # 디렉토리 항목도 디스크에 반영 (Windows는 디렉토리 fsync 불가)
+    if fcntl is not None:
+        fd = os.open(path.parent, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+def _write_json(path: Path, obj) -> None:
+    def _dump(tmp: Path):
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(obj, f, ensure_ascii=False, default=str)
+    atomic_write(path, _dump)
+
+def _try_lock(fd: int, shared: bool) -> bool:
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | fcntl.LOCK_NB)
+        else:
+            # msvcrt에는 공유 잠금이 없어 읽기도 배타 잠금으로 처리
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+def _unlock(fd: int) -> None:
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+@contextmanager
+def file_lock(lock_path: Path, shared: bool = False, timeout: float = LOCK_TIMEOUT):
+    """권고 잠금: 읽기는 공유(shared=True), 쓰기는 배타. timeout 초과 시 BundleLockTimeout"""
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        deadline = time.monotonic() + timeout
+        while not _try_lock(fd, shared):
+            if time.monotonic() >= deadline:
+                raise BundleLockTimeout(f"잠금 대기 시간 초과: {lock_path}")
+            time.sleep(_LOCK_POLL)
+        try:
+            yield
+        finally:
+            _unlock(fd)
+    finally:
+        os.close(fd)
+
+def bundle_lock(pdir: Path, backend: Optional["BundleBackend"] = None, shared: bool = False,
+                timeout: float = LOCK_TIMEOUT):
+    """환자 폴더 잠금 (pdir/.lock). SQLite 모드는 DB 자체 잠금을 사용하므로 아무것도 하지 않음"""
+    backend = backend or get_backend()
+    if not backend.uses_file_lock:
+        return nullcontext()
+    return file_lock(pdir / LOCK_FILE, shared=shared, timeout=timeout)
+
+# =========================
+#  저장 백엔드
+# =========================
+class BundleBackend:
+    """
+    환자 폴더(pdir) 단위의 저장 백엔드.
+    meta는 모든 백엔드에서 meta.json 으로 저장합니다.
+    """
+    name = ""
+    suffix = ""
+    uses_file_lock = True
+
+    def path(self, pdir: Path, kind: str) -> Path:
+        return pdir / f"{MODALITIES[kind]['stem']}{self.suffix}"
+
+    def read_frame(self, pdir: Path, kind: str) -> Optional[pd.DataFrame]:
+        raise NotImplementedError
+
+    def frame_files(self, pdir: Path, kind: str) -> List[Path]:
+        return [self.path(pdir, kind)]
+
+    def stamp(self, pdir: Path, kind: str) -> tuple:
+        """캐시 검증용: 모달리티 파일과 저널의 (mtime, 크기)"""
+        out = []
+        for f in [*self.frame_files(pdir, kind), pdir / JOURNAL_FILE]:
+            try:
+                st_ = f.stat()
+                out.append((st_.st_mtime_ns, st_.st_size))
+            except FileNotFoundError:
+                out.append(None)
+        return tuple(out)
+
+    def needs_migration(self, pdir: Path, kind: str) -> bool:
+        """이전 형식 파일만 있어 migrate_frame이 필요한지 (기본: 없음)"""
+        return False
+
+    def migrate_frame(self, pdir: Path, kind: str) -> bool:
+        """이전 형식 파일을 현재 형식으로 옮김. 쓰기이므로 배타 잠금 안에서 호출. 옮겼으면 True"""
+        return False
+
+    def read_columns(self, pdir: Path, kind: str, columns: List[str]) -> Optional[pd.DataFrame]:
+        """스냅샷에서 일부 컬럼만 읽기 (저널 미반영). 기본은 전체를 읽어 자름"""
+        df = self.read_frame(pdir, kind)
+        return None if df is None else df[columns]
+
+    def has_frame(self, pdir: Path, kind: str) -> bool:
+        """파일을 읽지 않고 데이터 유무만 확인 (저널 기록이 있으면 True)"""
+        for f in self.frame_files(pdir, kind):
+            if f.exists() and f.stat().st_size > 0:
+                return True
+        return any(e.get("kind") == kind for e in read_journal(pdir))
+
+    def write_frame(self, pdir: Path, kind: str, df: pd.DataFrame) -> None:
+        raise NotImplementedError
+
+    def read_meta(self, pdir: Path) -> Optional[dict]:
+        f_meta = pdir / "meta.json"
+        if not f_meta.exists() or f_meta.stat().st_size == 0:
+            return None
+        with open(f_meta, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def write_meta(self, pdir: Path, meta: dict) -> None:
+        _write_json(pdir / "meta.json", meta)
+
+    def update_meta(self, pdir: Path, meta: dict) -> bool:
+        """디스크의 meta와 (JSON으로 저장되는 값 기준) 다를 때만 기록. 기록했으면 True"""
+        if json.loads(json.dumps(meta, ensure_ascii=False, default=str)) == self.read_meta(pdir):
+            return False
+        self.write_meta(pdir, meta)
+        return True
+
+    def read_version(self, pdir: Path) -> int:
+        """번들 버전 (저장/기록할 때마다 1씩 증가, 없으면 0). 저널 기록의 버전은 저널 마지막 줄에 있음"""
+        try:
+            version = int((pdir / VERSION_FILE).read_text(encoding="utf-8").strip() or 0)
+        except (FileNotFoundError, ValueError):
+            version = 0
+        return max(version, _journal_version(pdir))
+
+    def write_version(self, pdir: Path, version: int) -> None:
+        atomic_write(pdir / VERSION_FILE, lambda tmp: tmp.write_text(str(version), encoding="utf-8"))
+
+    def bump_version(self, pdir: Path) -> int:
+        version = self.read_version(pdir) + 1
+        self.write_version(pdir, version)
+        return version
+
+    def exists(self, pdir: Path) -> bool:
+        return pdir.exists()
+
+    def list_ids(self, root: Path) -> List[str]:
+        if not root.exists():
+            return []
+        return sorted([p.name for p in root.iterdir() if p.is_dir()])
+
+    def record(self, pdir: Path, kind: str, added: Optional[pd.DataFrame] = None,
+               deleted: Optional[list] = None, clear: bool = False) -> tuple:
+        """
+        입력/삭제를 저널에 추가하고 (저널 길이(줄 수), 번들 버전)을 반환.
+        새 버전은 저널 줄에 함께 적으므로 기록 한 번이 파일 쓰기 한 번입니다 (version 파일은 그대로).
+        """
+        version = self.read_version(pdir) + 1
+        n_entries = 0
+        if clear:
+            n_entries = journal_clear(pdir, kind, version)
+        if deleted:
+            n_entries = journal_delete(pdir, kind, deleted, version)
+        if added is not None and not added.empty:
+            n_entries = journal_add(pdir, kind, added, version)
+        return n_entries, version if n_entries else version - 1
+
+    def _index_entries(self, root: Path) -> Optional[dict]:
+        """
+        환자 ID -> 색인 항목. 스냅샷(patient_index.json)에 추가 기록(patient_index.jsonl)을 덧씌움 (환자별 마지막 줄 우선).
+        스냅샷이 그대로면 지난번에 읽은 위치 이후의 기록만 읽습니다. 둘 다 없으면 None
+        """
+        f_index, f_log = root / PATIENT_INDEX_FILE, root / PATIENT_INDEX_LOG
+        snap = _file_stamp(f_index)
+        log_size = f_log.stat().st_size if f_log.exists() else 0
+        if snap is None and not log_size:
+            return None
+        key = str(f_index)
+        cached = _INDEX_CACHE.get(key)
+        if cached is None or cached[0] != snap or log_size < cached[1]:
+            entries = {}
+            if snap is not None:
+                with open(f_index, "r", encoding="utf-8") as f:
+                    entries = json.load(f)
+            offset, df = 0, None
+        else:
+            _, offset, entries, df = cached
+        if log_size > offset:
+            with open(f_log, "rb") as f:
+                f.seek(offset)
+                data = f.read(log_size - offset)
+            # 기록 중인 마지막 줄(개행 전)은 다음에 읽음
+            end = data.rfind(b"\n") + 1
+            entries = dict(entries)
+            for line in data[:end].splitlines():
+                try:
+                    r = json.loads(line)
+                except ValueError:
+                    continue
+                entries[r["patient_id"]] = r
+            offset, df = offset + end, None
+        _INDEX_CACHE[key] = (snap, offset, entries, df)
+        return entries
+
+    def read_index(self, root: Path) -> Optional[pd.DataFrame]:
+        """환자 색인 읽기 (스냅샷 + 추가 기록). 색인 파일이 없으면 None"""
+        entries = self._index_entries(root)
+        if entries is None:
+            return None
+        snap, offset, _, df = _INDEX_CACHE[str(root / PATIENT_INDEX_FILE)]
+        if df is None:
+            df = pd.DataFrame(list(entries.values()), columns=INDEX_COLUMNS)
+            _INDEX_CACHE[str(root / PATIENT_INDEX_FILE)] = (snap, offset, entries, df)
+        return df
+
+    def write_index(self, root: Path, df: pd.DataFrame) -> None:
+        """색인 전체를 스냅샷으로 기록하고 추가 기록을 비움 (INDEX_LOCK_FILE 잠금 안에서 호출)"""
+        entries = {r["patient_id"]: r for r in _index_records(df)}
+        root.mkdir(parents=True, exist_ok=True)
+        _write_json(root / PATIENT_INDEX_FILE, entries)
+        (root / PATIENT_INDEX_LOG).unlink(missing_ok=True)
+
+    def update_index(self, root: Path, summary: dict) -> None:
+        """
+        환자 한 명의 색인 항목을 추가 기록에 한 줄 덧붙임 (색인 전체를 다시 쓰지 않음).
+        updated_at 말고 바뀐 값이 없으면 기록하지 않고, 기록이 쌓이면 스냅샷으로 압축합니다.
+        """
+        entry = _index_records(pd.DataFrame([summary], columns=INDEX_COLUMNS))[0]
+        current = (self._index_entries(root) or {}).get(entry["patient_id"])
+        if current is not None and all(current.get(c) == entry[c] for c in INDEX_COLUMNS if c != "updated_at"):
+            return
+        # 압축과 겹치지 않도록 잠금은 한 줄 추가하는 동안만
+        with file_lock(root / INDEX_LOCK_FILE):
+            n_lines = _append_jsonl(root / PATIENT_INDEX_LOG, entry)
+            if n_lines >= INDEX_LOG_COMPACT_THRESHOLD:
+                self.write_index(root, self.read_index(root))
+
+class CsvBackend(BundleBackend):
+    """기존 CSV 형식 (remarks는 '; ' 구분 문자열)"""
+    name = "csv"
+    suffix = ".csv"
+
+    def read_frame(self, pdir: Path, kind: str) -> Optional[pd.DataFrame]:
+        f = self.path(pdir, kind)
+        if not f.exists() or f.stat().st_size == 0:
+            return None
+        return _coerce_frame(kind, self._read_csv(f, kind))
+
+    @staticmethod
+    def _read_csv(f: Path, kind: str) -> pd.DataFrame:
+        # 숫자 컬럼은 빈 셀만 NaN, remarks는 문자열 그대로 (스키마 dtype으로 한 번에 파싱)
+        values = value_columns(kind)
+        try:
+            return pd.read_csv(f, dtype={c: "float64" for c in values} | {"remarks": str},
+                               keep_default_na=False, na_values={c: ["", "nan", "NaN"] for c in values})
+        except ValueError:
+            # 숫자 컬럼에 문자가 섞인 파일은 문자열로 읽어 _coerce_frame에서 변환
+            return pd.read_csv(f, na_filter=False)
+
+    def read_columns(self, pdir: Path, kind: str, columns: List[str]) -> Optional[pd.DataFrame]:
+        f = self.path(pdir, kind)
+        if not f.exists() or f.stat().st_size == 0:
+            return None
+        return pd.read_csv(f, usecols=lambda c: c in columns, na_filter=False)
+
+    def write_frame(self, pdir: Path, kind: str, df: pd.DataFrame) -> None:
+        out = _prepare_for_write(kind, df)
+        out["remarks"] = out["remarks"].apply(remarks_to_str)
+        atomic_write(self.path(pdir, kind), lambda tmp: out.to_csv(tmp, index=False))
+
+class ParquetBackend(BundleBackend):
+    """
+    Parquet 컬럼 형식 (remarks는 list<string> 컬럼).
+    Parquet 파일이 없고 CSV만 있으면 CSV를 읽고, migrate_frame(배타 잠금)에서 Parquet으로 옮겨 저장합니다.
+    """
+    name = "parquet"
+    suffix = ".parquet"
+
+    def __init__(self):
+        self._legacy = CsvBackend()
+
+    def frame_files(self, pdir: Path, kind: str) -> List[Path]:
+        return [self.path(pdir, kind), self._legacy.path(pdir, kind)]
+
+    @staticmethod
+    def _schema(kind: str):
+        fields = []
+        for c in MODALITIES[kind]["columns"]:
+            if c == "date":
+                fields.append(pa.field(c, pa.timestamp("ns")))
+            elif c == "remarks":
+                fields.append(pa.field(c, pa.list_(pa.string())))
+            else:
+                fields.append(pa.field(c, pa.float64()))
+        return pa.schema(fields)
+
+    def read_frame(self, pdir: Path, kind: str) -> Optional[pd.DataFrame]:
+        f = self.path(pdir, kind)
+        if not f.exists() or f.stat().st_size == 0:
+            # 읽기 경로에서는 쓰지 않음 (공유 잠금만 잡은 상태일 수 있으므로)
+            return self._legacy.read_frame(pdir, kind)
+        df = pq.read_table(f).to_pandas()
+        return _coerce_frame(kind, df)
+
+    def needs_migration(self, pdir: Path, kind: str) -> bool:
+        f, legacy = self.path(pdir, kind), self._legacy.path(pdir, kind)
+        return (not f.exists() or f.stat().st_size == 0) and legacy.exists() and legacy.stat().st_size > 0
+
+    def migrate_frame(self, pdir: Path, kind: str) -> bool:
+        # 잠금을 잡은 뒤 다시 확인 (다른 세션이 먼저 옮겼을 수 있음). 원본 CSV는 그대로 둠
+        if not self.needs_migration(pdir, kind):
+            return False
+        df_legacy = self._legacy.read_frame(pdir, kind)
+        if df_legacy is None:
+            return False
+        self.write_frame(pdir, kind, df_legacy)
+        return True
+
+    def read_columns(self, pdir: Path, kind: str, columns: List[str]) -> Optional[pd.DataFrame]:
+        f = self.path(pdir, kind)
+        if not f.exists() or f.stat().st_size == 0:
+            # 요약만 할 때는 CSV -> Parquet 이전을 하지 않음
+            return self._legacy.read_columns(pdir, kind, columns)
+        return pq.read_table(f, columns=columns).to_pandas()
+
+    def write_frame(self, pdir: Path, kind: str, df: pd.DataFrame) -> None:
+        out = _prepare_for_write(kind, df)
+        table = pa.Table.from_pandas(out, schema=self._schema(kind), preserve_index=False)
+        atomic_write(self.path(pdir, kind), lambda tmp: pq.write_table(table, tmp))
+
+# =========================
+#  환자 색인 (사이드바 목록/검색용 요약)
+# =========================
+PATIENT_INDEX_FILE = "patient_index.json"
+# 환자별 색인 갱신은 여기에 한 줄씩 추가하고, 일정 개수가 쌓이면 스냅샷으로 압축
+PATIENT_INDEX_LOG = "patient_index.jsonl"
+INDEX_LOG_COMPACT_THRESHOLD = 200
+INDEX_LOCK_FILE = ".index.lock"
+INDEX_COLUMNS = ["patient_id", "name", "sex", "dob", "last_exam", "od_al", "os_al", "n_rows", "updated_at"]
+# 스냅샷 경로 -> (스냅샷 stamp, 읽은 추가 기록 위치, 항목 dict, DataFrame 또는 None)
+_INDEX_CACHE = {}
+
+def _file_stamp(path: Path) -> Optional[tuple]:
+    try:
+        st_ = path.stat()
+    except FileNotFoundError:
+        return None
+    return (st_.st_ino, st_.st_mtime_ns, st_.st_size)
+
+def _index_records(df: pd.DataFrame) -> List[dict]:
+    records = []
+    for r in df[INDEX_COLUMNS].to_dict("records"):
+        records.append({k: (None if (not isinstance(v, str) and pd.isna(v)) else v) for k, v in r.items()})
+    return records
+
+def summarize_bundle(pid: str, meta: Optional[dict], frames: dict) -> dict:
+    """환자 한 명의 색인 항목: 이름/성별/생년월일, 마지막 검사일, 최근 OD/OS 안축장"""
+    meta = meta or {}
+    last_exam = None
+    n_rows = 0
+    for df in frames.values():
+        if df is None or df.empty:
+            continue
+        n_rows += len(df)
+        d = pd.to_datetime(df["date"], errors="coerce").max()
+        if pd.notna(d) and (last_exam is None or d > last_exam):
+            last_exam = d
+    od_al = os_al = None
+    df_axl = frames.get("axl")
+    if df_axl is not None and not df_axl.empty:
+        df_axl = df_axl.sort_values("date")
+        for col in ("OD_mm", "OS_mm"):
+            vals = pd.to_numeric(df_axl[col], errors="coerce").dropna() if col in df_axl.columns else pd.Series(dtype=float)
+            if not vals.empty:
+                if col == "OD_mm":
+                    od_al = float(vals.iloc[-1])
+                else:
+                    os_al = float(vals.iloc[-1])
+    dob = meta.get("dob")
+    return {
+        "patient_id": pid,
+        "name": meta.get("name"),
+        "sex": meta.get("sex"),
+        "dob": str(dob) if dob else None,
+        "last_exam": last_exam.date().isoformat() if last_exam is not None else None,
+        "od_al": od_al,
+        "os_al": os_al,
+        "n_rows": n_rows,
+        "updated_at": pd.Timestamp.now().isoformat(timespec="seconds"),
+    }
+
+# 색인 요약에 쓰는 컬럼 (summarize_bundle)
+SUMMARY_COLUMNS = {kind: ["date", "OD_mm", "OS_mm"] if kind == "axl" else ["date"] for kind in MODALITIES}
+
+def load_summary_frame(pdir: Path, kind: str, backend: Optional[BundleBackend] = None) -> Optional[pd.DataFrame]:
+    """
+    색인 요약용 최소 컬럼만 읽기 (지연 로딩 중 아직 읽지 않은 모달리티용).
+    저널에 이 모달리티 기록이 있으면 스냅샷만으로는 부족하므로 전체를 읽어 반영합니다.
+    """
+    backend = backend or get_backend()
+    if any(e.get("kind") == kind for e in read_journal(pdir)):
+        df = load_frame(pdir, kind, backend)
+        return None if df is None else df[SUMMARY_COLUMNS[kind]]
+    return backend.read_columns(pdir, kind, SUMMARY_COLUMNS[kind])
+
+def rebuild_index(root: Path, backend: Optional[BundleBackend] = None) -> pd.DataFrame:
+    """모든 번들을 한 번 읽어 색인을 새로 만들기 (색인이 없을 때만 사용)"""
+    backend = backend or get_backend()
+    rows = []
+    for pid in backend.list_ids(root):
+        pdir = root / pid
+        meta = backend.read_meta(pdir)
+        if meta is None:
+            continue
+        rows.append(summarize_bundle(pid, meta, load_frames(pdir, backend)))
+    df = pd.DataFrame(rows, columns=INDEX_COLUMNS)
+    backend.write_index(root, df)
+    return df
+
+def load_patient_index(root: Path, backend: Optional[BundleBackend] = None) -> pd.DataFrame:
+    backend = backend or get_backend()
+    df = backend.read_index(root)
+    if df is None:
+        lock = file_lock(root / INDEX_LOCK_FILE) if backend.uses_file_lock else nullcontext()
+        with lock:
+            df = backend.read_index(root)
+            if df is None:
+                df = rebuild_index(root, backend)
+    return df
+
+# =========================
+#  추가 전용 저널 (journal.jsonl)
+# =========================
+# 입력/삭제는 저널에 한 줄씩 추가하고, 일정 개수가 쌓이면 스냅샷으로 압축합니다.
+JOURNAL_FILE = "journal.jsonl"
+JOURNAL_COMPACT_THRESHOLD = 50
+
+def _row_to_json(row: dict) -> dict:
+    out = {}
+    for k, v in row.items():
+        if k == "date":
+            out[k] = pd.Timestamp(v).isoformat() if pd.notna(v) else None
+        elif k == "remarks":
+            out[k] = _as_remark_list(v)
+        elif v is None or (isinstance(v, float) and not np.isfinite(v)):
+            out[k] = None
+        else:
+            out[k] = float(v) if isinstance(v, (int, float, np.number)) else v
+    return out
+
+# jsonl 경로 -> (마지막으로 추가한 뒤의 파일 크기, 줄 수). 매번 파일 전체를 세지 않기 위함
+_JOURNAL_LINES = {}
+
+def _append_jsonl(path: Path, entry: dict) -> int:
+    """
+    jsonl 파일에 한 줄 추가 후 현재 줄 수를 반환.
+    파일이 마지막 추가 때 크기 그대로면 기억한 줄 수 + 1, 새 파일이면 1,
+    그 밖(재시작, 다른 프로세스의 기록)에만 파일을 한 번 다시 셉니다.
+    """
+    line = (json.dumps(entry, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+    with open(path, "ab") as f:
+        start = f.tell()
+        f.write(line)
+        f.flush()
+        os.fsync(f.fileno())
+    key = str(path)
+    cached = _JOURNAL_LINES.get(key)
+    if start == 0:
+        n = 1
+    elif cached is not None and cached[0] == start:
+        n = cached[1] + 1
+    else:
+        with open(path, "rb") as f:
+            n = sum(1 for _ in f)
+    _JOURNAL_LINES[key] = (start + len(line), n)
+    return n
+
+def _append_journal(pdir: Path, entry: dict, version: Optional[int] = None) -> int:
+    """저널에 한 줄 추가 후 현재 저널 길이(줄 수)를 반환. version이 있으면 그 줄에 함께 기록"""
+    if version is not None:
+        entry = {**entry, "version": version}
+    return _append_jsonl(pdir / JOURNAL_FILE, entry)
+
+def journal_add(pdir: Path, kind: str, df_new: pd.DataFrame, version: Optional[int] = None) -> int:
+    cols = [c for c in MODALITIES[kind]["columns"] if c in df_new.columns]
+    rows = [_row_to_json(r) for r in df_new[cols].to_dict("records")]
+    return _append_journal(pdir, {"op": "add", "kind": kind, "rows": rows}, version)
+
+def journal_delete(pdir: Path, kind: str, dates, version: Optional[int] = None) -> int:
+    dates = [pd.Timestamp(d).isoformat() for d in dates if pd.notna(d)]
+    return _append_journal(pdir, {"op": "delete", "kind": kind, "dates": dates}, version)
+
+def journal_clear(pdir: Path, kind: str, version: Optional[int] = None) -> int:
+    return _append_journal(pdir, {"op": "clear", "kind": kind}, version)
+
+def _journal_version(pdir: Path) -> int:
+    """저널 마지막 줄의 번들 버전 (없으면 0). 파일 끝에서 마지막 한두 줄만 읽음"""
+    try:
+        f = open(pdir / JOURNAL_FILE, "rb")
+    except FileNotFoundError:
+        return 0
+    with f:
+        pos = f.seek(0, os.SEEK_END)
+        tail = b""
+        # 기록 도중 중단된 마지막 줄이 있어도 그 앞의 온전한 줄까지 포함되도록 개행 두 개
+        while pos > 0 and tail.count(b"\n") < 2:
+            step = min(4096, pos)
+            pos -= step
+            f.seek(pos)
+            tail = f.read(step) + tail
+    lines = tail.splitlines()
+    if pos > 0:
+        lines = lines[1:]
+    for line in reversed(lines):
+        try:
+            return int(json.loads(line).get("version") or 0)
+        except ValueError:
+            continue
+    return 0
+
+def _drop_journal(pdir: Path, backend: BundleBackend) -> None:
+    """스냅샷에 반영한 저널 삭제. 저널 줄에만 있던 버전은 먼저 version 파일로 옮김"""
+    if _journal_version(pdir):
+        backend.write_version(pdir, backend.read_version(pdir))
+    (pdir / JOURNAL_FILE).unlink(missing_ok=True)
+
+def read_journal(pdir: Path) -> List[dict]:
+    f_journal = pdir / JOURNAL_FILE
+    if not f_journal.exists():
+        return []
+    entries = []
+    with open(f_journal, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                # 기록 도중 중단된 마지막 줄은 무시
+                continue
+    return entries
+
+def replay_journal(frames: dict, entries: List[dict]) -> dict:
+    """
+    스냅샷 프레임 위에 저널을 순서대로 적용.
+    같은 날짜는 나중 기록이 우선합니다 (drop_duplicates(keep="last")와 동일).
+    """
+    touched = {}
+    for e in entries:
+        kind = e.get("kind")
+        if kind not in MODALITIES:
+            continue
+        if kind not in touched:
+            base = frames.get(kind)
+            touched[kind] = {} if base is None else {
+                r["date"]: r for r in base.to_dict("records")
+            }
+        rows = touched[kind]
+        op = e.get("op")
+        if op == "add":
+            for r in e.get("rows", []):
+                d = pd.Timestamp(r.get("date"))
+                rows.pop(d, None)
+                rows[d] = dict(r, date=d)
+        elif op == "delete":
+            for d in e.get("dates", []):
+                rows.pop(pd.Timestamp(d), None)
+        elif op == "clear":
+            rows.clear()
+    out = dict(frames)
+    for kind, rows in touched.items():
+        df = pd.DataFrame(list(rows.values()), columns=MODALITIES[kind]["columns"])
+        out[kind] = _coerce_frame(kind, df).drop_duplicates(subset=["date"], keep="last").reset_index(drop=True)
+    return out
+
+def load_frames(pdir: Path, backend: Optional[BundleBackend] = None) -> dict:
+    """스냅샷 + 저널을 읽어 kind -> DataFrame (없으면 None) 반환"""
+    backend = backend or get_backend()
+    frames = {kind: backend.read_frame(pdir, kind) for kind in MODALITIES}
+    entries = read_journal(pdir)
+    if entries:
+        frames = replay_journal(frames, entries)
+    return frames
+
+# =========================
+#  지연 로딩 번들
+# =========================
+# (backend, pdir, kind) -> (stamp, DataFrame)
+_FRAME_CACHE = {}
+
+def load_frame(pdir: Path, kind: str, backend: Optional[BundleBackend] = None) -> Optional[pd.DataFrame]:
+    """모달리티 하나만 스냅샷 + 저널로 읽기. 파일 mtime이 같으면 캐시 재사용"""
+    backend = backend or get_backend()
+    key = (backend.name, str(pdir), kind)
+    stamp = backend.stamp(pdir, kind)
+    cached = _FRAME_CACHE.get(key)
+    if cached is None or cached[0] != stamp:
+        df = backend.read_frame(pdir, kind)
+        entries = [e for e in read_journal(pdir) if e.get("kind") == kind]
+        if entries:
+            df = replay_journal({kind: df}, entries)[kind]
+        cached = (stamp, df)
+        _FRAME_CACHE[key] = cached
+    return None if cached[1] is None else cached[1].copy()
+
+class LazyBundle:
+    """
+    환자 번들을 모달리티별로 처음 접근할 때만 읽습니다.
+    같은 파일은 모듈 캐시(_FRAME_CACHE)를 통해 재실행 간에 재사용합니다.
+    """
+    def __init__(self, pdir: Path, backend: Optional[BundleBackend] = None):
+        self.pdir = Path(pdir)
+        self.backend = backend or get_backend()
+
+    def get(self, kind: str) -> Optional[pd.DataFrame]:
+        if self.backend.needs_migration(self.pdir, kind):
+            # CSV -> Parquet 이전은 배타 잠금에서. 다른 세션이 잡고 있으면 기다리지 않고 이번에는 CSV를 읽음
+            try:
+                with bundle_lock(self.pdir, self.backend, timeout=0):
+                    self.backend.migrate_frame(self.pdir, kind)
+            except BundleLockTimeout:
+                pass
+        with bundle_lock(self.pdir, self.backend, shared=True):
+            return load_frame(self.pdir, kind, self.backend)
+
+    def has(self, kind: str) -> bool:
+        return self.backend.has_frame(self.pdir, kind)
+
+def write_bundle(pdir: Path, frames: dict, meta: dict, backend: Optional[BundleBackend] = None) -> None:
+    """
+    전체 스냅샷 저장. 비어 있는 모달리티는 디스크(스냅샷+저널) 상태를 유지하고(이전 형식 CSV만 있으면 옮김),
+    저장 후 저널을 비웁니다.
+    """
+    backend = backend or get_backend()
+    disk = load_frames(pdir, backend) if read_journal(pdir) else {}
+    for kind in MODALITIES:
+        df = frames.get(kind)
+        if df is not None and not df.empty:
+            backend.write_frame(pdir, kind, df)
+        elif disk.get(kind) is not None:
+            backend.write_frame(pdir, kind, disk[kind])
+        else:
+            backend.migrate_frame(pdir, kind)
+    backend.write_meta(pdir, meta)
+    _drop_journal(pdir, backend)
+
+# =========================
+#  동시 편집 병합 (date 기준 3-way)
+# =========================
+def _row_map(kind: str, df: Optional[pd.DataFrame]) -> dict:
+    """date -> 비교용 행 튜플 (NaN/remarks 정규화)"""
+    if df is None or df.empty:
+        return {}
+    df = _coerce_frame(kind, df.copy()).drop_duplicates(subset=["date"], keep="last")
+    out = {}
+    for r in df.to_dict("records"):
+        if pd.isna(r["date"]):
+            continue
+        out[r["date"]] = tuple(
+            tuple(v) if c == "remarks" else (None if pd.isna(v) else float(v))
+            for c, v in r.items() if c != "date"
+        )
+    return out
+
+def merge_frames(kind: str, base: Optional[pd.DataFrame], ours: Optional[pd.DataFrame],
+                 theirs: Optional[pd.DataFrame]):
+    """
+    세션이 불러온 시점(base) 이후 이 세션(ours)과 다른 세션(theirs)의 변경을 date 기준으로 병합.
+    한쪽만 바꾼 행은 그쪽을 따르고, 같은 날짜를 양쪽이 다르게 바꾼 경우만 충돌로 보고
+    drop_duplicates(keep="last")처럼 이 세션의 값을 남깁니다.
+    반환: (병합된 DataFrame, 충돌 날짜 목록)
+    """
+    b, o, t = _row_map(kind, base), _row_map(kind, ours), _row_map(kind, theirs)
+    ours_changed = {d for d in o if b.get(d) != o[d]}
+    ours_deleted = {d for d in b if d not in o}
+    theirs_changed = {d for d in t if b.get(d) != t[d]}
+    theirs_deleted = {d for d in b if d not in t}
+    conflicts = sorted(
+        {d for d in ours_changed & theirs_changed if o[d] != t[d]}
+        | (ours_changed & theirs_deleted)
+        | (ours_deleted & theirs_changed)
+    )
+    parts = [df for df in (theirs, ours) if df is not None and not df.empty]
+    if not parts:
+        return empty_frame(kind), conflicts
+    df_t = _coerce_frame(kind, theirs.copy()) if theirs is not None else empty_frame(kind)
+    df_o = _coerce_frame(kind, ours.copy()) if ours is not None else empty_frame(kind)
+    merged = pd.concat([df_t, df_o[df_o["date"].isin(ours_changed)]], ignore_index=True)
+    merged = merged.drop_duplicates(subset=["date"], keep="last")
+    merged = merged[~merged["date"].isin(ours_deleted - theirs_changed)]
+    return _coerce_frame(kind, merged).reset_index(drop=True), conflicts
+
+def save_bundle_merged(pdir: Path, frames: dict, meta: dict, base_frames: dict, base_version: int,
+                       backend: Optional[BundleBackend] = None):
+    """
+    버전이 불러온 시점과 같으면 그대로 저장하고, 다르면 디스크 상태와 3-way 병합 후 저장.
+    호출하는 쪽에서 bundle_lock(배타)을 잡은 상태여야 합니다.
+    반환: (저장된 frames, 새 버전, {kind: 충돌 날짜 목록})
+    """
+    backend = backend or get_backend()
+    conflicts = {}
+    if backend.read_version(pdir) != base_version:
+        theirs = load_frames(pdir, backend)
+        merged = {}
+        for kind in MODALITIES:
+            merged[kind], c = merge_frames(kind, base_frames.get(kind), frames.get(kind), theirs.get(kind))
+            if c:
+                conflicts[kind] = c
+        frames = merged
+    write_bundle(pdir, frames, meta, backend)
+    return frames, backend.bump_version(pdir), conflicts
+
+def compact_journal(pdir: Path, backend: Optional[BundleBackend] = None) -> Optional[dict]:
+    """저널을 스냅샷에 반영하고 저널 파일을 삭제. 반영한 frames 반환 (저널이 없으면 None)"""
+    backend = backend or get_backend()
+    if not read_journal(pdir):
+        return None
+    frames = load_frames(pdir, backend)
+    for kind, df in frames.items():
+        if df is not None:
+            backend.write_frame(pdir, kind, df)
+    _drop_journal(pdir, backend)
+    return frames
+
+# =========================
+#  SQLite 저장소 (전체 환자 단일 DB)
+# =========================
+SQLITE_DB_NAME = "patients.sqlite3"
+
+def _sqlite_type(col: str) -> str:
+    if col == "date" or col == "remarks":
+        return "TEXT"
+    return "REAL"
+
+def _sqlite_schema() -> str:
+    """모든 테이블/색인 (IF NOT EXISTS라 연결할 때마다 실행해도 됨)"""
+    stmts = []
+    for kind, spec in MODALITIES.items():
+        cols = ", ".join(f'"{c}" {_sqlite_type(c)}' for c in spec["columns"])
+        stmts.append(f'CREATE TABLE IF NOT EXISTS "{kind}" (patient_id TEXT NOT NULL, {cols})')
+        stmts.append(f'CREATE INDEX IF NOT EXISTS "idx_{kind}_pid_date" ON "{kind}" (patient_id, date)')
+    stmts += [
+        "CREATE TABLE IF NOT EXISTS meta (patient_id TEXT PRIMARY KEY, name TEXT, sex TEXT, dob TEXT, meta TEXT)",
+        "CREATE TABLE IF NOT EXISTS patient_index (patient_id TEXT PRIMARY KEY, name TEXT, sex TEXT, dob TEXT,"
+        " last_exam TEXT, od_al REAL, os_al REAL, n_rows INTEGER, updated_at TEXT)",
+        "CREATE TABLE IF NOT EXISTS versions (patient_id TEXT PRIMARY KEY, version INTEGER NOT NULL)",
+    ]
+    return ";\n".join(stmts) + ";"
+
+_SQLITE_SCHEMA = _sqlite_schema()
+
+class SqliteBackend(BundleBackend):
+    """
+    데이터 루트의 patients.sqlite3 하나에 모든 환자를 저장.
+    모달리티별 테이블(axl/re/k/ct)과 meta 테이블은 (patient_id, date)로 색인됩니다.
+    환자 ID는 폴더 이름(pdir.name), DB 위치는 그 상위 폴더입니다.
+    DB 파일을 새로 만들 때 기존 폴더 번들을 자동으로 가져오고, 그 뒤에 생긴 폴더 번들은
+    import_dirs(root)로 가져옵니다 (DB에 없는 환자만이라 여러 번 실행해도 됨).
+    """
+    name = "sqlite"
+    uses_file_lock = False
+
+    @staticmethod
+    def _db_path(root: Path) -> Path:
+        return root / SQLITE_DB_NAME
+
+    def _connect(self, root: Path) -> sqlite3.Connection:
+        db_path = self._db_path(root)
+        is_new = not db_path.exists()
+        root.mkdir(parents=True, exist_ok=True)
+        con = sqlite3.connect(db_path, timeout=30)
+        # 실행 중에 DB 파일이 지워지거나 바뀌어도 테이블이 있도록 연결마다 (IF NOT EXISTS라 가벼움)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.executescript(_SQLITE_SCHEMA)
+        if is_new:
+            self._import_dirs(con, root)
+        return con
+
+    def import_dirs(self, root: Path) -> int:
+        """아직 DB에 없는 폴더 번들을 가져오기. 가져온 환자 수 반환"""
+        with closing(self._connect(root)) as con:
+            return self._import_dirs(con, root)
+
+    def _import_dirs(self, con: sqlite3.Connection, root: Path) -> int:
+        """폴더 번들(Parquet/CSV + 저널)을 DB로 가져오기 (meta가 이미 있는 환자는 건너뜀)"""
+        file_backend = STORAGE_BACKENDS["parquet" if _HAS_PYARROW else "csv"]()
+        known = {r[0] for r in con.execute("SELECT patient_id FROM meta")}
+        # 색인이 아직 없으면(재생성 대상) 가져온 환자만 넣지 않음
+        add_index = not known or con.execute("SELECT 1 FROM patient_index LIMIT 1").fetchone() is not None
+        n = 0
+        for pid in BundleBackend.list_ids(self, root):
+            pdir = root / pid
+            meta = file_backend.read_meta(pdir) if pid not in known else None
+            if meta is None:
+                continue
+            frames = load_frames(pdir, file_backend)
+            for kind, df in frames.items():
+                if df is not None and not df.empty:
+                    self._insert(con, pid, kind, df)
+            self._upsert_meta(con, pid, meta)
+            if add_index:
+                self._upsert_index(con, summarize_bundle(pid, meta, frames))
+            n += 1
+        con.commit()
+        return n
+
+    @staticmethod
+    def _rows(pid: str, kind: str, df: pd.DataFrame) -> list:
+        out = _prepare_for_write(kind, df)
+        rows = []
+        for r in out.to_dict("records"):
+            row = [pid]
+            for c in MODALITIES[kind]["columns"]:
+                v = r[c]
+                if c == "date":
+                    row.append(pd.Timestamp(v).isoformat() if pd.notna(v) else None)
+                elif c == "remarks":
+                    row.append(json.dumps(_as_remark_list(v), ensure_ascii=False))
+                else:
+                    row.append(float(v) if pd.notna(v) else None)
+            rows.append(row)
+        return rows
+
+    def _insert(self, con: sqlite3.Connection, pid: str, kind: str, df: pd.DataFrame) -> None:
+        cols = MODALITIES[kind]["columns"]
+        rows = self._rows(pid, kind, df)
+        # 같은 날짜는 새 값으로 교체 (drop_duplicates(keep="last")와 동일)
+        con.executemany(f'DELETE FROM "{kind}" WHERE patient_id = ? AND date = ?', [(pid, r[1]) for r in rows])
+        placeholders = ", ".join("?" for _ in range(len(cols) + 1))
+        col_sql = ", ".join(f'"{c}"' for c in cols)
+        con.executemany(f'INSERT INTO "{kind}" (patient_id, {col_sql}) VALUES ({placeholders})', rows)
+
+    @staticmethod
+    def _upsert_meta(con: sqlite3.Connection, pid: str, meta: dict) -> None:
+        con.execute(
+            "INSERT OR REPLACE INTO meta (patient_id, name, sex, dob, meta) VALUES (?, ?, ?, ?, ?)",
+            (pid, meta.get("name"), meta.get("sex"),
+             str(meta.get("dob")) if meta.get("dob") else None,
+             json.dumps(meta, ensure_ascii=False, default=str)),
+        )
+
+    @staticmethod
+    def _to_frame(kind: str, df: pd.DataFrame) -> pd.DataFrame:
+        df["remarks"] = df["remarks"].apply(lambda s: json.loads(s) if isinstance(s, str) and s else [])
+        return _coerce_frame(kind, df)
+
+    def read_frame(self, pdir: Path, kind: str) -> Optional[pd.DataFrame]:
+        col_sql = ", ".join(f'"{c}"' for c in MODALITIES[kind]["columns"])
+        with closing(self._connect(pdir.parent)) as con:
+            df = pd.read_sql_query(
+                f'SELECT {col_sql} FROM "{kind}" WHERE patient_id = ? ORDER BY date', con, params=(pdir.name,)
+            )
+        if df.empty:
+            return None
+        return self._to_frame(kind, df).reset_index(drop=True)
+
+    def read_columns(self, pdir: Path, kind: str, columns: List[str]) -> Optional[pd.DataFrame]:
+        col_sql = ", ".join(f'"{c}"' for c in columns)
+        with closing(self._connect(pdir.parent)) as con:
+            df = pd.read_sql_query(
+                f'SELECT {col_sql} FROM "{kind}" WHERE patient_id = ? ORDER BY date', con, params=(pdir.name,)
+            )
+        return None if df.empty else df
+
+    def write_frame(self, pdir: Path, kind: str, df: pd.DataFrame) -> None:
+        with closing(self._connect(pdir.parent)) as con, con:
+            con.execute(f'DELETE FROM "{kind}" WHERE patient_id = ?', (pdir.name,))
+            self._insert(con, pdir.name, kind, df)
+
+    def stamp(self, pdir: Path, kind: str) -> tuple:
+        db = self._db_path(pdir.parent)
+        return tuple(
+            (f.stat().st_mtime_ns, f.stat().st_size) if f.exists() else None
+            for f in (db, db.with_name(db.name + "-wal"))
+        )
+
+    def has_frame(self, pdir: Path, kind: str) -> bool:
+        if kind not in MODALITIES:
+            raise ValueError(f"알 수 없는 모달리티: {kind}")
+        with closing(self._connect(pdir.parent)) as con:
+            return con.execute(f'SELECT 1 FROM "{kind}" WHERE patient_id = ? LIMIT 1', (pdir.name,)).fetchone() is not None
+
+    def read_meta(self, pdir: Path) -> Optional[dict]:
+        with closing(self._connect(pdir.parent)) as con:
+            row = con.execute("SELECT meta FROM meta WHERE patient_id = ?", (pdir.name,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def write_meta(self, pdir: Path, meta: dict) -> None:
+        with closing(self._connect(pdir.parent)) as con, con:
+            self._upsert_meta(con, pdir.name, meta)
+
+    def read_version(self, pdir: Path) -> int:
+        with closing(self._connect(pdir.parent)) as con:
+            row = con.execute("SELECT version FROM versions WHERE patient_id = ?", (pdir.name,)).fetchone()
+        return row[0] if row else 0
+
+    def write_version(self, pdir: Path, version: int) -> None:
+        with closing(self._connect(pdir.parent)) as con, con:
+            con.execute("INSERT OR REPLACE INTO versions (patient_id, version) VALUES (?, ?)", (pdir.name, version))
+
+    def bump_version(self, pdir: Path) -> int:
+        with closing(self._connect(pdir.parent)) as con, con:
+            return self._bump_version(con, pdir.name)
+
+    @staticmethod
+    def _bump_version(con: sqlite3.Connection, pid: str) -> int:
+        con.execute(
+            "INSERT INTO versions (patient_id, version) VALUES (?, 1)"
+            " ON CONFLICT(patient_id) DO UPDATE SET version = version + 1",
+            (pid,),
+        )
+        return con.execute("SELECT version FROM versions WHERE patient_id = ?", (pid,)).fetchone()[0]
+
+    def exists(self, pdir: Path) -> bool:
+        return self.read_meta(pdir) is not None
+
+    def list_ids(self, root: Path) -> List[str]:
+        with closing(self._connect(root)) as con:
+            return [r[0] for r in con.execute("SELECT patient_id FROM meta ORDER BY patient_id")]
+
+    def record(self, pdir: Path, kind: str, added: Optional[pd.DataFrame] = None,
+               deleted: Optional[list] = None, clear: bool = False) -> tuple:
+        """행 단위로 바로 반영하고 같은 트랜잭션에서 버전 증가 (저널 불필요, 저널 길이는 항상 0)"""
+        pid = pdir.name
+        with closing(self._connect(pdir.parent)) as con, con:
+            if clear:
+                con.execute(f'DELETE FROM "{kind}" WHERE patient_id = ?', (pid,))
+            if deleted:
+                con.executemany(f'DELETE FROM "{kind}" WHERE patient_id = ? AND date = ?',
+                                [(pid, pd.Timestamp(d).isoformat()) for d in deleted if pd.notna(d)])
+            if added is not None and not added.empty:
+                self._insert(con, pid, kind, added)
+            return 0, self._bump_version(con, pid)
+
+    def read_index(self, root: Path) -> Optional[pd.DataFrame]:
+        with closing(self._connect(root)) as con:
+            df = pd.read_sql_query(f"SELECT {', '.join(INDEX_COLUMNS)} FROM patient_index", con)
+            n_meta = con.execute("SELECT COUNT(*) FROM meta").fetchone()[0]
+        # 색인이 비어 있는데 환자가 있으면 재생성 필요
+        if df.empty and n_meta:
+            return None
+        return df
+
+    def write_index(self, root: Path, df: pd.DataFrame) -> None:
+        with closing(self._connect(root)) as con, con:
+            con.execute("DELETE FROM patient_index")
+            con.executemany(
+                f"INSERT INTO patient_index ({', '.join(INDEX_COLUMNS)}) VALUES ({', '.join('?' for _ in INDEX_COLUMNS)})",
+                [tuple(r[c] for c in INDEX_COLUMNS) for r in _index_records(df)],
+            )
+
+    def update_index(self, root: Path, summary: dict) -> None:
+        with closing(self._connect(root)) as con, con:
+            self._upsert_index(con, summary)
+
+    @staticmethod
+    def _upsert_index(con: sqlite3.Connection, summary: dict) -> None:
+        con.execute(
+            f"INSERT OR REPLACE INTO patient_index ({', '.join(INDEX_COLUMNS)}) VALUES ({', '.join('?' for _ in INDEX_COLUMNS)})",
+            tuple(summary.get(c) for c in INDEX_COLUMNS),
+        )
+
+    def query(self, root: Path, kind: str, patient_ids: Optional[list] = None,
+              date_from=None, date_to=None) -> pd.DataFrame:
+        """
+        여러 환자에 걸친 조회 (patient_id 컬럼 포함).
+        조건은 모두 (patient_id, date) 색인을 사용합니다.
+        """
+        cols = MODALITIES[kind]["columns"]
+        where, params = [], []
+        if patient_ids:
+            where.append(f"patient_id IN ({', '.join('?' for _ in patient_ids)})")
+            params.extend(patient_ids)
+        if date_from is not None:
+            where.append("date >= ?")
+            params.append(pd.Timestamp(date_from).isoformat())
+        if date_to is not None:
+            where.append("date <= ?")
+            params.append(pd.Timestamp(date_to).isoformat())
+        col_sql = ", ".join(f'"{c}"' for c in cols)
+        sql = f'SELECT patient_id, {col_sql} FROM "{kind}"'
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY patient_id, date"
+        with closing(self._connect(root)) as con:
+            df = pd.read_sql_query(sql, con, params=params)
+        pids = df.pop("patient_id")
+        df = self._to_frame(kind, df)
+        df.insert(0, "patient_id", pids.loc[df.index].values)
+        return df.sort_values(["patient_id", "date"]).reset_index(drop=True)
+
+STORAGE_BACKENDS = {
+    "csv": CsvBackend,
+    "parquet": ParquetBackend,
+    "sqlite": SqliteBackend,
+}
+
+def get_backend(name: Optional[str] = None) -> BundleBackend:
+    """
+    저장 백엔드 반환. 이름이 없으면 환경변수 AXL_STORAGE_BACKEND,
+    그것도 없으면 parquet (pyarrow 미설치 시 csv)을 사용합니다.
+    """
+    name = (name or os.environ.get("AXL_STORAGE_BACKEND") or ("parquet" if _HAS_PYARROW else "csv")).lower()
+    if name == "parquet" and not _HAS_PYARROW:
+        name = "csv"
+    if name not in STORAGE_BACKENDS:
+        raise ValueError(f"알 수 없는 저장 백엔드: {name}")
+    return STORAGE_BACKENDS[name]()
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
+from collections import OrderedDict
 from datetime import date
 from typing import Optional, List
 import json
@@ -17,6 +18,23 @@ import pytesseract, shutil, os
 import re
 from PIL import Image
 
+from axl_storage import (
+    REMARK_OPTIONS, MODALITIES, JOURNAL_COMPACT_THRESHOLD, empty_frame, remarks_to_str, normalize_remarks, get_backend,
+    compact_journal, summarize_bundle, load_summary_frame, load_patient_index, LazyBundle,
+    bundle_lock, BundleLockTimeout, save_bundle_merged, safe_id,
+)
+from axl_ocr import (
+    list_image_files, refractor_text_from_regions, parse_refractor_text, parse_keratometry_text,
+    parse_pachymetry_text, MIN_CONFIDENCE,
+    DEVICE_TEMPLATES, AXL_DEVICES,
+    submit_text_job, submit_axl_job, submit_roi_job, submit_batch_job, get_job, discard_job, is_pdf,
+)
+from axl_bulk import write_patient, finalize_patient
+from axl_predict import (
+    trend_and_predict, recommendation_predict, centile_predict, prediction_band, get_axial_length_nomogram,
+    nomogram_al, normalize_sex, is_male, BOOTSTRAP_SAMPLES,
+)
+
 # 사용자 인증 모듈 import
 try:
     import sys
@@ -96,43 +114,6 @@ matplotlib.rcParams["axes.unicode_minus"] = False
 DATA_ROOT = Path("./axl_data")
 DATA_ROOT.mkdir(parents=True, exist_ok=True)
 
-REMARK_OPTIONS = ["0.125% AT", "low-dose AT", "OK-lens", "DIMS", "HAL", "MR", "CR"]
-
-def _safe_id(pid: str) -> str:
-    return "".join(c for c in (pid or "").strip() if c.isalnum() or c in ("-", "_"))
-
-def remarks_to_str(remarks):
-    return "; ".join(remarks) if isinstance(remarks, list) and remarks else ""
-
-def normalize_remarks(raw: str) -> List[str]:
-    if not isinstance(raw, str) or not raw.strip():
-        return []
-    tokens = [t.strip() for t in raw.replace("/", ",").replace(";", ",").split(",")]
-    tokens = [t for t in tokens if t]
-    canon = []
-    for t in tokens:
-        if t in REMARK_OPTIONS:
-            canon.append(t); continue
-        tl = t.lower()
-        if tl in ["mg", "myo", "uard"]:
-            canon.append("0.125% AT")
-        elif tl in ["at", "low-dose at", "low dose at", "atropine", "ldat"]:
-            canon.append("low-dose AT")
-        elif tl in ["ok", "ok lens", "ortho-k", "orthok", "ok-lens"]:
-            canon.append("OK-lens")
-        elif tl == "dims":
-            canon.append("DIMS")
-        elif tl == "hal":
-            canon.append("HAL")
-        elif tl in ["mr", "manifest refraction", "manifest"]:
-            canon.append("MR")
-        elif tl in ["cr", "cycloplegic refraction", "cycloplegic", "auto"]:
-            canon.append("CR")
-    out = []
-    for x in REMARK_OPTIONS:
-        if x in canon and x not in out:
-            out.append(x)
-    return out
 def clear_input_defaults():
     """입력창의 기본값들을 초기화하는 함수"""
     # 안축장 기본값 초기화
@@ -154,41 +135,12 @@ def clear_input_defaults():
     # 비고 기본값 초기화
     st.session_state.default_settings["tab1_default_remarks"] = []
 # 안축장 nomogram 데이터 추가
-def get_axial_length_nomogram():
-    """아이저노 백분위 데이터를 반환하는 함수 (정확한 데이터)"""
-    # 남성 데이터 (실제 아이저노 백분위)
-    male_data = {
-        'age': [4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18],
-        'p3': [21.26, 21.49, 21.71, 21.91, 22.09, 22.27, 22.42, 22.56, 22.68, 22.78, 22.86, 22.91, 22.94, 22.95, 22.92],
-        'p5': [21.41, 21.64, 21.86, 22.07, 22.26, 22.44, 22.60, 22.75, 22.88, 22.99, 23.08, 23.15, 23.20, 23.23, 23.22],
-        'p10': [21.63, 21.87, 22.10, 22.32, 22.53, 22.72, 22.89, 23.05, 23.20, 23.33, 23.44, 23.53, 23.60, 23.66, 23.69],
-        'p25': [21.99, 22.26, 22.51, 22.75, 22.998, 23.19, 23.40, 23.58, 23.76, 23.92, 24.06, 24.19, 24.31, 24.41, 24.50],
-        'p50': [22.39, 22.69, 22.97, 23.25, 23.51, 23.76, 23.99, 24.22, 24.43, 24.62, 24.81, 24.98, 25.13, 25.28, 25.41],
-        'p75': [22.78, 23.12, 23.45, 23.76, 24.07, 24.36, 24.64, 24.90, 25.15, 25.39, 25.61, 25.82, 26.01, 26.18, 26.35],
-        'p90': [23.13, 23.51, 23.88, 24.24, 24.60, 24.93, 25.26, 25.57, 25.86, 26.14, 26.39, 26.63, 26.84, 27.04, 27.21],
-        'p95': [23.33, 23.74, 24.15, 24.54, 24.92, 25.30, 25.65, 25.99, 26.31, 26.61, 26.89, 27.14, 27.36, 27.56, 27.74]
-    }
-    
-    # 여성 데이터 (실제 아이저노 백분위)
-    female_data = {
-        'age': [4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18],
-        'p3': [20.74, 20.96, 21.17, 21.37, 21.56, 21.73, 21.89, 22.04, 22.18, 22.29, 22.40, 22.48, 22.55, 22.59, 22.61],
-        'p5': [20.87, 21.11, 21.33, 21.53, 21.73, 21.92, 22.09, 22.25, 22.39, 22.53, 22.64, 22.74, 22.82, 22.89, 22.93],
-        'p10': [21.08, 21.33, 21.56, 21.79, 22.00, 22.21, 22.40, 22.57, 22.73, 22.88, 23.02, 23.14, 23.24, 23.33, 23.41],
-        'p25': [21.41, 21.69, 21.96, 22.22, 22.46, 22.70, 22.92, 23.12, 23.31, 23.49, 23.66, 23.81, 23.95, 24.08, 24.19],
-        'p50': [21.78, 22.10, 22.41, 22.70, 22.98, 23.25, 23.51, 23.75, 23.97, 24.19, 24.39, 24.57, 24.75, 24.91, 25.05],
-        'p75': [22.14, 22.50, 22.85, 23.19, 23.51, 23.82, 24.11, 24.39, 24.65, 24.90, 25.13, 25.34, 25.54, 25.73, 25.89],
-        'p90': [22.46, 22.87, 23.26, 23.63, 23.99, 24.34, 24.67, 24.98, 25.28, 25.55, 25.81, 26.05, 26.27, 26.46, 26.64],
-        'p95': [22.66, 23.08, 23.50, 23.90, 24.28, 24.65, 25.01, 25.34, 25.66, 25.95, 26.22, 26.47, 26.70, 26.90, 27.08]
-    }
-    
-    return male_data, female_data
 def add_nomogram_background(fig, patient_sex, patient_ages=None):
     """Plotly 차트에 nomogram 백분위 곡선을 배경으로 추가"""
     male_data, female_data = get_axial_length_nomogram()
     
     # 患者の性別に応じてデータ選択
-    nomogram_data = male_data if patient_sex == "男" else female_data
+    nomogram_data = male_data if is_male(patient_sex) else female_data
     
     # 색상 설정 (연한 색상으로 배경 표시)
     colors = {
@@ -229,139 +181,163 @@ def add_nomogram_background(fig, patient_sex, patient_ages=None):
     
     return fig
     
+def _bundle_dir(pid: str) -> Path:
+    # 사용자별 데이터 디렉토리 사용
+    if is_logged_in():
+        return get_user_specific_data_path(pid)
+    return DATA_ROOT / pid
+
+def _data_root() -> Path:
+    return st.session_state.user_data_dir if is_logged_in() else DATA_ROOT
+
+def _get_data(kind: str) -> pd.DataFrame:
+    """세션의 모달리티 프레임. 불러온 환자의 파일은 처음 접근할 때 한 번만 읽음"""
+    bundle = st.session_state.get("bundle")
+    loaded = st.session_state.setdefault("loaded_kinds", set())
+    if bundle is not None and kind not in loaded:
+        df = bundle.get(kind)
+        if df is not None:
+            st.session_state[f"data_{kind}"] = df
+            # 저장 시 3-way 병합의 기준(base)
+            st.session_state.base_frames[kind] = df.copy()
+        loaded.add(kind)
+    return st.session_state[f"data_{kind}"]
+
+def _has_data(kind: str) -> bool:
+    # 아직 읽지 않은 모달리티는 파일 유무만 확인
+    bundle = st.session_state.get("bundle")
+    if bundle is not None and kind not in st.session_state.get("loaded_kinds", set()):
+        return bundle.has(kind)
+    return not st.session_state[f"data_{kind}"].empty
+
+def _session_kinds(pdir: Path) -> list:
+    """
+    세션 데이터가 그 폴더의 현재 상태를 대표하는 모달리티.
+    불러온 번들이 없거나 다른 환자 폴더면 전부, 같은 환자면 이미 읽은 모달리티만 (나머지는 디스크 그대로)
+    """
+    bundle = st.session_state.get("bundle")
+    if bundle is None or bundle.pdir != pdir:
+        return list(MODALITIES)
+    loaded = st.session_state.get("loaded_kinds", set())
+    return [kind for kind in MODALITIES if kind in loaded]
+
+def _base_for(pdir: Path):
+    # 세션이 불러온 환자와 같은 폴더일 때만 불러온 시점의 데이터/버전을 병합 기준으로 사용
+    if st.session_state.get("bundle_dir") == str(pdir):
+        return st.session_state.base_frames, st.session_state.bundle_version
+    return {}, 0
+
+def _set_base(pdir: Path, version: int, kinds) -> None:
+    if st.session_state.get("bundle_dir") != str(pdir):
+        st.session_state.base_frames = {}
+    st.session_state.bundle_dir = str(pdir)
+    st.session_state.bundle_version = version
+    for kind in kinds:
+        st.session_state.base_frames[kind] = st.session_state[f"data_{kind}"].copy()
+
+def _update_index(pid: str, backend) -> None:
+    # 세션의 현재 데이터로 환자 색인 항목만 갱신 (전체 폴더 재탐색 없음)
+    # 아직 읽지 않은 모달리티는 날짜(AXL은 OD/OS)만 읽어 요약
+    pdir = _bundle_dir(pid)
+    kinds = _session_kinds(pdir)
+    frames = {kind: _get_data(kind) if kind in kinds else load_summary_frame(pdir, kind, backend) for kind in MODALITIES}
+    summary = summarize_bundle(pid, st.session_state.get("meta", {}), frames)
+    backend.update_index(_data_root(), summary)
+
 def save_bundle(pid: str):
-    pid = _safe_id(pid)
+    pid = safe_id(pid)
     if not pid:
         return False, "환자 ID가 비어 있습니다."
-    # 사용자별 데이터 디렉토리 사용
-    if is_logged_in():
-        pdir = get_user_specific_data_path(pid)
-        pdir.mkdir(parents=True, exist_ok=True)
-    else:
-        pdir = DATA_ROOT / pid
-        pdir.mkdir(parents=True, exist_ok=True)
-
-    # AXL
-    df_axl = st.session_state.get("data_axl", pd.DataFrame()).copy()
-    if not df_axl.empty:
-        df_axl["remarks"] = df_axl["remarks"].apply(remarks_to_str)
-        df_axl["date"] = pd.to_datetime(df_axl["date"], errors="coerce")
-        # 각막곡률 필드가 없는 경우 기본값으로 채우기
-        for col in ["OD_K1", "OD_K2", "OD_meanK", "OS_K1", "OS_K2", "OS_meanK"]:
-            if col not in df_axl.columns:
-                df_axl[col] = np.nan
-        df_axl.sort_values("date").to_csv(pdir / "data.csv", index=False)
-
-    # RE
-    df_re = st.session_state.get("data_re", pd.DataFrame()).copy()
-    if not df_re.empty:
-        df_re["remarks"] = df_re["remarks"].apply(remarks_to_str)
-        df_re["date"] = pd.to_datetime(df_re["date"], errors="coerce")
-        df_re.sort_values("date").to_csv(pdir / "re_data.csv", index=False)
-
-    # 각막곡률
-    df_k = st.session_state.get("data_k", pd.DataFrame()).copy()
-    if not df_k.empty:
-        df_k["remarks"] = df_k["remarks"].apply(remarks_to_str)
-        df_k["date"] = pd.to_datetime(df_k["date"], errors="coerce")
-        df_k.sort_values("date").to_csv(pdir / "k_data.csv", index=False)
-
-    # 각막두께
-    df_ct = st.session_state.get("data_ct", pd.DataFrame()).copy()
-    if not df_ct.empty:
-        df_ct["remarks"] = df_ct["remarks"].apply(remarks_to_str)
-        df_ct["date"] = pd.to_datetime(df_ct["date"], errors="coerce")
-        df_ct.sort_values("date").to_csv(pdir / "ct_data.csv", index=False)
+    pdir = _bundle_dir(pid)
+    pdir.mkdir(parents=True, exist_ok=True)
 
+    # AXL / RE / 각막곡률 / 각막두께 (비어 있거나 아직 읽지 않은 모달리티는 기존 파일 유지)
+    frames = {kind: _get_data(kind) for kind in _session_kinds(pdir)}
     meta = st.session_state.get("meta", {})
-    with open(pdir / "meta.json", "w", encoding="utf-8") as f:
-        json.dump(meta, f, ensure_ascii=False, default=str)
+    backend = get_backend()
+    # 기관 공유 폴더에서 동시 저장을 막기 위한 환자별 배타 잠금
+    # 다른 세션이 먼저 저장했으면(버전 불일치) 날짜 기준으로 병합
+    base_frames, base_version = _base_for(pdir)
+    try:
+        with bundle_lock(pdir, backend):
+            frames, version, conflicts = save_bundle_merged(pdir, frames, meta, base_frames, base_version, backend)
+    except BundleLockTimeout:
+        return False, f"다른 사용자가 저장 중입니다. 잠시 후 다시 시도하세요: {pid}"
+    for kind, df in frames.items():
+        if df is not None and not df.empty:
+            st.session_state[f"data_{kind}"] = df
+    _set_base(pdir, version, MODALITIES)
+    _update_index(pid, backend)
+
+    st.session_state.merge_conflicts = conflicts
+    if conflicts:
+        detail = ", ".join(
+            f"{kind}: " + "/".join(d.strftime("%Y-%m-%d") for d in dates) for kind, dates in conflicts.items()
+        )
+        return True, f"저장 완료 (다른 사용자와 같은 날짜 충돌, 이 세션의 값으로 저장): {detail}"
+    return True, f"저장 완료: {pdir}"
+
+def record_bundle(pid: str, kind: str, added: Optional[pd.DataFrame] = None, deleted: Optional[list] = None, clear: bool = False):
+    """
+    입력/수정/삭제를 환자 저널에 한 줄 추가 (전체 번들 재작성 없음).
+    아직 저장된 적 없는 환자는 save_bundle로 전체 저장합니다.
+    """
+    pid = safe_id(pid)
+    if not pid:
+        return False, "환자 ID가 비어 있습니다."
+    pdir = _bundle_dir(pid)
+    backend = get_backend()
+    if backend.read_meta(pdir) is None:
+        return save_bundle(pid)
+
+    try:
+        with bundle_lock(pdir, backend):
+            in_sync = backend.read_version(pdir) == _base_for(pdir)[1]
+            # 새 버전은 저널 줄에 함께 기록 (한 줄 추가가 곧 쓰기 한 번)
+            n_entries, version = backend.record(pdir, kind, added=added,
+                                                deleted=[pd.to_datetime(d) for d in (deleted or [])], clear=clear)
+            # meta는 디스크와 다를 때만 다시 씀
+            backend.update_meta(pdir, st.session_state.get("meta", {}))
+            # 저널이 길어지면 스냅샷으로 압축
+            if n_entries >= JOURNAL_COMPACT_THRESHOLD:
+                compact_journal(pdir, backend)
+    except BundleLockTimeout:
+        return False, f"다른 사용자가 저장 중입니다. 잠시 후 다시 시도하세요: {pid}"
+    # 디스크가 세션과 같은 상태였으면 기준도 함께 전진 (아니면 다음 저장에서 병합)
+    if in_sync:
+        _set_base(pdir, version, [kind])
+    _update_index(pid, backend)
 
     return True, f"저장 완료: {pdir}"
 
 def load_bundle(pid: str):
-    pid = _safe_id(pid)
+    pid = safe_id(pid)
     if not pid:
         return False, "환자 ID가 비어 있습니다."
     
-    # 사용자별 데이터 디렉토리 사용
-    if is_logged_in():
-        pdir = get_user_specific_data_path(pid)
-    else:
-        pdir = DATA_ROOT / pid
+    pdir = _bundle_dir(pid)
+    backend = get_backend()
     
-    if not pdir.exists():
+    if not backend.exists(pdir):
         return False, f"폴더가 없습니다: {pdir}"
 
-    # 기존 데이터 완전히 초기화
-    st.session_state.data_axl = pd.DataFrame(columns=["date","OD_mm","OS_mm","OD_K1","OD_K2","OD_meanK","OS_K1","OS_K2","OS_meanK","remarks"]).astype({"date":"datetime64[ns]","OD_mm":"float64","OS_mm":"float64","OD_K1":"float64","OD_K2":"float64","OD_meanK":"float64","OS_K1":"float64","OS_K2":"float64","OS_meanK":"float64","remarks":"object"})
-    st.session_state.data_re = pd.DataFrame(columns=["date","OD_sph","OD_cyl","OD_axis","OS_sph","OS_cyl","OS_axis","OD_SE","OS_SE","remarks"]).astype({"date":"datetime64[ns]","OD_sph":"float64","OD_cyl":"float64","OD_axis":"float64","OS_sph":"float64","OS_cyl":"float64","OS_axis":"float64","OD_SE":"float64","OS_SE":"float64","remarks":"object"})
-    st.session_state.data_k = pd.DataFrame(columns=["date","OD_K1","OD_K2","OD_meanK","OS_K1","OS_K2","OS_meanK","remarks"]).astype({"date":"datetime64[ns]","OD_K1":"float64","OD_K2":"float64","OD_meanK":"float64","OS_K1":"float64","OS_K2":"float64","OS_meanK":"float64","remarks":"object"})
-    st.session_state.data_ct = pd.DataFrame(columns=["date","OD_ct","OS_ct","remarks"]).astype({"date":"datetime64[ns]","OD_ct":"float64","OS_ct":"float64","remarks":"object"})
-
-    # AXL 데이터 로드
-    f_axl = pdir / "data.csv"
-    if f_axl.exists() and f_axl.stat().st_size > 0:
-        df_axl = pd.read_csv(f_axl, na_filter=False)
-        if "date" in df_axl.columns:
-            df_axl["date"] = pd.to_datetime(df_axl["date"], errors="coerce")
-        if "remarks" in df_axl.columns:
-            df_axl["remarks"] = df_axl["remarks"].apply(lambda s: normalize_remarks(str(s)))
-        else:
-            df_axl["remarks"] = [[] for _ in range(len(df_axl))]
-        for c in ["OD_mm", "OS_mm", "OD_K1", "OD_K2", "OD_meanK", "OS_K1", "OS_K2", "OS_meanK"]:
-            if c not in df_axl.columns: df_axl[c] = np.nan
-        st.session_state.data_axl = df_axl[["date","OD_mm","OS_mm","OD_K1","OD_K2","OD_meanK","OS_K1","OS_K2","OS_meanK","remarks"]].sort_values("date")
-
-    # RE 데이터 로드
-    f_re = pdir / "re_data.csv"
-    if f_re.exists() and f_re.stat().st_size > 0:
-        df_re = pd.read_csv(f_re, na_filter=False)
-        if "date" in df_re.columns:
-            df_re["date"] = pd.to_datetime(df_re["date"], errors="coerce")
-        if "remarks" in df_re.columns:
-            df_re["remarks"] = df_re["remarks"].apply(lambda s: normalize_remarks(str(s)))
-        else:
-            df_re["remarks"] = [[] for _ in range(len(df_re))]
-        for c in ["OD_sph","OD_cyl","OD_axis","OS_sph","OS_cyl","OS_axis","OD_SE","OS_SE"]:
-            if c not in df_re.columns:
-                df_re[c] = np.nan
-        st.session_state.data_re = df_re[["date","OD_sph","OD_cyl","OD_axis","OS_sph","OS_cyl","OS_axis","OD_SE","OS_SE","remarks"]].sort_values("date")
-
-    # 각막곡률 데이터 로드
-    f_k = pdir / "k_data.csv"
-    if f_k.exists() and f_k.stat().st_size > 0:
-        df_k = pd.read_csv(f_k, na_filter=False)
-        if "date" in df_k.columns:
-            df_k["date"] = pd.to_datetime(df_k["date"], errors="coerce")
-        if "remarks" in df_k.columns:
-            df_k["remarks"] = df_k["remarks"].apply(lambda s: normalize_remarks(str(s)))
-        else:
-            df_k["remarks"] = [[] for _ in range(len(df_k))]
-        for c in ["OD_K1","OD_K2","OD_meanK","OS_K1","OS_K2","OS_meanK"]:
-            if c not in df_k.columns: df_k[c] = np.nan
-        st.session_state.data_k = df_k[["date","OD_K1","OD_K2","OD_meanK","OS_K1","OS_K2","OS_meanK","remarks"]].sort_values("date")
-
-    # 각막두께 데이터 로드
-    f_ct = pdir / "ct_data.csv"
-    if f_ct.exists() and f_ct.stat().st_size > 0:
-        df_ct = pd.read_csv(f_ct, na_filter=False)
-        if "date" in df_ct.columns:
-            df_ct["date"] = pd.to_datetime(df_ct["date"], errors="coerce")
-        if "remarks" in df_ct.columns:
-            df_ct["remarks"] = df_ct["remarks"].apply(lambda s: normalize_remarks(str(s)))
-        else:
-            df_ct["remarks"] = [[] for _ in range(len(df_ct))]
-        for c in ["OD_ct","OS_ct"]:
-            if c not in df_ct.columns: df_ct[c] = np.nan
-        st.session_state.data_ct = df_ct[["date","OD_ct","OS_ct","remarks"]].sort_values("date")
+    # 기존 데이터 완전히 초기화. 모달리티 파일은 탭/차트가 처음 접근할 때 _get_data에서 읽음
+    # (스냅샷 + 저널 재생, 기존 CSV 번들은 백엔드가 자동 이전)
+    for kind in MODALITIES:
+        st.session_state[f"data_{kind}"] = empty_frame(kind)
+    st.session_state.bundle = LazyBundle(pdir, backend)
+    st.session_state.loaded_kinds = set()
 
     # META 데이터 로드 (생년월일 포함)
-    f_meta = pdir / "meta.json"
-    if f_meta.exists() and f_meta.stat().st_size > 0:
-        with open(f_meta, "r", encoding="utf-8") as f:
-            meta = json.load(f)
-        
+    try:
+        with bundle_lock(pdir, backend, shared=True):
+            meta = backend.read_meta(pdir)
+            st.session_state.bundle_dir = str(pdir)
+            st.session_state.bundle_version = backend.read_version(pdir)
+            st.session_state.base_frames = {}
+    except BundleLockTimeout:
+        return False, f"다른 사용자가 저장 중입니다. 잠시 후 다시 시도하세요: {pid}"
+    if meta is not None:
         # 생년월일 처리 개선
         dob_value = meta.get("dob")
         if dob_value:
@@ -401,312 +377,217 @@ def load_bundle(pid: str):
         return True, f"불러오기 완료: {pid} (환자 정보 없음)"
 
 def list_patient_ids() -> list:
-    # 사용자별 또는 기관별 데이터 디렉토리에서 환자 목록 가져오기
-    if is_logged_in():
-        user_data_dir = st.session_state.user_data_dir
-        if not user_data_dir.exists():
-            return []
-        return sorted([p.name for p in user_data_dir.iterdir() if p.is_dir()])
+    # 사용자별 또는 기관별 데이터 디렉토리의 환자 색인에서 목록 가져오기
+    return load_patient_index(_data_root(), get_backend())["patient_id"].tolist()
+
+def _patient_label(row) -> str:
+    parts = [str(row["patient_id"])]
+    if row.get("name"):
+        parts.append(str(row["name"]))
+    if row.get("sex"):
+        parts.append(str(row["sex"]))
+    if row.get("last_exam"):
+        parts.append(f"最終 {row['last_exam']}")
+    if pd.notna(row.get("od_al")) or pd.notna(row.get("os_al")):
+        od = f"{row['od_al']:.2f}" if pd.notna(row.get("od_al")) else "-"
+        os_ = f"{row['os_al']:.2f}" if pd.notna(row.get("os_al")) else "-"
+        parts.append(f"AL {od}/{os_}")
+    return " | ".join(parts)
+
+@st.fragment(run_every=1.0)
+def _ocr_job_progress(job_key: str, label: str):
+    """백그라운드 OCR 진행 표시 (이 부분만 주기적으로 재실행). 끝나면 앱 전체를 다시 실행해 결과 표시"""
+    job = get_job(job_key)
+    if job is None or job.finished:
+        st.rerun()
+    st.progress(job.fraction, text=f"{label}: {job.done}/{job.total} 処理中… 他の入力はそのまま続けられます。")
+
+def _device_label(device) -> str:
+    return DEVICE_TEMPLATES[device]["label"] if device else "自動（全体OCR）"
+
+def _printout_ocr_form():
+    """
+    자동굴절계/각막계 인쇄물 OCR. 한 번 업로드로 REF.DATA(굴절), KRT.DATA(각막곡률), CCT(각막두께)를
+    모두 찾아 각 데이터(data_re / data_k / data_ct)에 추가합니다. 굴절・각막곡률・각막두께 탭에서 공용.
+    """
+    st.markdown("##### 이미지 OCR 추출")
+    st.caption("굴절(REF.DATA)・각막곡률(KRT.DATA)・각막두께(CCT)가 인쇄되어 있으면 한 번에 추출합니다.")
+    up_img = st.file_uploader("자동굴절계/각막계 이미지/PDF", type=["png","jpg","jpeg","pdf"], key="printout_img")
+    re_device = st.selectbox("機種（印刷レイアウト）", [None, "autorefractor"], format_func=_device_label, key="re_ocr_device")
+
+    if up_img is None:
+        ocr_job = None
     else:
-        if not DATA_ROOT.exists():
-            return []
-        return sorted([p.name for p in DATA_ROOT.iterdir() if p.is_dir()])
+        # PDF는 템플릿 영역 대신 텍스트 레이어(없으면 페이지 OCR) 전체를 파싱
+        if re_device and is_pdf(up_img.getvalue()):
+            re_device = None
+        ocr_job = submit_roi_job(up_img, re_device) if re_device else submit_text_job(up_img)
+    if ocr_job is not None and not ocr_job.finished:
+        _ocr_job_progress(ocr_job.key, "자동굴절계 OCR")
+        return
+    if ocr_job is None:
+        return
+    try:
+        # 템플릿 영역 결과는 전체 페이지와 같은 REF.DATA/KRT.DATA 배치로 조립해 같은 파서를 사용
+        ocr_text = refractor_text_from_regions(ocr_job.get()) if re_device else ocr_job.get()
+        reading = parse_refractor_text(ocr_text)
+        krt = parse_keratometry_text(ocr_text)
+        pachy = parse_pachymetry_text(ocr_text)
+
+        if not (reading.success or krt.success or pachy.success):
+            st.warning("데이터를 추출할 수 없습니다.")
+            return
+        st.success("데이터 추출 완료!")
+
+        if reading.success:
+            # 대표값: AVE 행, 없으면 마지막 측정치
+            st.markdown("**굴절이상**")
+            col1, col2 = st.columns(2)
+            with col1:
+                if reading.od_final:
+                    final_R = reading.od_final
+                    st.write(f"**우안**: S {final_R[0]:.2f}, C {final_R[1]:.2f}, A {final_R[2]}°")
+            with col2:
+                if reading.os_final:
+                    final_L = reading.os_final
+                    st.write(f"**좌안**: S {final_L[0]:.2f}, C {final_L[1]:.2f}, A {final_L[2]}°")
+        if krt.success:
+            st.markdown("**각막곡률**")
+            for col, label, k in zip(st.columns(2), ("우안", "좌안"), (krt.od, krt.os)):
+                with col:
+                    if k:
+                        axis = f" @{k.axis}°" if k.axis is not None else ""
+                        st.write(f"**{label}**: K1 {k.k1:.2f}D{axis}, K2 {k.k2:.2f}D, Mean K {k.mean_k:.2f}D")
+        if pachy.success:
+            st.markdown("**각막두께**")
+            col1, col2 = st.columns(2)
+            with col1:
+                if pachy.od_ct is not None:
+                    st.write(f"**우안**: {pachy.od_ct:.0f} µm")
+            with col2:
+                if pachy.os_ct is not None:
+                    st.write(f"**좌안**: {pachy.os_ct:.0f} µm")
+
+        ocr_date = st.date_input("검사일", value=reading.date or krt.date or pachy.date or date.today(), key="printout_date")
+        ocr_remarks = st.multiselect("치료/관리 (OCR)", REMARK_OPTIONS, default=[], key="printout_remarks")
+
+        if st.button("OCR 데이터 추가", use_container_width=True, key="printout_add"):
+            added = {}
+            if reading.success:
+                final_R = reading.od_final or (0.0, 0.0, 180)
+                final_L = reading.os_final or (0.0, 0.0, 180)
+                added["re"] = {
+                    "OD_sph": final_R[0], "OD_cyl": final_R[1], "OD_axis": final_R[2],
+                    "OS_sph": final_L[0], "OS_cyl": final_L[1], "OS_axis": final_L[2],
+                    "OD_SE": final_R[0] + final_R[1]/2.0,
+                    "OS_SE": final_L[0] + final_L[1]/2.0,
+                }
+            if krt.success:
+                added["k"] = {
+                    f"{eye}_{col}": (getattr(k, attr) if k else np.nan)
+                    for eye, k in (("OD", krt.od), ("OS", krt.os))
+                    for col, attr in (("K1", "k1"), ("K2", "k2"), ("meanK", "mean_k"))
+                }
+            if pachy.success:
+                added["ct"] = {"OD_ct": pachy.od_ct if pachy.od_ct is not None else np.nan,
+                               "OS_ct": pachy.os_ct if pachy.os_ct is not None else np.nan}
+            for kind, values in added.items():
+                new_row = pd.DataFrame([{"date": pd.to_datetime(ocr_date), **values, "remarks": ocr_remarks}])
+                df_all = pd.concat([_get_data(kind), new_row], ignore_index=True)
+                df_all = df_all.sort_values("date").drop_duplicates(subset=["date"], keep="last")
+                st.session_state[f"data_{kind}"] = df_all
+                if name: record_bundle(name, kind, added=new_row)
+            st.success("OCR 데이터 추가됨")
+            st.rerun()
+    except Exception as e:
+        discard_job(ocr_job.key)
+        st.error(f"OCR 오류: {e}")
 
 # =========================
 #  분석/예측 유틸
 # =========================
-def _years_between(d1: pd.Timestamp, d2: pd.Timestamp) -> float:
-    return (d2 - d1).days / 365.25
-
-def _age_at_dates(dates: pd.Series, dob: Optional[date], current_age: Optional[float]) -> Optional[pd.Series]:
-    if dob is not None:
-        dob_ts = pd.Timestamp(dob)
-        return dates.apply(lambda d: _years_between(dob_ts, d))
-    if current_age is not None:
-        today = pd.Timestamp(date.today())
-        return dates.apply(lambda d: float(current_age) - _years_between(d, today))
-    return None
-
-def _trend_and_predict(x_age: pd.Series, y: pd.Series, target_age: float = 20.0, mode: str = "linear"):
-    res = {"slope": np.nan, "intercept": np.nan, "r2": np.nan,
-           "pred_at_20": np.nan, "last_age": np.nan, "last_value": np.nan,
-           "delta_to_20": np.nan, "valid": False}
-    try:
-        x = np.array(x_age, dtype=float)
-        yv = np.array(y, dtype=float)
-
-        if mode == "log":
-            mask = np.isfinite(x) & np.isfinite(yv) & (x > 0)
-            X = np.log(x[mask]); yv = yv[mask]
-        else:
-            mask = np.isfinite(x) & np.isfinite(yv)
-            X = x[mask]; yv = yv[mask]
-
-        if X.size < 2:
-            return res
-
-        b, a = np.polyfit(X, yv, 1)  # y = b*X + a
-        y_hat = b * X + a
-        ss_res = np.sum((yv - y_hat) ** 2)
-        ss_tot = np.sum((yv - np.mean(yv)) ** 2)
-        r2 = 1.0 - ss_res / ss_tot if ss_tot > 0 else np.nan
+AGE_CACHE_SIZE = 64
 
-        X20 = np.log(target_age) if mode == "log" else target_age
-        pred_20 = b * X20 + a
+def _years_between(d1, d2) -> np.ndarray:
+    """(d2 - d1) 경과 일수 / 365.25. datetime64 배열끼리 한 번에 계산 (NaT -> NaN)"""
+    delta = np.asarray(d2, dtype="datetime64[ns]") - np.asarray(d1, dtype="datetime64[ns]")
+    return np.floor(delta / np.timedelta64(1, "D")) / 365.25
 
-        last_age = float(x[mask][-1]); last_val = float(yv[-1])
-        delta = float(pred_20 - last_val) if last_age < target_age else 0.0
+def _age_patient_key():
+    """나이 메모의 환자 식별자: 불러온 번들 폴더(환자 ID), 없으면 입력된 환자 ID (이름은 동명이인이 있어 쓰지 않음)"""
+    bundle = st.session_state.get("bundle")
+    return (bundle.pdir.name if bundle is not None else None, st.session_state.get("patient_id") or None)
 
-        res.update({"slope": float(b), "intercept": float(a), "r2": float(r2),
-                    "pred_at_20": float(pred_20), "last_age": last_age,
-                    "last_value": last_val, "delta_to_20": delta, "valid": True})
-        return res
-    except Exception:
-        return res
-
-# =========================
-#  추천(heuristic) 모델: 최적 회귀 + 치료조정
-# =========================
-def _treatment_adjustment_factor(remarks: List[str]) -> float:
-    """
-    치료/관리 옵션에 따른 진행 속도 조정 계수(작을수록 억제 강함).
-    여러 옵션이 함께 있을 때는 가장 강한 억제를 적용합니다.
-    """
-    if not isinstance(remarks, list) or not remarks:
-        return 1.0
-    factors = {
-        "0.125% AT": 0.7,
-        "low-dose AT": 0.8,
-        "OK-lens": 0.6,
-        "DIMS": 0.65,
-        "HAL": 0.65,
-    }
-    applied = [factors.get(r, 1.0) for r in remarks]
-    return float(min(applied)) if applied else 1.0
-
-def _recommendation_predict(x_age: pd.Series, y: pd.Series, remarks_series: pd.Series, target_age: float = 20.0):
+def _age_at_dates(dates: pd.Series, dob: Optional[date], current_age: Optional[float]) -> Optional[pd.Series]:
     """
-    - 선형/로그 회귀 중 설명력이 더 높은 모델을 자동 선택
-    - 마지막 시점의 치료/관리(remarks)에 따라 진행(delta)을 조정
+    측정일별 나이(년). 생년월일이 있으면 생년월일 기준, 없으면 현재 나이에서 역산합니다.
+    (환자 ID, 생년월일/현재 나이, 날짜 열 내용) 단위로 세션에 LRU 메모해 재실행마다 다시 계산하지 않습니다.
     """
-    res_linear = _trend_and_predict(x_age, y, target_age=target_age, mode="linear")
-    res_log = _trend_and_predict(x_age, y, target_age=target_age, mode="log")
-
-    choose_log = False
-    if res_log.get("valid") and res_linear.get("valid"):
-        # r2 높은 모델 선택 (동률이면 선형 유지)
-        if (res_log.get("r2") or float("nan")) > (res_linear.get("r2") or float("nan")):
-            choose_log = True
-    elif res_log.get("valid") and not res_linear.get("valid"):
-        choose_log = True
-
-    chosen = res_log if choose_log else res_linear
-    if not chosen.get("valid"):
-        return chosen | {"chosen_mode": None, "adjust_factor": 1.0}
-
-    # remarks는 최근 행 기준으로 조정
-    last_remarks = None
-    try:
-        if isinstance(remarks_series, pd.Series) and len(remarks_series) > 0:
-            last_remarks = remarks_series.iloc[-1]
-    except Exception:
-        last_remarks = None
-    if not isinstance(last_remarks, list):
-        last_remarks = []
-
-    factor = _treatment_adjustment_factor(last_remarks)
-
-    last_age = float(chosen.get("last_age") or float("nan"))
-    last_val = float(chosen.get("last_value") or float("nan"))
-    delta = float(chosen.get("delta_to_20") or 0.0)
-
-    if last_age < target_age and np.isfinite(last_val):
-        pred_adj = float(last_val + delta * factor)
+    if dob is None and current_age is None:
+        return None
+    dates = pd.to_datetime(dates, errors="coerce")
+    values = dates.to_numpy(dtype="datetime64[ns]")
+    # 날짜 배열 내용이 곧 프레임 버전: 편집/추가/삭제가 있으면 키가 바뀜 (인덱스는 반환 때 다시 붙임)
+    base = ("dob", pd.Timestamp(dob)) if dob is not None else ("age", float(current_age), date.today())
+    key = (_age_patient_key(), base, len(values), hash(values.tobytes()))
+    cache = st.session_state.get("age_cache")
+    if not isinstance(cache, OrderedDict):
+        cache = st.session_state["age_cache"] = OrderedDict()
+    ages = cache.get(key)
+    if ages is None:
+        if dob is not None:
+            ages = _years_between(np.datetime64(pd.Timestamp(dob), "ns"), values)
+        else:
+            ages = float(current_age) - _years_between(values, np.datetime64(date.today(), "ns"))
+        cache[key] = ages
+        while len(cache) > AGE_CACHE_SIZE:
+            cache.popitem(last=False)
     else:
-        pred_adj = float(chosen.get("pred_at_20") or last_val)
-
-    out = dict(chosen)
-    out.update({
-        "pred_at_20": pred_adj,
-        "delta_to_20": float(delta * factor),
-        "chosen_mode": "log" if choose_log else "linear",
-        "adjust_factor": factor,
-    })
-    return out
-
-# =========================
-#  안축장도 이미지 OCR 함수
-# =========================
-def _parse_axl_image_ocr(ocr_text: str) -> tuple:
+        cache.move_to_end(key)
+    return pd.Series(ages, index=dates.index, dtype=float, copy=True)
+
+def _age_label(day: str, dob: Optional[date]) -> str:
+    """치료 표 날짜 옆 나이 표기 (N세 M개월). 날짜 하나라 메모 없이 바로 계산"""
+    if not day or dob is None:
+        return day
+    day_ts = pd.to_datetime(day, errors="coerce")
+    if pd.isna(day_ts):
+        return day
+    age = float(_years_between(np.datetime64(pd.Timestamp(dob), "ns"), np.datetime64(day_ts, "ns")))
+    if not np.isfinite(age) or age < 0:
+        return day
+    years = int(age)
+    return f"{day}\n({years}세 {int((age - years) * 12)}개월)"
+
+def _interval_text(res: dict, unit: str) -> str:
+    """예측 결과 아래 표기: '현재 P60 (z 0.28) · 백분위 곡선 1회 교차 · 95% PI a–b · 부트스트랩 c–d' (없으면 빈 문자열)"""
+    parts = []
+    if np.isfinite(res.get("centile_last", np.nan)):
+        parts.append(f"현재 P{res['centile_last']:.0f} (z {res['z_last']:+.2f})")
+        if res.get("crossings"):
+            parts.append(f"백분위 곡선 {res['crossings']}회 교차")
+    if np.isfinite(res.get("pi_low", np.nan)):
+        parts.append(f"95% PI {res['pi_low']:.2f}–{res['pi_high']:.2f}{unit}")
+    if np.isfinite(res.get("boot_low", np.nan)):
+        parts.append(f"부트스트랩 {res['boot_low']:.2f}–{res['boot_high']:.2f}{unit}")
+    return " · ".join(parts)
+
+def _shade_prediction(ax, res: dict, x_line: np.ndarray, line, absolute: bool = False) -> None:
     """
-    안축장도 이미지의 OCR 텍스트에서 OD, OS AL 값을 추출합니다.
-    
-    Args:
-        ocr_text: OCR로 추출된 텍스트
-    
-    Returns:
-        tuple: (od_al_mm, os_al_mm, success) - 우안 AL, 좌안 AL, 성공 여부
+    상세 예측 그래프: 추세선 주변 95% 예측구간 음영, 20세 예측구간(치료조정 반영) 오차막대,
+    부트스트랩 구간이 있으면 옆에 점선 오차막대. absolute면 굴절 그래프처럼 절대값으로 표시.
     """
-    try:
-        # OCR 텍스트 전처리
-        text = ocr_text.replace("\r", "").replace("\t", " ")
-        text = text.translate(str.maketrans({"−": "-", "–": "-", "—": "-", "‑": "-"}))
-        
-        od_al = None
-        os_al = None
-        
-        # 방법 1: 좌우 분할 방식 (이미지가 좌우로 나뉘어 있는 경우)
-        lines = text.split('\n')
-        
-        # 각 라인에서 OD와 OS 영역을 좌우로 구분
-        od_candidates = []
-        os_candidates = []
-        
-        for line in lines:
-            line = line.strip()
-            if not line or len(line) < 10:  # 너무 짧은 라인 제외
-                continue
-            
-            # AL이 포함된 라인만 처리
-            if 'AL' in line.upper():
-                # 라인을 중간 지점으로 나누어 좌우 구분
-                mid_point = len(line) // 2
-                left_part = line[:mid_point]
-                right_part = line[mid_point:]
-                
-                # 좌측(OD)에서 AL 값 찾기
-                od_matches = re.findall(r'(\d{1,2}\.\d{2})\s*mm', left_part, re.IGNORECASE)
-                for match in od_matches:
-                    val = float(match)
-                    if 15.0 <= val <= 35.0:
-                        od_candidates.append(val)
-                
-                # 우측(OS)에서 AL 값 찾기
-                os_matches = re.findall(r'(\d{1,2}\.\d{2})\s*mm', right_part, re.IGNORECASE)
-                for match in os_matches:
-                    val = float(match)
-                    if 15.0 <= val <= 35.0:
-                        os_candidates.append(val)
-        
-        # 가장 적절한 값 선택 (첫 번째 값 우선)
-        if od_candidates:
-            od_al = od_candidates[0]
-        if os_candidates:
-            os_al = os_candidates[0]
-        
-        # 방법 2: 텍스트 블록 기반 분석 (OD, OS 키워드로 구분)
-        if od_al is None or os_al is None:
-            od_section = []
-            os_section = []
-            current_section = None
-            
-            for line in lines:
-                line = line.strip()
-                if not line:
-                    continue
-                    
-                # OD 섹션 감지 (더 엄격한 패턴)
-                if re.search(r'\bOD\b.*right', line, re.IGNORECASE) or re.search(r'^\s*OD\s*$', line, re.IGNORECASE):
-                    current_section = 'OD'
-                    od_section.append(line)
-                # OS 섹션 감지 (더 엄격한 패턴)
-                elif re.search(r'\bOS\b.*left', line, re.IGNORECASE) or re.search(r'^\s*OS\s*$', line, re.IGNORECASE):
-                    current_section = 'OS'
-                    os_section.append(line)
-                # 현재 섹션에 라인 추가 (단, AL이 포함된 라인만)
-                elif current_section == 'OD' and 'AL' in line.upper():
-                    od_section.append(line)
-                elif current_section == 'OS' and 'AL' in line.upper():
-                    os_section.append(line)
-            
-            # OD 섹션에서 AL 값 추출
-            if od_section and od_al is None:
-                for line in od_section:
-                    al_matches = re.findall(r'(\d{1,2}\.\d{2})\s*mm', line, re.IGNORECASE)
-                    for match in al_matches:
-                        val = float(match)
-                        if 15.0 <= val <= 35.0:
-                            od_al = val
-                            break
-                    if od_al:
-                        break
-            
-            # OS 섹션에서 AL 값 추출
-            if os_section and os_al is None:
-                for line in os_section:
-                    al_matches = re.findall(r'(\d{1,2}\.\d{2})\s*mm', line, re.IGNORECASE)
-                    for match in al_matches:
-                        val = float(match)
-                        if 15.0 <= val <= 35.0:
-                            os_al = val
-                            break
-                    if os_al:
-                        break
-        
-        # 방법 3: 모든 AL 값을 위치순으로 추출 (위치 기반)
-        if od_al is None or os_al is None:
-            all_al_positions = []
-            
-            # AL: XX.XX mm 패턴으로 모든 값과 위치 추출
-            for match in re.finditer(r'AL[:\s]*(\d{1,2}\.\d{2})\s*mm', text, re.IGNORECASE):
-                val = float(match.group(1))
-                if 15.0 <= val <= 35.0:
-                    all_al_positions.append((val, match.start()))
-            
-            # 일반 XX.XX mm 패턴으로 추가 추출 (AL 근처에 있는 것들)
-            if len(all_al_positions) < 2:
-                for line in lines:
-                    if 'AL' in line.upper():
-                        for match in re.finditer(r'(\d{1,2}\.\d{2})\s*mm', line, re.IGNORECASE):
-                            val = float(match.group(1))
-                            if 15.0 <= val <= 35.0:
-                                line_pos = text.find(line)
-                                if line_pos >= 0:
-                                    all_al_positions.append((val, line_pos + match.start()))
-            
-            # 중복 제거 및 위치순 정렬
-            unique_positions = []
-            for val, pos in all_al_positions:
-                if not any(abs(existing_pos - pos) < 50 and existing_val == val 
-                          for existing_val, existing_pos in unique_positions):
-                    unique_positions.append((val, pos))
-            
-            unique_positions.sort(key=lambda x: x[1])
-            
-            # 첫 번째는 OD, 두 번째는 OS로 할당
-            if len(unique_positions) >= 2:
-                if od_al is None:
-                    od_al = unique_positions[0][0]
-                if os_al is None:
-                    os_al = unique_positions[1][0]
-            elif len(unique_positions) == 1 and od_al is None:
-                od_al = unique_positions[0][0]
-        
-        # 방법 4: 특정 패턴으로 직접 매칭
-        if od_al is None or os_al is None:
-            # 23.70과 24.09 같은 특정 값들을 직접 찾기
-            specific_values = re.findall(r'(\d{2}\.\d{2})\s*mm', text, re.IGNORECASE)
-            valid_values = [float(v) for v in specific_values if 15.0 <= float(v) <= 35.0]
-            
-            # 중복 제거하면서 순서 유지
-            unique_values = []
-            for val in valid_values:
-                if val not in unique_values:
-                    unique_values.append(val)
-            
-            if len(unique_values) >= 2:
-                if od_al is None:
-                    od_al = unique_values[0]
-                if os_al is None:
-                    os_al = unique_values[1]
-            elif len(unique_values) == 1 and od_al is None:
-                od_al = unique_values[0]
-        
-        success = od_al is not None or os_al is not None
-        return (od_al, os_al, success)
-        
-    except Exception as e:
-        return (None, None, False)
+    conv = np.abs if absolute else np.asarray
+    color = line.get_color()
+    low, high = prediction_band(res, x_line)
+    if np.isfinite(low).any():
+        ax.fill_between(x_line, conv(low), conv(high), color=color, alpha=0.12, linewidth=0)
+    for x, lo_key, hi_key, style in ((20.0, "pi_low", "pi_high", "-"), (20.25, "boot_low", "boot_high", ":")):
+        lo, hi = res.get(lo_key, np.nan), res.get(hi_key, np.nan)
+        if np.isfinite(lo) and np.isfinite(hi):
+            y_lo, y_hi = sorted(conv([lo, hi]))
+            bars = ax.errorbar([x], [(y_lo + y_hi) / 2], yerr=[[(y_hi - y_lo) / 2]], color=color, capsize=4, fmt="none")
+            bars[-1][0].set_linestyle(style)
 
 # =========================
 #  텍스트 파싱 함수
@@ -1106,27 +987,15 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-if "data_axl" not in st.session_state:
-    st.session_state.data_axl = pd.DataFrame(
-        columns=["date","OD_mm","OS_mm","OD_K1","OD_K2","OD_meanK","OS_K1","OS_K2","OS_meanK","remarks"]
-    ).astype({"date":"datetime64[ns]","OD_mm":"float64","OS_mm":"float64",
-              "OD_K1":"float64","OD_K2":"float64","OD_meanK":"float64",
-              "OS_K1":"float64","OS_K2":"float64","OS_meanK":"float64","remarks":"object"})
-if "data_re" not in st.session_state:
-    st.session_state.data_re = pd.DataFrame(
-        columns=["date","OD_sph","OD_cyl","OD_axis","OS_sph","OS_cyl","OS_axis","OD_SE","OS_SE","remarks"]
-    ).astype({"date":"datetime64[ns]","OD_sph":"float64","OD_cyl":"float64","OD_axis":"float64",
-              "OS_sph":"float64","OS_cyl":"float64","OS_axis":"float64",
-              "OD_SE":"float64","OS_SE":"float64","remarks":"object"})
-if "data_k" not in st.session_state:
-    st.session_state.data_k = pd.DataFrame(
-        columns=["date","OD_K1","OD_K2","OD_meanK","OS_K1","OS_K2","OS_meanK","remarks"]
-    ).astype({"date":"datetime64[ns]","OD_K1":"float64","OD_K2":"float64","OD_meanK":"float64",
-              "OS_K1":"float64","OS_K2":"float64","OS_meanK":"float64","remarks":"object"})
-if "data_ct" not in st.session_state:
-    st.session_state.data_ct = pd.DataFrame(
-        columns=["date","OD_ct","OS_ct","remarks"]
-    ).astype({"date":"datetime64[ns]","OD_ct":"float64","OS_ct":"float64","remarks":"object"})
+for _kind in MODALITIES:
+    if f"data_{_kind}" not in st.session_state:
+        st.session_state[f"data_{_kind}"] = empty_frame(_kind)
+if "bundle" not in st.session_state:
+    st.session_state.bundle = None
+    st.session_state.loaded_kinds = set()
+    st.session_state.bundle_dir = None
+    st.session_state.bundle_version = 0
+    st.session_state.base_frames = {}
 if "meta" not in st.session_state:
     st.session_state.meta = {"sex": None, "dob": None, "current_age": None, "name": None}
 
@@ -1366,12 +1235,28 @@ with st.sidebar:
     if st.button("저장", use_container_width=True, type="primary"):
         ok, msg = save_bundle(patient_id or name or "")
         st.toast(msg)
+        if st.session_state.get("merge_conflicts"):
+            st.warning(f"⚠️ {msg}")
     
     # 🔹 하단 블록: 불러오기
     st.markdown("---")
     st.subheader("📂 불러오기")
-    saved_ids = ["(선택)"] + list_patient_ids()
-    selected_pid = st.selectbox("저장된 환자", saved_ids)
+    patient_index = load_patient_index(_data_root(), get_backend())
+    search_q = st.text_input("患者検索 (ID/名前)", key="patient_search").strip().lower()
+    sort_key = st.selectbox("並び順", ["ID", "名前", "最終検査日"], key="patient_sort")
+    if search_q:
+        hit = (patient_index["patient_id"].astype(str).str.lower().str.contains(search_q, regex=False)
+               | patient_index["name"].fillna("").astype(str).str.lower().str.contains(search_q, regex=False))
+        patient_index = patient_index[hit]
+    if sort_key == "名前":
+        patient_index = patient_index.sort_values(["name", "patient_id"], na_position="last")
+    elif sort_key == "最終検査日":
+        patient_index = patient_index.sort_values("last_exam", ascending=False, na_position="last")
+    else:
+        patient_index = patient_index.sort_values("patient_id")
+    labels = {r["patient_id"]: _patient_label(r) for r in patient_index.to_dict("records")}
+    saved_ids = ["(선택)"] + list(labels)
+    selected_pid = st.selectbox("저장된 환자", saved_ids, format_func=lambda x: labels.get(x, x))
     if st.button("불러오기", use_container_width=True):
         pid = selected_pid if selected_pid != "(선택)" else (patient_id or name or "")
         ok, msg = load_bundle(pid)
@@ -1430,7 +1315,7 @@ if data_type == "なし":
     
 elif data_type == "眼軸長":
     # 入力方式選択
-    axl_input_method = st.radio("**入力方式**", ["選択入力", "テキスト入力", "画像(OCR)"], horizontal=True)
+    axl_input_method = st.radio("**入力方式**", ["選択入力", "テキスト入力", "画像(OCR)", "一括OCR"], horizontal=True)
     
     if axl_input_method == "選択入力":
         st.markdown("##### 眼軸長選択入力")
@@ -1453,11 +1338,11 @@ elif data_type == "眼軸長":
                 "OS_mm": float(os_mm),
                 "remarks": axl_remarks
             }])
-            df_all = pd.concat([st.session_state.data_axl, new_row], ignore_index=True)
+            df_all = pd.concat([_get_data("axl"), new_row], ignore_index=True)
             df_all = df_all.sort_values("date").drop_duplicates(subset=["date"], keep="last")
             st.session_state.data_axl = df_all
             st.success("眼軸長データ追加完了")
-            if name: save_bundle(name)
+            if name: record_bundle(name, "axl", added=new_row)
             st.rerun()
     
     elif axl_input_method == "テキスト入力":
@@ -1472,32 +1357,39 @@ elif data_type == "眼軸長":
             if st.button("テキスト追加", use_container_width=True) and input_text.strip():
                 try:
                     df_new = _parse_axl_lines(input_text)
-                    df_all = pd.concat([st.session_state.data_axl, df_new], ignore_index=True)
+                    df_all = pd.concat([_get_data("axl"), df_new], ignore_index=True)
                     df_all = df_all.sort_values("date").drop_duplicates(subset=["date"], keep="last")
                     st.session_state.data_axl = df_all
                     st.success(f"{len(df_new)}個の測定値が追加されました。")
-                    if name: save_bundle(name)
+                    if name: record_bundle(name, "axl", added=df_new)
                     st.rerun()
                 except Exception as e:
                     st.error(f"入力解析失敗: {e}")
         with col2:
             if st.button("すべて削除", type="secondary", use_container_width=True):
-                st.session_state.data_axl = st.session_state.data_axl.iloc[0:0]
+                st.session_state.data_axl = _get_data("axl").iloc[0:0]
                 st.info("眼軸長データをすべて削除しました。")
-                if name: save_bundle(name)
+                if name: record_bundle(name, "axl", clear=True)
     
-    else:  # 画像(OCR)
+    elif axl_input_method == "画像(OCR)":
         st.markdown("##### 眼軸長図画像OCR抽出")
         st.caption("眼軸長図測定結果画像をアップロードすると、OD、OSのAL値を自動で抽出します。")
-        axl_img = st.file_uploader("眼軸長図画像", type=["png","jpg","jpeg"], key="axl_img")
-        
-        if axl_img is not None:
+        axl_img = st.file_uploader("眼軸長図画像/PDF", type=["png","jpg","jpeg","pdf"], key="axl_img")
+        # 기기를 고르면 템플릿 영역(OD/OS AL, 날짜)만 OCR
+        axl_device = st.selectbox("機種（印刷レイアウト）", [None] + AXL_DEVICES, format_func=_device_label, key="axl_ocr_device")
+        
+        # OCR은 백그라운드 작업으로 실행 (같은 이미지는 캐시된 결과 재사용)
+        ocr_job = submit_axl_job(axl_img, axl_device) if axl_img is not None else None
+        if ocr_job is not None and not ocr_job.finished:
+            _ocr_job_progress(ocr_job.key, "眼軸長図OCR")
+        elif ocr_job is not None:
             try:
-                img = Image.open(axl_img).convert("L")
-                ocr_text = pytesseract.image_to_string(img, lang="eng")
-                
-                # 眼軸長OCR解析
-                od_al, os_al, success = _parse_axl_image_ocr(ocr_text)
+                # 眼軸長OCR解析 (단어 상자 좌표로 OD/OS 배정, 값별 신뢰도)
+                res = ocr_job.get()
+                if res["error"] and not res["text"]:
+                    raise RuntimeError(res["error"])
+                ocr_text, od_al, os_al = res["text"], res["od_al"], res["os_al"]
+                success = od_al is not None or os_al is not None
                 
                 if success:
                     st.success("眼軸長データ抽出完了！")
@@ -1505,19 +1397,21 @@ elif data_type == "眼軸長":
                     col1, col2 = st.columns(2)
                     with col1:
                         if od_al is not None:
-                            st.write(f"**右眼(OD) AL**: {od_al:.2f} mm")
+                            conf = f" (信頼度 {res['od_conf']:.0%})" if res["od_conf"] is not None else ""
+                            st.write(f"**右眼(OD) AL**: {od_al:.2f} mm{conf}")
                         else:
                             st.write("**右眼(OD)**: 抽出失敗")
                     with col2:
                         if os_al is not None:
-                            st.write(f"**左眼(OS) AL**: {os_al:.2f} mm")
+                            conf = f" (信頼度 {res['os_conf']:.0%})" if res["os_conf"] is not None else ""
+                            st.write(f"**左眼(OS) AL**: {os_al:.2f} mm{conf}")
                         else:
                             st.write("**左眼(OS)**: 抽出失敗")
                     
                     # 日付及び追加設定
                     col1, col2 = st.columns(2)
                     with col1:
-                        axl_ocr_date = st.date_input("検査日", value=date.today(), key="axl_ocr_date")
+                        axl_ocr_date = st.date_input("検査日", value=res["date"] or date.today(), key="axl_ocr_date")
                     with col2:
                         axl_ocr_remarks = st.multiselect("治療/管理 (OCR)", REMARK_OPTIONS, default=[], key="axl_ocr_remarks")
                     
@@ -1544,11 +1438,11 @@ elif data_type == "眼軸長":
                             "OS_mm": float(os_manifest),
                             "remarks": axl_ocr_remarks
                         }])
-                        df_all = pd.concat([st.session_state.data_axl, new_row], ignore_index=True)
+                        df_all = pd.concat([_get_data("axl"), new_row], ignore_index=True)
                         df_all = df_all.sort_values("date").drop_duplicates(subset=["date"], keep="last")
                         st.session_state.data_axl = df_all
                         st.success("안축장 OCR 데이터 추가됨")
-                        if name: save_bundle(name)
+                        if name: record_bundle(name, "axl", added=new_row)
                         st.rerun()
                         
                 else:
@@ -1561,10 +1455,93 @@ elif data_type == "眼軸長":
                         st.text(ocr_text)
                         
             except Exception as e:
+                discard_job(ocr_job.key)  # 다음 재실행 때 다시 시도
                 st.error(f"안축장 OCR 오류: {e}")
                 st.info("이미지 형식이나 품질을 확인해주세요.")
 
-elif data_type == "굴절이상":
+    else:  # 一括OCR
+        st.markdown("##### 眼軸長図 一括OCR")
+        st.caption("複数の印刷物スキャンをまとめてOCRし、確認表で修正してから追加します。")
+        batch_imgs = st.file_uploader("眼軸長図画像/PDF（複数可）", type=["png","jpg","jpeg","pdf"],
+                                      accept_multiple_files=True, key="axl_batch_imgs")
+        batch_dir = st.text_input("またはフォルダのパス", key="axl_batch_dir", placeholder="/path/to/scans")
+        batch_device = st.selectbox("機種（印刷レイアウト）", [None] + AXL_DEVICES, format_func=_device_label, key="axl_batch_device")
+
+        if st.button("一括OCR実行", use_container_width=True, key="run_axl_batch_ocr"):
+            items = [(f.name, f.getvalue()) for f in (batch_imgs or [])]
+            if batch_dir.strip():
+                items += [(p.name, str(p)) for p in list_image_files(batch_dir.strip())]
+            if not items:
+                st.warning("画像ファイルがありません。")
+            else:
+                st.session_state.axl_batch_job = submit_batch_job(items, device=batch_device).key
+                st.session_state.axl_batch_ocr = None
+
+        batch_job = get_job(st.session_state.get("axl_batch_job"))
+        if batch_job is not None and not batch_job.finished:
+            _ocr_job_progress(batch_job.key, "一括OCR")
+        elif batch_job is not None:
+            st.session_state.axl_batch_job = None
+            discard_job(batch_job.key)
+            try:
+                results = batch_job.get()
+            except RuntimeError as e:
+                st.error(f"一括OCR失敗: {e}")
+            else:
+                default_pid = safe_id(name)
+                st.session_state.axl_batch_ocr = pd.DataFrame([{
+                    "追加": r["error"] is None and r["confidence"] >= MIN_CONFIDENCE,
+                    "ファイル": r["file"],
+                    "患者ID": default_pid,
+                    "検査日": r["date"] or date.today(),
+                    "OD_mm": r["od_al"],
+                    "OS_mm": r["os_al"],
+                    "信頼度": round(r["confidence"], 2),
+                    "エラー": r["error"] or "",
+                } for r in results]).astype({"OD_mm": "float64", "OS_mm": "float64"})
+
+        df_review = st.session_state.get("axl_batch_ocr")
+        if df_review is not None and not df_review.empty:
+            st.caption(f"信頼度 {MIN_CONFIDENCE:.0%} 未満またはエラーの行は既定で未選択です。値・日付・患者IDは直接修正できます。")
+            edited = st.data_editor(
+                df_review, key="axl_batch_editor", use_container_width=True, hide_index=True,
+                disabled=["ファイル", "信頼度", "エラー"],
+                column_config={
+                    "検査日": st.column_config.DateColumn("検査日"),
+                    "OD_mm": st.column_config.NumberColumn("OD (mm)", min_value=15.0, max_value=35.0, step=0.01, format="%.2f"),
+                    "OS_mm": st.column_config.NumberColumn("OS (mm)", min_value=15.0, max_value=35.0, step=0.01, format="%.2f"),
+                    "信頼度": st.column_config.ProgressColumn("信頼度", min_value=0.0, max_value=1.0),
+                },
+            )
+            if st.button("選択行を追加", use_container_width=True, type="primary", key="commit_axl_batch"):
+                rows = edited[edited["追加"] & (edited["OD_mm"].notna() | edited["OS_mm"].notna())].copy()
+                rows["患者ID"] = rows["患者ID"].fillna("").astype(str).map(safe_id)
+                rows = rows[rows["患者ID"] != ""]
+                current_pid = safe_id(name)
+                n_other = 0
+                for pid, g in rows.groupby("患者ID"):
+                    new_rows = pd.DataFrame({
+                        "date": pd.to_datetime(g["検査日"]),
+                        "OD_mm": g["OD_mm"].astype(float),
+                        "OS_mm": g["OS_mm"].astype(float),
+                        "remarks": [[] for _ in range(len(g))],
+                    }).sort_values("date").drop_duplicates(subset=["date"], keep="last")
+                    if pid == current_pid:
+                        df_all = pd.concat([_get_data("axl"), new_rows], ignore_index=True)
+                        st.session_state.data_axl = df_all.sort_values("date").drop_duplicates(subset=["date"], keep="last")
+                        record_bundle(name, "axl", added=new_rows)
+                    else:
+                        # 다른 환자는 세션을 거치지 않고 해당 번들에 바로 추가 (meta는 유지)
+                        # 폴더는 불러오기/저장과 같은 _bundle_dir 규칙으로
+                        backend = get_backend()
+                        write_patient(_bundle_dir(pid), {"axl": new_rows}, {}, backend)
+                        backend.update_index(_data_root(), finalize_patient(_bundle_dir(pid), backend))
+                        n_other += len(new_rows)
+                st.session_state.axl_batch_ocr = None
+                st.success(f"{len(rows)}件の眼軸長データを追加しました" + (f"（他の患者 {n_other}件）" if n_other else ""))
+                st.rerun()
+
+elif data_type == "屈折異常":
     # 🔹 입력 방식 선택
     input_method = st.radio("**입력 방식**", ["선택입력", "텍스트입력", "이미지(OCR)"], horizontal=True)
     
@@ -1625,11 +1602,11 @@ elif data_type == "굴절이상":
                 "OS_SE": float(os_sph) + float(os_cyl)/2.0,
                 "remarks": final_remarks
             }])
-            df_all = pd.concat([st.session_state.data_re, new_row], ignore_index=True)
+            df_all = pd.concat([_get_data("re"), new_row], ignore_index=True)
             df_all = df_all.sort_values("date").drop_duplicates(subset=["date"], keep="last")
             st.session_state.data_re = df_all
             st.success("굴절이상 데이터 추가됨")
-            if name: save_bundle(name)
+            if name: record_bundle(name, "re", added=new_row)
             st.rerun()
     
     elif input_method == "텍스트입력":
@@ -1673,140 +1650,26 @@ elif data_type == "굴절이상":
                             else:
                                 df_new.loc[idx, 'remarks'] = [refraction_type_text]
                     
-                    df_all = pd.concat([st.session_state.data_re, df_new], ignore_index=True)
+                    df_all = pd.concat([_get_data("re"), df_new], ignore_index=True)
                     df_all = df_all.sort_values("date").drop_duplicates(subset=["date"], keep="last")
                     st.session_state.data_re = df_all
                     st.success(f"{len(df_new)}개 측정치가 추가되었습니다.")
-                    if name: save_bundle(name)
+                    if name: record_bundle(name, "re", added=df_new)
                     st.rerun()
                 except Exception as e:
                     st.error(f"입력 파싱 실패: {e}")
         with col2:
             if st.button("모두 지우기", type="secondary", use_container_width=True):
-                st.session_state.data_re = st.session_state.data_re.iloc[0:0]
+                st.session_state.data_re = _get_data("re").iloc[0:0]
                 st.info("굴절이상 데이터를 모두 비웠습니다.")
-                if name: save_bundle(name)
+                if name: record_bundle(name, "re", clear=True)
     
     else:  # 이미지()
-        st.markdown("##### 이미지 OCR 추출")
-        up_img = st.file_uploader("자동굴절계 이미지", type=["png","jpg","jpeg"])
-        
-        if up_img is not None:
-            try:
-                img = Image.open(up_img).convert("L")
-                ocr_text = pytesseract.image_to_string(img, lang="eng")
-                
-                # OCR 처리 (간소화된 버전)
-                t = ocr_text.replace("\r","").replace("\t"," ")
-                t = t.translate(str.maketrans({"−": "-", "–": "-", "—": "-", "‑":"-"}))
-                
-                # 날짜 추출
-                dt_match = re.search(r'(\d{4}[-./]\d{1,2}[-./]\d{1,2})', t)
-                dt_date = dt_match.group(1) if dt_match else ""
-                
-                # REF.DATA 블럭 추출
-                ref_block = ""
-                m_ref = re.search(r'REF\.?DATA(.*?)(KRT\.?DATA|PD:|$)', t, flags=re.S | re.I)
-                if m_ref:
-                    ref_block = m_ref.group(1)
-                
-                # OCR 교정
-                ref_block = re.sub(r'<\s*b\b', '<L>', ref_block, flags=re.I)
-                
-                def parse_measurement_line(line: str):
-                    pattern = r'([+-]?\d{3,4})\s+([+-]?\d{3,4})\s+(\d{2,3})'
-                    match = re.search(pattern, line)
-                    if match:
-                        s_str, c_str, a_str = match.groups()
-                        try:
-                            s_val = float(s_str) / 100.0 if abs(float(s_str)) >= 100 else float(s_str)
-                            c_val = float(c_str) / 100.0 if abs(float(c_str)) >= 100 else float(c_str)
-                            if c_val > 0: c_val = -c_val
-                            a_val = int(a_str)
-                            if abs(s_val) <= 30 and abs(c_val) <= 15 and 0 <= a_val <= 180:
-                                return (round(s_val, 2), round(c_val, 2), a_val)
-                        except:
-                            pass
-                    return None
-                
-                # 우안/좌안 데이터 추출
-                def extract_eye_data(block: str, eye_marker: str):
-                    if eye_marker.upper() == 'R':
-                        pattern = r'<R>(.*?)(?=<L>|S\.E\.|PD:|$)'
-                    else:
-                        pattern = r'<L>(.*?)(?=S\.E\.|PD:|$)'
-                    
-                    match = re.search(pattern, block, flags=re.S | re.I)
-                    if not match: return []
-                    
-                    candidates = []
-                    for line in match.group(1).split('\n'):
-                        line = line.strip()
-                        if line and not re.search(r'\b(WD|PD|MM|AVE|ic|Ss)\b', line, flags=re.I):
-                            measurement = parse_measurement_line(line)
-                            if measurement: candidates.append(measurement)
-                    return candidates
-                
-                candR = extract_eye_data(ref_block, 'R')
-                candL = extract_eye_data(ref_block, 'L')
-
-                # Fallback: REF.DATA 블럭이 없거나 매칭 실패 시 전체 텍스트에서 3-수치 패턴 스캔
-                if not (candR or candL):
-                    all_triples = []
-                    for line in t.split('\n'):
-                        line_s = line.strip()
-                        if not line_s:
-                            continue
-                        m = parse_measurement_line(line_s)
-                        if m:
-                            all_triples.append(m)
-                    if len(all_triples) >= 1 and not candR:
-                        candR = [all_triples[-1]]
-                    if len(all_triples) >= 2 and not candL:
-                        candL = [all_triples[-2]]
-                
-                if candR or candL:
-                    st.success("데이터 추출 완료!")
-                    
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        if candR:
-                            final_R = candR[-1]  # 마지막 값
-                            st.write(f"**우안**: S {final_R[0]:.2f}, C {final_R[1]:.2f}, A {final_R[2]}°")
-                    with col2:
-                        if candL:
-                            final_L = candL[-1]  # 마지막 값
-                            st.write(f"**좌안**: S {final_L[0]:.2f}, C {final_L[1]:.2f}, A {final_L[2]}°")
-                    
-                    ocr_date = st.date_input("검사일", value=pd.to_datetime(dt_date, errors="coerce").date() if dt_date else date.today())
-                    ocr_remarks = st.multiselect("치료/관리 (OCR)", REMARK_OPTIONS, default=[])
-                    
-                    if st.button("OCR 데이터 추가", use_container_width=True):
-                        final_R = candR[-1] if candR else (0.0, 0.0, 180)
-                        final_L = candL[-1] if candL else (0.0, 0.0, 180)
-                        
-                        new_row = pd.DataFrame([{
-                            "date": pd.to_datetime(ocr_date),
-                            "OD_sph": final_R[0], "OD_cyl": final_R[1], "OD_axis": final_R[2],
-                            "OS_sph": final_L[0], "OS_cyl": final_L[1], "OS_axis": final_L[2],
-                            "OD_SE": final_R[0] + final_R[1]/2.0,
-                            "OS_SE": final_L[0] + final_L[1]/2.0,
-                            "remarks": ocr_remarks
-                        }])
-                        df_all = pd.concat([st.session_state.data_re, new_row], ignore_index=True)
-                        df_all = df_all.sort_values("date").drop_duplicates(subset=["date"], keep="last")
-                        st.session_state.data_re = df_all
-                        st.success("OCR 데이터 추가됨")
-                        if name: save_bundle(name)
-                        st.rerun()
-                else:
-                    st.warning("데이터를 추출할 수 없습니다.")
-            except Exception as e:
-                st.error(f"OCR 오류: {e}")
+        _printout_ocr_form()
 
-elif data_type == "각막곡률":
+elif data_type == "角膜曲率":
     # 🔹 입력 방식 선택
-    k_input_method = st.radio("**입력 방식**", ["선택입력", "텍스트입력"], horizontal=True)
+    k_input_method = st.radio("**입력 방식**", ["선택입력", "텍스트입력", "이미지(OCR)"], horizontal=True)
     
     if k_input_method == "선택입력":
         st.markdown("##### 각막곡률 선택입력")
@@ -1853,11 +1716,11 @@ elif data_type == "각막곡률":
             if "data_k" not in st.session_state:
                 st.session_state.data_k = pd.DataFrame()
             
-            df_all = pd.concat([st.session_state.data_k, new_row], ignore_index=True)
+            df_all = pd.concat([_get_data("k"), new_row], ignore_index=True)
             df_all = df_all.sort_values("date").drop_duplicates(subset=["date"], keep="last")
             st.session_state.data_k = df_all
             st.success("각막곡률 데이터 추가됨")
-            if name: save_bundle(name)
+            if name: record_bundle(name, "k", added=new_row)
             st.rerun()
     
     elif k_input_method == "텍스트입력":
@@ -1910,11 +1773,11 @@ elif data_type == "각막곡률":
                         if "data_k" not in st.session_state:
                             st.session_state.data_k = pd.DataFrame()
                         
-                        df_all = pd.concat([st.session_state.data_k, df_new], ignore_index=True)
+                        df_all = pd.concat([_get_data("k"), df_new], ignore_index=True)
                         df_all = df_all.sort_values("date").drop_duplicates(subset=["date"], keep="last")
                         st.session_state.data_k = df_all
                         st.success(f"{len(df_new)}개 측정치가 추가되었습니다.")
-                        if name: save_bundle(name)
+                        if name: record_bundle(name, "k", added=df_new)
                         st.rerun()
                     else:
                         st.error("파싱된 데이터가 없습니다.")
@@ -1923,13 +1786,16 @@ elif data_type == "각막곡률":
         with col2:
             if st.button("모두 지우기", type="secondary", use_container_width=True, key="k_clear"):
                 if "data_k" in st.session_state:
-                    st.session_state.data_k = st.session_state.data_k.iloc[0:0]
+                    st.session_state.data_k = _get_data("k").iloc[0:0]
                 st.info("각막곡률 데이터를 모두 비웠습니다.")
-                if name: save_bundle(name)
+                if name: record_bundle(name, "k", clear=True)
+
+    else:  # 이미지(OCR)
+        _printout_ocr_form()
 
-elif data_type == "각막두께":
+elif data_type == "角膜厚":
     # 입력 방식 선택
-    ct_input_method = st.radio("**입력 방식**", ["선택입력", "텍스트입력"], horizontal=True)
+    ct_input_method = st.radio("**입력 방식**", ["선택입력", "텍스트입력", "이미지(OCR)"], horizontal=True)
     
     if ct_input_method == "선택입력":
         st.markdown("##### 각막두께 선택입력")
@@ -1952,14 +1818,14 @@ elif data_type == "각막두께":
                 "OS_ct": float(os_ct),
                 "remarks": ct_remarks
             }])
-            df_all = pd.concat([st.session_state.data_ct, new_row], ignore_index=True)
+            df_all = pd.concat([_get_data("ct"), new_row], ignore_index=True)
             df_all = df_all.sort_values("date").drop_duplicates(subset=["date"], keep="last")
             st.session_state.data_ct = df_all
             st.success("각막두께 데이터 추가됨")
-            if name: save_bundle(name)
+            if name: record_bundle(name, "ct", added=new_row)
             st.rerun()
     
-    else:  # 텍스트입력
+    elif ct_input_method == "텍스트입력":
         st.markdown("##### 각막두께 텍스트입력")
         st.caption("형식: YYYY-M-D, OD(μm), OS(μm)[, Remarks]")
         st.caption("예시: 2025-8-16, 550, 545, AT; DIMS")
@@ -1971,25 +1837,28 @@ elif data_type == "각막두께":
             if st.button("텍스트 추가", use_container_width=True) and input_text.strip():
                 try:
                     df_new = _parse_ct_lines(input_text)
-                    df_all = pd.concat([st.session_state.data_ct, df_new], ignore_index=True)
+                    df_all = pd.concat([_get_data("ct"), df_new], ignore_index=True)
                     df_all = df_all.sort_values("date").drop_duplicates(subset=["date"], keep="last")
                     st.session_state.data_ct = df_all
                     st.success(f"{len(df_new)}개 측정치가 추가되었습니다.")
-                    if name: save_bundle(name)
+                    if name: record_bundle(name, "ct", added=df_new)
                     st.rerun()
                 except Exception as e:
                     st.error(f"입력 파싱 실패: {e}")
         with col2:
             if st.button("모두 지우기", type="secondary", use_container_width=True):
-                st.session_state.data_ct = st.session_state.data_ct.iloc[0:0]
+                st.session_state.data_ct = _get_data("ct").iloc[0:0]
                 st.info("각막두께 데이터를 모두 비웠습니다.")
-                if name: save_bundle(name)
+                if name: record_bundle(name, "ct", clear=True)
+
+    else:  # 이미지(OCR)
+        _printout_ocr_form()
 
 # 데이터 존재 여부 확인 (전역 변수)
-has_axl = not st.session_state.data_axl.empty
-has_re = not st.session_state.data_re.empty
-has_k = "data_k" in st.session_state and not st.session_state.data_k.empty
-has_ct = "data_ct" in st.session_state and not st.session_state.data_ct.empty
+has_axl = _has_data("axl")
+has_re = _has_data("re")
+has_k = _has_data("k")
+has_ct = _has_data("ct")
 
 # =========================
 #  탭 2: 시각화
@@ -2012,10 +1881,11 @@ with tab2:
         
         # 선택된 그래프 타입에 따른 시각화
         if graph_type == "안축장" and has_axl:
-            df = st.session_state.data_axl.copy()
+            df = _get_data("axl").copy()
             
             # 환자 정보 가져오기
-            patient_sex = st.session_state.meta.get("sex", "남")  # 기본값은 남성
+            # 男/남/M 어느 표기든 M/F로 (모르면 기본값 남성)
+            patient_sex = normalize_sex(st.session_state.meta.get("sex")) or "M"
             dob = st.session_state.meta.get("dob")
             
             # 2015년 이후 데이터만 필터링
@@ -2035,7 +1905,7 @@ with tab2:
             # 1. 환자 데이터 준비 (나이 기준으로)
             if not df.empty and 'OD_mm' in df.columns and 'OS_mm' in df.columns and dob is not None:
                 # 환자 나이 계산
-                patient_ages = df["date"].apply(lambda d: _years_between(pd.Timestamp(dob), d))
+                patient_ages = _age_at_dates(df["date"], dob, None)
                 
                 # 마이너스 나이 필터링 (생년월일 이전 날짜 제거)
                 valid_age_mask = patient_ages >= 0
@@ -2065,7 +1935,7 @@ with tab2:
             
             # 2. 백분위 곡선을 배경에 추가 (그림과 같은 스타일)
             male_data, female_data = get_axial_length_nomogram()
-            nomogram_data = male_data if patient_sex == "남" else female_data
+            nomogram_data = male_data if patient_sex == "M" else female_data
             
             # 그림자 영역 추가 (p50 중심으로 p25-p75 영역)
             if 'p25' in nomogram_data and 'p75' in nomogram_data:
@@ -2156,7 +2026,7 @@ with tab2:
             # 레이아웃 업데이트 (그림과 같은 스타일)
             if dob is not None:
                 x_title = "나이 (연)"
-                title_suffix = f"({patient_sex}성 백분위 곡선 포함, 2015년 이후)"
+                title_suffix = f"({'남' if patient_sex == 'M' else '여'}성 백분위 곡선 포함, 2015년 이후)"
             else:
                 x_title = "날짜"
                 title_suffix = f"(생년월일 미입력, 2015년 이후)"
@@ -2282,7 +2152,7 @@ with tab2:
                         # +3개월 후 날짜 계산
                         if dob is not None:
                             # 나이 기준으로 +3개월 (0.25년)
-                            patient_ages = df["date"].apply(lambda d: _years_between(pd.Timestamp(dob), d))
+                            patient_ages = _age_at_dates(df["date"], dob, None)
                             # 마이너스 나이 필터링
                             valid_ages = patient_ages[patient_ages >= 0]
                             if not valid_ages.empty:
@@ -2312,7 +2182,7 @@ with tab2:
             if st.session_state.view_mode == 'fitting' and not df.empty and ('date' in df.columns):
                 patient_dates = df['date'].dropna()
                 if not patient_dates.empty and dob is not None:
-                    patient_ages = df["date"].apply(lambda d: _years_between(pd.Timestamp(dob), d))
+                    patient_ages = _age_at_dates(df["date"], dob, None)
                     # 마이너스 나이 필터링
                     valid_ages = patient_ages[patient_ages >= 0]
                     if not valid_ages.empty:
@@ -2371,7 +2241,7 @@ with tab2:
                         st.write("샘플 날짜들:", sample_dates.tolist())
                         
                         # 나이 계산 결과 확인
-                        ages = df["date"].apply(lambda d: _years_between(pd.Timestamp(dob), d))
+                        ages = _age_at_dates(df["date"], dob, None)
                         st.write("계산된 나이들:", ages.dropna().tolist())
                         st.write("나이 범위:", f"{ages.min():.2f} ~ {ages.max():.2f}세")
                         
@@ -2395,7 +2265,7 @@ with tab2:
                 st.warning("⚠️ 차트에 표시할 데이터가 없습니다. 안축장 데이터를 입력해주세요.")
                 # 기본 백분위 곡선만 표시
                 male_data, female_data = get_axial_length_nomogram()
-                nomogram_data = male_data if patient_sex == "남" else female_data
+                nomogram_data = male_data if patient_sex == "M" else female_data
                 
                 # 50% 백분위만 표시
                 fig.add_trace(go.Scatter(
@@ -2516,38 +2386,38 @@ with tab2:
                         with col_btn1:
                             if st.button("💾 수정 저장", use_container_width=True, key=f"save_axl_edit_{idx}"):
                                 # 데이터 수정
-                                st.session_state.data_axl.loc[original_idx, 'date'] = pd.to_datetime(edit_date)
-                                st.session_state.data_axl.loc[original_idx, 'OD_mm'] = edit_od_mm
-                                st.session_state.data_axl.loc[original_idx, 'OS_mm'] = edit_os_mm
-                                st.session_state.data_axl.loc[original_idx, 'remarks'] = edit_remarks
+                                _get_data("axl").loc[original_idx, 'date'] = pd.to_datetime(edit_date)
+                                _get_data("axl").loc[original_idx, 'OD_mm'] = edit_od_mm
+                                _get_data("axl").loc[original_idx, 'OS_mm'] = edit_os_mm
+                                _get_data("axl").loc[original_idx, 'remarks'] = edit_remarks
                                 
                                 # 날짜순 정렬
-                                st.session_state.data_axl = st.session_state.data_axl.sort_values("date").reset_index(drop=True)
+                                st.session_state.data_axl = _get_data("axl").sort_values("date").reset_index(drop=True)
                                 
                                 st.success(f"{original_date} 안축장 데이터가 수정되었습니다!")
-                                if name: save_bundle(name)
+                                if name: record_bundle(name, "axl", added=_get_data("axl")[_get_data("axl")["date"] == pd.to_datetime(edit_date)], deleted=[original_date])
                                 st.rerun()
                         
                         with col_btn2:
                             if st.button("🗑️ 삭제", use_container_width=True, type="secondary", key=f"delete_axl_row_{idx}"):
                                 # 데이터 삭제
-                                st.session_state.data_axl = st.session_state.data_axl.drop(original_idx).reset_index(drop=True)
+                                st.session_state.data_axl = _get_data("axl").drop(original_idx).reset_index(drop=True)
                                 
                                 st.success(f"{original_date} 안축장 데이터가 삭제되었습니다!")
-                                if name: save_bundle(name)
+                                if name: record_bundle(name, "axl", deleted=[original_date])
                                 st.rerun()
             else:
                 st.info("수정할 안축장 데이터가 없습니다.")
         
         elif graph_type == "굴절이상" and has_re:
-            df = st.session_state.data_re.copy()
+            df = _get_data("re").copy()
             
             # 생년월일 정보 가져오기
             dob = st.session_state.meta.get("dob")
             
             # 나이 계산
             if dob is not None:
-                patient_ages = df["date"].apply(lambda d: _years_between(pd.Timestamp(dob), d))
+                patient_ages = _age_at_dates(df["date"], dob, None)
                 # 마이너스 나이 필터링
                 valid_age_mask = patient_ages >= 0
                 if not valid_age_mask.all():
@@ -2743,31 +2613,31 @@ with tab2:
                                 edit_os_se = edit_os_sph + edit_os_cyl / 2.0
                                 
                                 # 데이터 수정
-                                st.session_state.data_re.loc[original_idx_re, 'date'] = pd.to_datetime(edit_date_re)
-                                st.session_state.data_re.loc[original_idx_re, 'OD_sph'] = edit_od_sph
-                                st.session_state.data_re.loc[original_idx_re, 'OD_cyl'] = edit_od_cyl
-                                st.session_state.data_re.loc[original_idx_re, 'OD_axis'] = edit_od_axis
-                                st.session_state.data_re.loc[original_idx_re, 'OS_sph'] = edit_os_sph
-                                st.session_state.data_re.loc[original_idx_re, 'OS_cyl'] = edit_os_cyl
-                                st.session_state.data_re.loc[original_idx_re, 'OS_axis'] = edit_os_axis
-                                st.session_state.data_re.loc[original_idx_re, 'OD_SE'] = edit_od_se
-                                st.session_state.data_re.loc[original_idx_re, 'OS_SE'] = edit_os_se
-                                st.session_state.data_re.loc[original_idx_re, 'remarks'] = edit_remarks_re
+                                _get_data("re").loc[original_idx_re, 'date'] = pd.to_datetime(edit_date_re)
+                                _get_data("re").loc[original_idx_re, 'OD_sph'] = edit_od_sph
+                                _get_data("re").loc[original_idx_re, 'OD_cyl'] = edit_od_cyl
+                                _get_data("re").loc[original_idx_re, 'OD_axis'] = edit_od_axis
+                                _get_data("re").loc[original_idx_re, 'OS_sph'] = edit_os_sph
+                                _get_data("re").loc[original_idx_re, 'OS_cyl'] = edit_os_cyl
+                                _get_data("re").loc[original_idx_re, 'OS_axis'] = edit_os_axis
+                                _get_data("re").loc[original_idx_re, 'OD_SE'] = edit_od_se
+                                _get_data("re").loc[original_idx_re, 'OS_SE'] = edit_os_se
+                                _get_data("re").loc[original_idx_re, 'remarks'] = edit_remarks_re
                                 
                                 # 날짜순 정렬
-                                st.session_state.data_re = st.session_state.data_re.sort_values("date").reset_index(drop=True)
+                                st.session_state.data_re = _get_data("re").sort_values("date").reset_index(drop=True)
                                 
                                 st.success(f"{original_date_re} 굴절이상 데이터가 수정되었습니다!")
-                                if name: save_bundle(name)
+                                if name: record_bundle(name, "re", added=_get_data("re")[_get_data("re")["date"] == pd.to_datetime(edit_date_re)], deleted=[original_date_re])
                                 st.rerun()
                         
                         with col_btn2:
                             if st.button("🗑️ 삭제", use_container_width=True, type="secondary", key=f"delete_re_row_{idx}"):
                                 # 데이터 삭제
-                                st.session_state.data_re = st.session_state.data_re.drop(original_idx_re).reset_index(drop=True)
+                                st.session_state.data_re = _get_data("re").drop(original_idx_re).reset_index(drop=True)
                                 
                                 st.success(f"{original_date_re} 굴절이상 데이터가 삭제되었습니다!")
-                                if name: save_bundle(name)
+                                if name: record_bundle(name, "re", deleted=[original_date_re])
                                 st.rerun()
             else:
                 st.info("수정할 굴절이상 데이터가 없습니다.")
@@ -2777,17 +2647,17 @@ with tab2:
             st.markdown("##### 이중축 그래프 (안축장 + 굴절이상)")
             
             # 안축장 데이터
-            df_axl = st.session_state.data_axl.copy()
+            df_axl = _get_data("axl").copy()
             # 굴절이상 데이터 (SE 사용)
-            df_re = st.session_state.data_re.copy()
+            df_re = _get_data("re").copy()
             
             # 생년월일 정보 가져오기
             dob = st.session_state.meta.get("dob")
             
             # 나이 계산
             if dob is not None:
-                axl_ages = df_axl["date"].apply(lambda d: _years_between(pd.Timestamp(dob), d))
-                re_ages = df_re["date"].apply(lambda d: _years_between(pd.Timestamp(dob), d))
+                axl_ages = _age_at_dates(df_axl["date"], dob, None)
+                re_ages = _age_at_dates(df_re["date"], dob, None)
                 
                 # 마이너스 나이 필터링
                 axl_valid_mask = axl_ages >= 0
@@ -2953,7 +2823,7 @@ with tab2:
         if has_k:
             st.markdown("---")
             st.markdown("##### 📊 각막곡률 데이터")
-            df_k = st.session_state.data_k.copy()
+            df_k = _get_data("k").copy()
             
             if not df_k.empty:
                 # 표시용 데이터 준비 (K1, K2, meanK 모두 포함)
@@ -2974,7 +2844,7 @@ with tab2:
         if has_ct:
             st.markdown("---")
             st.markdown("##### 📊 각막두께 데이터")
-            df_ct = st.session_state.data_ct.copy()
+            df_ct = _get_data("ct").copy()
             
             if not df_ct.empty:
                 # 표시용 데이터 준비
@@ -2998,7 +2868,7 @@ with tab2:
         treatment_history = []
         
         if has_axl:
-            for _, row in st.session_state.data_axl.iterrows():
+            for _, row in _get_data("axl").iterrows():
                 if isinstance(row['remarks'], list) and row['remarks']:
                     for remark in row['remarks']:
                         treatment_history.append({
@@ -3008,7 +2878,7 @@ with tab2:
                         })
         
         if has_re:
-            for _, row in st.session_state.data_re.iterrows():
+            for _, row in _get_data("re").iterrows():
                 if isinstance(row['remarks'], list) and row['remarks']:
                     for remark in row['remarks']:
                         treatment_history.append({
@@ -3018,7 +2888,7 @@ with tab2:
                         })
         
         if has_k:
-            for _, row in st.session_state.data_k.iterrows():
+            for _, row in _get_data("k").iterrows():
                 if isinstance(row['remarks'], list) and row['remarks']:
                     for remark in row['remarks']:
                         treatment_history.append({
@@ -3028,7 +2898,7 @@ with tab2:
                         })
         
         if has_ct:
-            for _, row in st.session_state.data_ct.iterrows():
+            for _, row in _get_data("ct").iterrows():
                 if isinstance(row['remarks'], list) and row['remarks']:
                     for remark in row['remarks']:
                         treatment_history.append({
@@ -3071,47 +2941,10 @@ with tab2:
                     end_date = dates_used[0] if dates_used else ""
                     total_period = "1일"
                 
-                # 시작일과 종료일에 나이와 개월수 추가
-                start_age_info = ""
-                end_age_info = ""
-                
-                if start_date and st.session_state.meta.get("dob"):
-                    try:
-                        # 단일 날짜에 대한 나이 계산
-                        from datetime import datetime
-                        start_dt = datetime.strptime(start_date, '%Y-%m-%d')
-                        dob = st.session_state.meta.get("dob")
-                        if dob:
-                            dob_dt = datetime.combine(dob, datetime.min.time())
-                            age_days = (start_dt - dob_dt).days
-                            age_years = age_days // 365
-                            age_months = (age_days % 365) // 30
-                            start_age_info = f"{start_date}\n({age_years}세 {age_months}개월)"
-                        else:
-                            start_age_info = start_date
-                    except:
-                        start_age_info = start_date
-                else:
-                    start_age_info = start_date
-                
-                if end_date and st.session_state.meta.get("dob"):
-                    try:
-                        # 단일 날짜에 대한 나이 계산
-                        from datetime import datetime
-                        end_dt = datetime.strptime(end_date, '%Y-%m-%d')
-                        dob = st.session_state.meta.get("dob")
-                        if dob:
-                            dob_dt = datetime.combine(dob, datetime.min.time())
-                            age_days = (end_dt - dob_dt).days
-                            age_years = age_days // 365
-                            age_months = (age_days % 365) // 30
-                            end_age_info = f"{end_date}\n({age_years}세 {age_months}개월)"
-                        else:
-                            end_age_info = end_date
-                    except:
-                        end_age_info = end_date
-                else:
-                    end_age_info = end_date
+                # 시작일과 종료일에 나이와 개월수 추가 (차트와 같은 나이 계산)
+                dob = st.session_state.meta.get("dob")
+                start_age_info = _age_label(start_date, dob)
+                end_age_info = _age_label(end_date, dob)
                 
                 row = [treatment, start_age_info, end_age_info, total_period]
                 table_data.append(row)
@@ -3148,33 +2981,48 @@ with tab3:
         
         # 선택된 데이터에 대한 예측 분석 표시
         if analyze_axl and has_axl:
-            df_axl = st.session_state.data_axl.copy()
+            df_axl = _get_data("axl").copy()
             ages_axl = _age_at_dates(df_axl["date"], st.session_state.meta.get("dob"), st.session_state.meta.get("current_age"))
             
             if ages_axl is not None:
                 st.markdown("#### 안축장 20세 예측")
                 
                 # 예측 모델 선택
-                model_choice_axl = st.radio("예측 모델", ["회귀(선형/로그)", "추천(자동/치료조정)"], horizontal=True, key="axl_model_tab3")
+                model_choice_axl = st.radio("예측 모델", ["회귀(선형/로그)", "추천(자동/치료조정)", "백분위 추적(노모그램)"], horizontal=True, key="axl_model_tab3")
+                # 부트스트랩은 환자당 수 ms라 매 재실행마다 다시 계산 (백분위 추적은 z 흩어짐으로 구간 계산)
+                boot_axl = 0
+                if not model_choice_axl.startswith("백분위"):
+                    boot_axl = BOOTSTRAP_SAMPLES if st.checkbox("부트스트랩 예측구간", key="axl_boot_tab3") else 0
                 
                 if model_choice_axl.startswith("회귀"):
                     trend_mode_axl = st.radio("추세선 모드", ["선형(Linear)", "로그(Log)"], horizontal=True, key="axl_trend_tab3")
                     mode_key_axl = "linear" if trend_mode_axl.startswith("선형") else "log"
-                    res_od_axl = _trend_and_predict(ages_axl, df_axl["OD_mm"], mode=mode_key_axl)
-                    res_os_axl = _trend_and_predict(ages_axl, df_axl["OS_mm"], mode=mode_key_axl)
+                    res_od_axl = trend_and_predict(ages_axl, df_axl["OD_mm"], mode=mode_key_axl, bootstrap=boot_axl)
+                    res_os_axl = trend_and_predict(ages_axl, df_axl["OS_mm"], mode=mode_key_axl, bootstrap=boot_axl)
+                elif model_choice_axl.startswith("백분위"):
+                    # 성별을 모르면 노모그램을 고를 수 없으므로 예측/그래프를 건너뜀
+                    sex_raw = st.session_state.meta.get("sex")
+                    res_od_axl = res_os_axl = None
+                    if normalize_sex(sex_raw) is None:
+                        st.info("백분위 추적에는 성별이 필요합니다.")
+                    else:
+                        res_od_axl = centile_predict(ages_axl, df_axl["OD_mm"], sex_raw)
+                        res_os_axl = centile_predict(ages_axl, df_axl["OS_mm"], sex_raw)
                 else:
-                    res_od_axl = _recommendation_predict(ages_axl, df_axl["OD_mm"], df_axl.get("remarks"))
-                    res_os_axl = _recommendation_predict(ages_axl, df_axl["OS_mm"], df_axl.get("remarks"))
+                    res_od_axl = recommendation_predict(ages_axl, df_axl["OD_mm"], df_axl.get("remarks"), bootstrap=boot_axl)
+                    res_os_axl = recommendation_predict(ages_axl, df_axl["OS_mm"], df_axl.get("remarks"), bootstrap=boot_axl)
                 
-                if res_od_axl["valid"] or res_os_axl["valid"]:
+                if res_od_axl is not None and (res_od_axl["valid"] or res_os_axl["valid"]):
                     # 간단한 예측 결과
                     col1, col2 = st.columns(2)
                     with col1:
                         if res_od_axl["valid"]:
                             st.success(f"**OD**: {res_od_axl['last_value']:.2f}mm → {res_od_axl['pred_at_20']:.2f}mm")
+                            st.caption(_interval_text(res_od_axl, "mm"))
                     with col2:
                         if res_os_axl["valid"]:
                             st.success(f"**OS**: {res_os_axl['last_value']:.2f}mm → {res_os_axl['pred_at_20']:.2f}mm")
+                            st.caption(_interval_text(res_os_axl, "mm"))
                     
                     # 상세 예측 그래프 (Matplotlib)
                     if st.checkbox("상세 예측 그래프 보기", key="show_axl_detail_tab3"):
@@ -3186,7 +3034,20 @@ with tab3:
                         y_od = np.array(df_axl["OD_mm"], dtype=float)
                         y_os = np.array(df_axl["OS_mm"], dtype=float)
                         
-                        if model_choice_axl.startswith("회귀"):
+                        if model_choice_axl.startswith("백분위"):
+                            # 현재 백분위(마지막 측정의 z)를 따라가는 노모그램 궤적
+                            x_plot = x_age[log_mask]
+                            if x_plot.size > 0:
+                                x_from = float(np.nanmin(x_plot))
+                                x_to = max(20.0, float(np.nanmax(x_plot)))
+                                x_line = np.linspace(x_from, x_to, 200)
+                                for eye, y_eye, res_eye, marker in (("OD", y_od, res_od_axl, "o"), ("OS", y_os, res_os_axl, "s")):
+                                    ax2.scatter(x_plot, y_eye[log_mask], label=f"{eye} 데이터", marker=marker, alpha=0.7)
+                                    if res_eye["valid"]:
+                                        line, = ax2.plot(x_line, nomogram_al(res_eye["sex"], x_line, res_eye["z_last"]),
+                                                         label=f"{eye} 백분위 궤적(P{res_eye['centile_last']:.0f})", linestyle="--")
+                                        _shade_prediction(ax2, res_eye, x_line, line)
+                        elif model_choice_axl.startswith("회귀"):
                             current_mode = "log" if ('mode_key_axl' in locals() and mode_key_axl == "log") else "linear"
                             mask_use = log_mask if current_mode == "log" else finite_mask
                             x_plot = x_age[mask_use]
@@ -3204,10 +3065,12 @@ with tab3:
                                 x_line = np.linspace(x_from, x_to, 200)
                                 if res_od_axl["valid"]:
                                     y_line_od = (res_od_axl["slope"] * np.log(x_line) + res_od_axl["intercept"]) if current_mode == "log" else (res_od_axl["slope"] * x_line + res_od_axl["intercept"]) 
-                                    ax2.plot(x_line, y_line_od, label=f"OD 추세({current_mode})", linestyle="--")
+                                    line, = ax2.plot(x_line, y_line_od, label=f"OD 추세({current_mode})", linestyle="--")
+                                    _shade_prediction(ax2, res_od_axl, x_line, line)
                                 if res_os_axl["valid"]:
                                     y_line_os = (res_os_axl["slope"] * np.log(x_line) + res_os_axl["intercept"]) if current_mode == "log" else (res_os_axl["slope"] * x_line + res_os_axl["intercept"]) 
-                                    ax2.plot(x_line, y_line_os, label=f"OS 추세({current_mode})", linestyle="--")
+                                    line, = ax2.plot(x_line, y_line_os, label=f"OS 추세({current_mode})", linestyle="--")
+                                    _shade_prediction(ax2, res_os_axl, x_line, line)
                         else:
                             mode_od = res_od_axl.get("chosen_mode") or "linear"
                             mode_os = res_os_axl.get("chosen_mode") or "linear"
@@ -3227,7 +3090,8 @@ with tab3:
                                 x_line = np.linspace(x_from, x_to, 200)
                                 if res_od_axl["valid"]:
                                     y_line_od = (res_od_axl["slope"] * np.log(x_line) + res_od_axl["intercept"]) if mode_od == "log" else (res_od_axl["slope"] * x_line + res_od_axl["intercept"]) 
-                                    ax2.plot(x_line, y_line_od, label=f"OD 추세({mode_od})", linestyle="--")
+                                    line, = ax2.plot(x_line, y_line_od, label=f"OD 추세({mode_od})", linestyle="--")
+                                    _shade_prediction(ax2, res_od_axl, x_line, line)
                             if x_plot_os.size > 0:
                                 x_min = float(np.nanmin(x_plot_os))
                                 x_max = float(np.nanmax(x_plot_os))
@@ -3237,8 +3101,8 @@ with tab3:
                                 x_line = np.linspace(x_from, x_to, 200)
                                 if res_os_axl["valid"]:
                                     y_line_os = (res_os_axl["slope"] * np.log(x_line) + res_os_axl["intercept"]) if mode_os == "log" else (res_os_axl["slope"] * x_line + res_os_axl["intercept"]) 
-                                    ax2.plot(x_line, y_line_os, label=f"OS 추세({mode_os})", linestyle="--")
-                        
+                                    line, = ax2.plot(x_line, y_line_os, label=f"OS 추세({mode_os})", linestyle="--")
+                                    _shade_prediction(ax2, res_os_axl, x_line, line)
                         # 20세 예측점
                         ax2.axvline(20.0, color='red', linestyle=":", alpha=0.6, label="20세")
                         if res_od_axl["valid"] and np.isfinite(res_od_axl["pred_at_20"]):
@@ -3258,7 +3122,7 @@ with tab3:
                 st.info("20세 예측을 위해 생년월일을 입력하세요.")
         
         if analyze_re and has_re:
-            df_re = st.session_state.data_re.copy()
+            df_re = _get_data("re").copy()
             ages_re = _age_at_dates(df_re["date"], st.session_state.meta.get("dob"), st.session_state.meta.get("current_age"))
             
             if ages_re is not None:
@@ -3266,15 +3130,17 @@ with tab3:
                 
                 # 예측 모델 선택
                 model_choice_re = st.radio("예측 모델", ["회귀(선형/로그)", "추천(자동/치료조정)"], horizontal=True, key="re_model_tab3")
+                # 부트스트랩은 환자당 수 ms라 매 재실행마다 다시 계산
+                boot_re = BOOTSTRAP_SAMPLES if st.checkbox("부트스트랩 예측구간", key="re_boot_tab3") else 0
                 
                 if model_choice_re.startswith("회귀"):
                     trend_mode_re = st.radio("추세선 모드", ["선형(Linear)", "로그(Log)"], horizontal=True, key="re_trend_tab3")
                     mode_key_re = "linear" if trend_mode_re.startswith("선형") else "log"
-                    res_od_re = _trend_and_predict(ages_re, df_re["OD_SE"], mode=mode_key_re)
-                    res_os_re = _trend_and_predict(ages_re, df_re["OS_SE"], mode=mode_key_re)
+                    res_od_re = trend_and_predict(ages_re, df_re["OD_SE"], mode=mode_key_re, bootstrap=boot_re)
+                    res_os_re = trend_and_predict(ages_re, df_re["OS_SE"], mode=mode_key_re, bootstrap=boot_re)
                 else:
-                    res_od_re = _recommendation_predict(ages_re, df_re["OD_SE"], df_re.get("remarks"))
-                    res_os_re = _recommendation_predict(ages_re, df_re["OS_SE"], df_re.get("remarks"))
+                    res_od_re = recommendation_predict(ages_re, df_re["OD_SE"], df_re.get("remarks"), bootstrap=boot_re)
+                    res_os_re = recommendation_predict(ages_re, df_re["OS_SE"], df_re.get("remarks"), bootstrap=boot_re)
                 
                 if res_od_re["valid"] or res_os_re["valid"]:
                     # 간단한 예측 결과
@@ -3283,9 +3149,11 @@ with tab3:
                     with col1:
                         if res_od_re["valid"]:
                             st.success(f"**OD**: {res_od_re['last_value']:.2f}{unit} → {res_od_re['pred_at_20']:.2f}{unit}")
+                            st.caption(_interval_text(res_od_re, unit))
                     with col2:
                         if res_os_re["valid"]:
                             st.success(f"**OS**: {res_os_re['last_value']:.2f}{unit} → {res_os_re['pred_at_20']:.2f}{unit}")
+                            st.caption(_interval_text(res_os_re, unit))
                     
                     # 상세 예측 그래프 (Matplotlib)
                     if st.checkbox("상세 예측 그래프 보기", key="show_re_detail_tab3"):
@@ -3324,10 +3192,12 @@ with tab3:
                                 x_line = np.linspace(x_from, x_to, 200)
                                 if res_od_re["valid"]:
                                     y_line_od = (res_od_re["slope"] * np.log(x_line) + res_od_re["intercept"]) if current_mode == "log" else (res_od_re["slope"] * x_line + res_od_re["intercept"])
-                                    ax2.plot(x_line, y_line_od, label=f"OD 추세({current_mode})", linestyle="--")
+                                    line, = ax2.plot(x_line, np.abs(y_line_od), label=f"OD 추세({current_mode})", linestyle="--")
+                                    _shade_prediction(ax2, res_od_re, x_line, line, absolute=True)
                                 if res_os_re["valid"]:
                                     y_line_os = (res_os_re["slope"] * np.log(x_line) + res_os_re["intercept"]) if current_mode == "log" else (res_os_re["slope"] * x_line + res_os_re["intercept"])
-                                    ax2.plot(x_line, y_line_os, label=f"OS 추세({current_mode})", linestyle="--")
+                                    line, = ax2.plot(x_line, np.abs(y_line_os), label=f"OS 추세({current_mode})", linestyle="--")
+                                    _shade_prediction(ax2, res_os_re, x_line, line, absolute=True)
                         else:
                             # 추천 모드: chosen_mode에 따라 모드 선택
                             mode_od = res_od_re.get("chosen_mode") or "linear"
@@ -3352,8 +3222,8 @@ with tab3:
                                 x_line = np.linspace(x_from_od, x_to_od, 200)
                                 if res_od_re["valid"]:
                                     y_line_od = (res_od_re["slope"] * np.log(x_line) + res_od_re["intercept"]) if mode_od == "log" else (res_od_re["slope"] * x_line + res_od_re["intercept"])
-                                    ax2.plot(x_line, y_line_od, label=f"OD 추세({mode_od})", linestyle="--")
-                            
+                                    line, = ax2.plot(x_line, np.abs(y_line_od), label=f"OD 추세({mode_od})", linestyle="--")
+                                    _shade_prediction(ax2, res_od_re, x_line, line, absolute=True)
                             if x_plot_os.size > 0:
                                 x_min_os = float(np.nanmin(x_plot_os))
                                 x_max_os = float(np.nanmax(x_plot_os))
@@ -3366,9 +3236,8 @@ with tab3:
                                 x_line = np.linspace(x_from_os, x_to_os, 200)
                                 if res_os_re["valid"]:
                                     y_line_os = (res_os_re["slope"] * np.log(x_line) + res_os_re["intercept"]) if mode_os == "log" else (res_os_re["slope"] * x_line + res_os_re["intercept"])
-                                    ax2.plot(x_line, y_line_os, label=f"OS 추세({mode_os})", linestyle="--")
-
-                        
+                                    line, = ax2.plot(x_line, np.abs(y_line_os), label=f"OS 추세({mode_os})", linestyle="--")
+                                    _shade_prediction(ax2, res_os_re, x_line, line, absolute=True)
                         # 20세 예측점
                         ax2.axvline(20.0, color='red', linestyle=":", alpha=0.6, label="20세")
                         if res_od_re["valid"] and np.isfinite(res_od_re["pred_at_20"]):
@@ -3394,7 +3263,7 @@ with tab3:
         treatment_history = []
         
         if has_axl:
-            for _, row in st.session_state.data_axl.iterrows():
+            for _, row in _get_data("axl").iterrows():
                 if isinstance(row['remarks'], list) and row['remarks']:
                     for remark in row['remarks']:
                         treatment_history.append({
@@ -3404,7 +3273,7 @@ with tab3:
                         })
         
         if has_re:
-            for _, row in st.session_state.data_re.iterrows():
+            for _, row in _get_data("re").iterrows():
                 if isinstance(row['remarks'], list) and row['remarks']:
                     for remark in row['remarks']:
                         treatment_history.append({
@@ -3414,7 +3283,7 @@ with tab3:
                         })
         
         if has_k:
-            for _, row in st.session_state.data_k.iterrows():
+            for _, row in _get_data("k").iterrows():
                 if isinstance(row['remarks'], list) and row['remarks']:
                     for remark in row['remarks']:
                         treatment_history.append({
@@ -3424,7 +3293,7 @@ with tab3:
                         })
         
         if has_ct:
-            for _, row in st.session_state.data_ct.iterrows():
+            for _, row in _get_data("ct").iterrows():
                 if isinstance(row['remarks'], list) and row['remarks']:
                     for remark in row['remarks']:
                         treatment_history.append({
@@ -3640,7 +3509,7 @@ st.markdown(
     - 角膜曲率(K1, K2, Mean K)は右眼(OD)と左眼(OS)で区別して保存されます。
     - 角膜厚はマイクロメートル(μm)単位で右眼(OD)と左眼(OS)で区別して保存されます。
     - 詳細な内容については、直接お問い合わせください。 
-    - 眼軸長`data.csv`、屈折異常`re_data.csv`、角膜曲率`k_data.csv`、角膜厚`ct_data.csv`で別々に保存されます。  
+    - 眼軸長`data`、屈折異常`re_data`、角膜曲率`k_data`、角膜厚`ct_data`で別々に保存されます（既定はParquet形式、既存のCSVは読み込み時に自動移行）。  
     - 屈折異常は**球面等価(SE = S + C/2)**をトレンド/予測に使用します。軸(Axis)は保存されますが予測には使用しません。  
     """,
     unsafe_allow_html=True
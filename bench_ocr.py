@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+OCR 전처리 벤치마크: 인쇄물 샘플에 대해 전처리 설정별 OCR 지연시간과 AL 추출 정확도를 비교합니다.
+
+샘플은 --fixtures 폴더의 이미지와 정답 truth.csv(file, od_al, os_al)를 사용합니다.
+폴더를 주지 않으면 합성 인쇄물을 만듭니다 (A4 300dpi 스캔 / 기울어지고 조명이 고르지 않은 12MP 휴대폰 사진).
+
+사용 예:
+  python bench_ocr.py
+  python bench_ocr.py --fixtures ./ocr_samples --repeat 3
+  python bench_ocr.py --save-fixtures ./ocr_samples -n 12
+"""
+from __future__ import annotations
+
+import argparse
+import io
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+import pytesseract
+from PIL import Image, ImageDraw, ImageFont
+
+from axl_ocr import OCR_LANG, PREPROCESS_DEFAULTS, get_engine, load_ocr_image, parse_axl_image_ocr
+
+# 비교할 전처리 설정 ("raw"는 기존 동작: 회색조 변환만)
+CONFIGS = {
+    "raw": {},
+    "resize": {"target_dpi": PREPROCESS_DEFAULTS["target_dpi"], "max_side": PREPROCESS_DEFAULTS["max_side"]},
+    "default": PREPROCESS_DEFAULTS,
+    "default+crop": dict(PREPROCESS_DEFAULTS, crop_text=True),
+}
+
+# =========================
+#  합성 인쇄물
+# =========================
+def _render_printout(od_al: float, os_al: float, exam_date: date, rng: np.random.Generator) -> Image.Image:
+    """IOLMaster 형식 A4(300dpi) 결과지: 좌측 OD, 우측 OS 열"""
+    img = Image.new("L", (2480, 3508), 255)
+    draw = ImageDraw.Draw(img)
+    big, body = ImageFont.load_default(size=64), ImageFont.load_default(size=48)
+    draw.text((150, 180), "IOLMaster 700  Biometry", font=big, fill=0)
+    draw.text((1500, 180), exam_date.isoformat(), font=big, fill=0)
+    draw.text((150, 320), f"Patient ID: {rng.integers(10000, 99999)}", font=body, fill=0)
+    for x, eye, al in ((150, "OD right", od_al), (1300, "OS left", os_al)):
+        draw.text((x, 600), eye, font=big, fill=0)
+        rows = [f"AL: {al:.2f} mm", f"ACD: {rng.uniform(2.8, 3.8):.2f} mm",
+                f"LT: {rng.uniform(3.2, 4.2):.2f} mm", f"WTW: {rng.uniform(11.0, 12.8):.1f} mm"]
+        for i, row in enumerate(rows):
+            draw.text((x, 760 + i * 110), row, font=body, fill=0)
+    img.info["dpi"] = (300, 300)
+    return img
+
+def _phone_photo(img: Image.Image, rng: np.random.Generator) -> Image.Image:
+    """휴대폰 촬영 흉내: 기울기, 12MP 확대, 조명 그라데이션, 잡음"""
+    img = img.rotate(rng.uniform(-3.0, 3.0), resample=Image.BICUBIC, expand=True, fillcolor=255)
+    img = img.resize((3000, 4000), Image.BICUBIC)
+    arr = np.asarray(img, dtype=np.float32)
+    shade = np.linspace(0.65, 1.0, arr.shape[1], dtype=np.float32)[None, :]
+    arr = arr * shade + rng.normal(0, 8, arr.shape).astype(np.float32)
+    return Image.fromarray(np.clip(arr, 0, 255).astype(np.uint8))
+
+def make_fixtures(n: int, seed: int = 0) -> List[Tuple[str, bytes, float, float]]:
+    """(파일 이름, 이미지 바이트, OD AL, OS AL) 목록. 짝수는 스캔(PNG), 홀수는 휴대폰 사진(JPEG)"""
+    rng = np.random.default_rng(seed)
+    out = []
+    for i in range(n):
+        od, os_ = round(rng.uniform(21.5, 27.5), 2), round(rng.uniform(21.5, 27.5), 2)
+        img = _render_printout(od, os_, date(2024, 1, 1) + timedelta(days=int(rng.integers(0, 600))), rng)
+        buf = io.BytesIO()
+        if i % 2:
+            _phone_photo(img, rng).save(buf, format="JPEG", quality=90)
+            name = f"synthetic_{i:02d}.jpg"
+        else:
+            img.save(buf, format="PNG", dpi=(300, 300))
+            name = f"synthetic_{i:02d}.png"
+        out.append((name, buf.getvalue(), od, os_))
+    return out
+
+def load_fixtures(directory: Path) -> List[Tuple[str, bytes, float, float]]:
+    truth = pd.read_csv(directory / "truth.csv")
+    return [(r.file, (directory / r.file).read_bytes(), float(r.od_al), float(r.os_al)) for r in truth.itertuples()]
+
+def save_fixtures(fixtures, directory: Path) -> None:
+    directory.mkdir(parents=True, exist_ok=True)
+    for name, data, _, _ in fixtures:
+        (directory / name).write_bytes(data)
+    pd.DataFrame([(n, od, os_) for n, _, od, os_ in fixtures],
+                 columns=["file", "od_al", "os_al"]).to_csv(directory / "truth.csv", index=False)
+
+# =========================
+#  측정
+# =========================
+def _has_tesseract() -> bool:
+    try:
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+def run(fixtures, repeat: int = 1, with_ocr: bool = True, engine: str = None) -> pd.DataFrame:
+    """설정별 전처리/OCR 시간(ms)과 눈 단위 정확도. OCR 캐시를 거치지 않고 매번 직접 실행합니다."""
+    ocr = get_engine(engine) if with_ocr else None
+    rows = []
+    for cfg_name, opts in CONFIGS.items():
+        pre_ms, ocr_ms, correct = [], [], 0
+        for name, data, od_true, os_true in fixtures:
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                img = load_ocr_image(data, opts)
+                t1 = time.perf_counter()
+                pre_ms.append((t1 - t0) * 1000)
+                if with_ocr:
+                    text = ocr.image_to_string(img, lang=OCR_LANG)
+                    ocr_ms.append((time.perf_counter() - t1) * 1000)
+            if with_ocr:
+                od, os_, _ = parse_axl_image_ocr(text)
+                correct += (od is not None and abs(od - od_true) < 0.005) + (os_ is not None and abs(os_ - os_true) < 0.005)
+        total = np.add(pre_ms, ocr_ms) if with_ocr else np.asarray(pre_ms)
+        rows.append({
+            "config": cfg_name,
+            "preprocess_ms": round(float(np.mean(pre_ms)), 1),
+            "ocr_ms": round(float(np.mean(ocr_ms)), 1) if with_ocr else np.nan,
+            "p95_total_ms": round(float(np.percentile(total, 95)), 1),
+            "accuracy": round(correct / (2 * len(fixtures)), 3) if with_ocr else np.nan,
+        })
+    return pd.DataFrame(rows)
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="OCR 전처리 설정별 지연시간/정확도 벤치마크")
+    ap.add_argument("--fixtures", type=Path, default=None, help="샘플 이미지 + truth.csv 폴더 (기본: 합성 샘플)")
+    ap.add_argument("-n", type=int, default=8, help="합성 샘플 수")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--repeat", type=int, default=1, help="샘플당 반복 횟수")
+    ap.add_argument("--engine", choices=["cli", "tesserocr"], default=None,
+                    help="OCR 엔진 (기본: AXL_OCR_ENGINE 또는 tesserocr가 있으면 tesserocr)")
+    ap.add_argument("--save-fixtures", type=Path, default=None, help="합성 샘플을 이 폴더에 저장하고 종료")
+    args = ap.parse_args(argv)
+
+    fixtures = load_fixtures(args.fixtures) if args.fixtures else make_fixtures(args.n, args.seed)
+    if args.save_fixtures:
+        save_fixtures(fixtures, args.save_fixtures)
+        print(f"{len(fixtures)}장 저장: {args.save_fixtures}")
+        return 0
+
+    with_ocr = _has_tesseract()
+    if not with_ocr:
+        print("tesseract를 찾을 수 없어 전처리 시간만 측정합니다.", file=sys.stderr)
+    print(f"샘플 {len(fixtures)}장, 반복 {args.repeat}회" + (f", 엔진 {get_engine(args.engine).name}" if with_ocr else ""))
+    print(run(fixtures, args.repeat, with_ocr, args.engine).to_string(index=False))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+자동굴절계 OCR 파서 처리량 벤치마크 (초당 인쇄물 수)
+
+fixtures/refractor의 OCR 텍스트를 반복해 수천 장 분량의 입력을 만들고 parse_refractor_text로 파싱합니다.
+
+사용 예:
+  python bench_refractor.py
+  python bench_refractor.py -n 20000 --repeat 5
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from axl_ocr import parse_refractor_text
+
+FIXTURES = Path(__file__).parent / "fixtures" / "refractor"
+
+def load_corpus(directory: Path = FIXTURES) -> list:
+    return [p.read_text(encoding="utf-8") for p in sorted(directory.glob("*.txt"))]
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="자동굴절계 OCR 파서 처리량 벤치마크")
+    ap.add_argument("-n", type=int, default=5000, help="파싱할 인쇄물 수")
+    ap.add_argument("--repeat", type=int, default=3, help="측정 반복 횟수 (최소/중앙값 보고)")
+    ap.add_argument("--fixtures", type=Path, default=FIXTURES, help="OCR 텍스트(*.txt) 폴더")
+    args = ap.parse_args(argv)
+
+    corpus = load_corpus(args.fixtures)
+    if not corpus:
+        print(f"OCR 텍스트가 없습니다: {args.fixtures}", file=sys.stderr)
+        return 1
+    texts = [corpus[i % len(corpus)] for i in range(args.n)]
+    times = []
+    for _ in range(args.repeat):
+        t0 = time.perf_counter()
+        ok = sum(parse_refractor_text(t).success for t in texts)
+        times.append(time.perf_counter() - t0)
+    best, median = min(times), float(np.median(times))
+    print(f"인쇄물 {args.n}장 (샘플 {len(corpus)}종), 추출 성공 {ok}장")
+    print(f"최소 {best * 1000:.1f} ms ({args.n / best:,.0f} 장/초), 중앙값 {median * 1000:.1f} ms")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
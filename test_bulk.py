@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+일괄 가져오기: 청크 정규화의 거부 사유/개수, 받아들인 행이 빠짐없이 어느 모달리티에든 저장되는지 테스트
+"""
+import pandas as pd
+import pytest
+
+from axl_bulk import bulk_import, normalize_chunk, split_by_kind
+from axl_storage import get_backend, load_frames
+
+ROWS = [
+    # patient_id, date, OD_mm, OD_sph, OD_SE, OS_axis, OD_ct
+    ("P1", "2024-01-10", "24.10", "", "", "", ""),     # AXL
+    ("P1", "2024-03-01", "", "-1.25", "", "", ""),     # RE (S)
+    ("P2", "2024-02-01", "", "", "-2.00", "", ""),     # RE (SE만)
+    ("P2", "2024-02-02", "", "", "", "90", ""),        # RE (축만)
+    ("P3", "2024-05-05", "", "", "", "", "545"),       # CT
+    ("P3", "2024-05-06", "", "", "", "", ""),          # 측정값 없음
+    ("P4", "not a date", "23.5", "", "", "", ""),      # 날짜 형식 오류
+    ("", "2024-01-01", "23.5", "", "", "", ""),        # 환자 ID 없음
+    ("P5", "2024-01-01", "23,5x", "", "", "", ""),     # 숫자 형식 오류
+]
+COLUMNS = ["patient_id", "date", "OD_mm", "OD_sph", "OD_SE", "OS_axis", "OD_ct"]
+
+def _chunk():
+    return pd.DataFrame(ROWS, columns=COLUMNS).replace("", None)
+
+def test_normalize_chunk_counts_and_reasons():
+    accepted, rejects = normalize_chunk(_chunk())
+    assert len(accepted) == 5 and len(rejects) == 4
+    assert sorted(rejects["reject_reason"]) == sorted(["측정값 없음", "날짜 형식 오류", "환자 ID 없음", "숫자 형식 오류: OD_mm"])
+
+def test_every_accepted_row_lands_in_a_modality():
+    accepted, _ = normalize_chunk(_chunk())
+    by_kind = split_by_kind(accepted)
+    stored = sum(len(frame) for frames in by_kind.values() for frame in frames.values())
+    # P1 AXL 1 + RE 1, P2 RE 2 (SE만 / 축만), P3 CT 1
+    assert stored == len(accepted) == 5
+    assert len(by_kind["re"]["P2"]) == 2
+    assert by_kind["re"]["P2"]["OD_SE"].iloc[0] == pytest.approx(-2.0)
+
+def test_bulk_import_stores_se_only_rows(tmp_path):
+    src = tmp_path / "export.csv"
+    pd.DataFrame(ROWS, columns=COLUMNS).to_csv(src, index=False)
+    stats = bulk_import(src, tmp_path / "data", backend_name="csv", workers=1, progress=lambda msg: None)
+    assert (stats["rows"], stats["accepted"], stats["rejected"], stats["patients"]) == (9, 5, 4, 3)
+    re = load_frames(tmp_path / "data" / "P2", get_backend("csv"))["re"]
+    assert len(re) == 2 and re["OD_SE"].iloc[0] == pytest.approx(-2.0)
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+안축장도 OCR: 결과 캐시 키, 단어 상자(image_to_data) AL 파서 테스트 (tesseract 없이 실행)
+"""
+import pytest
+
+import axl_ocr
+from axl_ocr import _axl_result_key, parse_axl_boxes
+
+IMAGE = b"\x89PNG fake printout"
+
+def test_axl_result_key_tracks_engine_and_preprocessing(monkeypatch):
+    base = _axl_result_key(IMAGE, None)
+    assert _axl_result_key(IMAGE, None) == base
+    monkeypatch.setitem(axl_ocr.PREPROCESS_DEFAULTS, "threshold", "otsu")
+    assert _axl_result_key(IMAGE, None) != base
+    monkeypatch.undo()
+    monkeypatch.setitem(axl_ocr._ENGINE_CACHE, "cli", type("Engine", (), {"name": "other"})())
+    monkeypatch.setenv("AXL_OCR_ENGINE", "cli")
+    assert _axl_result_key(IMAGE, None) != base
+
+def _data(words):
+    """(글자, left, top, width, height[, conf]) 목록 -> image_to_data 형식 dict"""
+    keys = ("text", "left", "top", "width", "height", "conf")
+    rows = [w if len(w) == 6 else (*w, 91.0) for w in words]
+    return {k: [r[i] for r in rows] for i, k in enumerate(keys)}
+
+def test_boxes_side_by_side():
+    # IOLMaster 형식: 왼쪽 열 OD, 오른쪽 열 OS, 라벨 오른쪽에 값, 아래에 다른 계측값과 IOL 도수
+    data = _data([
+        ("OD", 150, 600, 80, 40), ("OS", 1300, 600, 80, 40),
+        ("AL:", 150, 760, 60, 40), ("24.31", 230, 760, 100, 40, 88.0), ("mm", 340, 760, 60, 40),
+        ("AL:", 1300, 760, 60, 40), ("23.87", 1380, 760, 100, 40, 95.0), ("mm", 1490, 760, 60, 40),
+        ("ACD:", 150, 870, 80, 40), ("3.21", 240, 870, 80, 40),
+        ("ACD:", 1300, 870, 80, 40), ("3.35", 1390, 870, 80, 40),
+        ("IOL", 150, 980, 60, 40), ("+21.50", 230, 980, 120, 40), ("IOL", 1300, 980, 60, 40), ("21.50D", 1380, 980, 120, 40),
+    ])
+    res = parse_axl_boxes(data)
+    assert (res["od_al"], res["os_al"], res["success"]) == (24.31, 23.87, True)
+    assert res["od_conf"] == pytest.approx(0.88) and res["os_conf"] == pytest.approx(0.95)
+
+def test_boxes_stacked_with_value_below_label():
+    # OD 블록 위, OS 블록 아래, 값은 라벨 바로 아래 줄. 첫 AL이 눈마다 우선 (아래의 평균 AL은 무시)
+    data = _data([
+        ("RIGHT", 100, 100, 120, 40),
+        ("AL", 100, 200, 50, 40), ("25.02mm", 100, 260, 160, 40),
+        ("AL", 100, 400, 50, 40), ("25.10mm", 100, 460, 160, 40),
+        ("LEFT", 100, 700, 100, 40),
+        ("AL", 100, 800, 50, 40), ("24.76mm", 100, 860, 160, 40),
+    ])
+    res = parse_axl_boxes(data)
+    assert (res["od_al"], res["os_al"]) == (25.02, 24.76)
+
+def test_boxes_reject_non_al_numbers():
+    # 라벨 옆이라도 123.45, 부호 붙은 값, D 단위 값은 AL로 보지 않음
+    data = _data([
+        ("OD", 150, 600, 80, 40), ("OS", 1300, 600, 80, 40),
+        ("AL:", 150, 760, 60, 40), ("123.45", 230, 760, 120, 40),
+        ("AL:", 1300, 760, 60, 40), ("+23.50", 1380, 760, 120, 40), ("23.50D", 1520, 760, 120, 40),
+    ])
+    assert parse_axl_boxes(data) == {"od_al": None, "os_al": None, "od_conf": None, "os_conf": None, "success": False}
+    # 라벨이 없으면 mm가 붙은 값만 위치로 배정
+    data = _data([("22.98", 100, 300, 100, 40), ("mm", 210, 300, 50, 40), ("21.00", 900, 300, 100, 40),
+                  ("23.40mm", 900, 400, 150, 40)])
+    res = parse_axl_boxes(data)
+    assert (res["od_al"], res["os_al"]) == (22.98, 23.40)
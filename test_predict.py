@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+일괄 예측(batch_predict)이 한 계열용 trend_and_predict / recommendation_predict와 같은 값을 내는지,
+예측구간(t 분포, 부트스트랩)이 예측치를 감싸는지, 노모그램 백분위 조회/추적 예측 테스트
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from axl_predict import (
+    PREDICT_COLUMNS, al_centile, al_zscore, batch_predict, bootstrap_interval, centile_crossings, centile_predict,
+    get_axial_length_nomogram, nomogram_al, nomogram_surface, prediction_band, recommendation_predict, t_critical, trend_and_predict,
+)
+
+REMARKS = [[], ["0.125% AT"], ["OK-lens", "low-dose AT"], ["DIMS"], ["MR"]]
+
+def _long_table(n_patients=60, seed=0):
+    """환자 x 눈 long format. 점 0~1개, 같은 나이 반복, 0세 이하, 결측, 마지막 값 0.0 그룹 포함"""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for pid in range(n_patients):
+        n = int(rng.integers(0, 8))
+        ages = np.sort(rng.uniform(-0.5, 19.0, n)) if pid % 7 else np.full(n, 8.0)
+        for eye in ("OD", "OS"):
+            values = 22.0 + 0.2 * ages + rng.normal(0, 0.1, n)
+            if pid % 5 == 0 and n:
+                values[rng.integers(0, n)] = np.nan
+            if pid % 11 == 0 and n:
+                values[-1] = 0.0
+            for age, value in zip(ages, values):
+                rows.append((f"P{pid:03d}", eye, age, value, REMARKS[int(rng.integers(0, len(REMARKS)))]))
+    return pd.DataFrame(rows, columns=["patient_id", "eye", "age", "value", "remarks"])
+
+def _assert_same(batch_row, single):
+    for col in PREDICT_COLUMNS[1:]:
+        expected = single[col]
+        if col == "valid":
+            assert bool(batch_row[col]) == expected
+        elif np.isnan(expected):
+            assert np.isnan(batch_row[col]), col
+        else:
+            assert batch_row[col] == pytest.approx(expected, rel=1e-9, abs=1e-9), col
+
+@pytest.mark.parametrize("mode", ["linear", "log"])
+def test_batch_matches_trend_and_predict(mode):
+    df = _long_table()
+    report = batch_predict(df, mode=mode)
+    assert len(report) == df.groupby(["patient_id", "eye"]).ngroups
+    for row in report.itertuples(index=False):
+        g = df[(df["patient_id"] == row.patient_id) & (df["eye"] == row.eye)]
+        _assert_same(row._asdict(), trend_and_predict(g["age"], g["value"], mode=mode))
+
+def test_batch_matches_recommendation_predict():
+    df = _long_table(seed=1)
+    report = batch_predict(df, mode="recommend")
+    for row in report.itertuples(index=False):
+        g = df[(df["patient_id"] == row.patient_id) & (df["eye"] == row.eye)]
+        single = recommendation_predict(g["age"], g["value"], g["remarks"])
+        _assert_same(row._asdict(), single)
+        # 무효 그룹의 chosen_mode(None)는 DataFrame에서 결측값
+        assert (row.chosen_mode if isinstance(row.chosen_mode, str) else None) == single["chosen_mode"]
+        assert row.adjust_factor == single["adjust_factor"]
+
+def test_batch_accepts_exported_remarks_strings():
+    ages = pd.Series([8.0, 9.0, 10.0])
+    values = pd.Series([23.0, 23.3, 23.5])
+    df = pd.DataFrame({"patient_id": "P1", "eye": "OD", "age": ages, "value": values,
+                       "remarks": ["", "", "OK-lens; 0.125% AT"]})
+    row = batch_predict(df).iloc[0]
+    single = recommendation_predict(ages, values, pd.Series([[], [], ["OK-lens", "0.125% AT"]]))
+    assert row["adjust_factor"] == single["adjust_factor"] == 0.6
+    assert row["pred_at_20"] == pytest.approx(single["pred_at_20"])
+    # pyarrow 리스트 컬럼은 튜플/ndarray로 읽힘
+    for last in (("OK-lens", "0.125% AT"), np.array(["OK-lens", "0.125% AT"], dtype=object)):
+        remarks = pd.Series([(), (), last], dtype=object)
+        assert batch_predict(df.assign(remarks=remarks)).iloc[0]["adjust_factor"] == 0.6
+        assert recommendation_predict(ages, values, remarks)["adjust_factor"] == 0.6
+
+def test_prediction_interval():
+    assert t_critical([1, 10, 30, 10_000]) == pytest.approx([12.706, 2.228, 2.042, 1.96], abs=1e-3)
+    ages = pd.Series([6.0, 7.0, 8.0, 9.0, 10.0, 11.0])
+    values = pd.Series([23.0, 23.3, 23.45, 23.8, 24.0, 24.3])
+    res = trend_and_predict(ages, values, bootstrap=500)
+    assert res["pi_low"] < res["pred_at_20"] < res["pi_high"]
+    assert res["boot_low"] < res["pred_at_20"] < res["boot_high"]
+    # 그래프 음영은 20세에서 결과의 구간과 같고, 자료 가운데서 가장 좁음
+    low, high = prediction_band(res, np.array([8.5, 20.0]))
+    assert (low[1], high[1]) == pytest.approx((res["pi_low"], res["pi_high"]))
+    assert high[0] - low[0] < high[1] - low[1]
+    # 같은 시드면 같은 부트스트랩 구간, 점 2개는 구간 없음
+    assert bootstrap_interval(ages, values, n_boot=500) == (res["boot_low"], res["boot_high"])
+    assert np.isnan(trend_and_predict(ages[:2], values[:2])["pi_low"])
+
+def test_recommendation_adjusts_interval_with_treatment():
+    ages = pd.Series([6.0, 7.0, 8.0, 9.0, 10.0])
+    values = pd.Series([23.0, 23.3, 23.5, 23.8, 24.1])
+    plain = recommendation_predict(ages, values, pd.Series([[]] * 5))
+    treated = recommendation_predict(ages, values, pd.Series([[]] * 4 + [["OK-lens"]]))
+    assert treated["pi_high"] - treated["pi_low"] == pytest.approx(0.6 * (plain["pi_high"] - plain["pi_low"]))
+    assert treated["pi_low"] < treated["pred_at_20"] < treated["pi_high"]
+
+def test_al_centile_matches_nomogram_curves():
+    male, female = get_axial_length_nomogram()
+    for sex, data in (("男", male), ("여", female)):
+        for centile in (3, 10, 50, 90, 95):
+            # 격자(0.05세 x 0.01mm) 조회라 표의 점에서도 약간의 오차
+            assert al_centile(sex, data["age"], data[f"p{centile}"]) == pytest.approx(centile, abs=0.05)
+    # 나이 사이는 매끄러운 곡선, 성별 표기는 男/남/M 모두 같음, 모르는 성별은 NaN
+    mid = nomogram_al("M", 8.5, 0.0)[0]
+    assert male["p50"][4] < mid < male["p50"][5]
+    assert al_centile(["男", "남", "M", "?"], [8.5] * 4, [mid] * 4)[:3] == pytest.approx([50.0] * 3, abs=1e-3)
+    assert np.isnan(al_centile("?", 8.5, mid)[0])
+
+def test_nomogram_al_inverts_zscore():
+    ages = np.linspace(3.0, 20.0, 40)
+    al = np.linspace(20.5, 28.5, 40)
+    for sex in ("M", "F"):
+        assert nomogram_al(sex, ages, al_zscore(sex, ages, al)) == pytest.approx(al, abs=1e-3), sex
+    # 남자 p3/p5는 17->18세에 조금 줄어듦: 표의 값 그대로 왕복
+    assert nomogram_al("M", 18.0, al_zscore("M", 18.0, 22.92))[0] == pytest.approx(22.92, abs=1e-3)
+    assert al_centile("M", 18.0, 22.92)[0] == pytest.approx(3.0, abs=0.05)
+
+def test_nomogram_surface_is_cached_and_read_only():
+    surface = nomogram_surface()
+    assert nomogram_surface() is surface
+    assert surface.al_by_z.shape == (2, len(surface.ages), len(surface.zs))
+    with pytest.raises(ValueError):
+        surface.al_by_z[0, 0, 0] = 0.0
+    # z 방향은 순증가, 꼬리는 p3/p95 곡선보다 빨리 줄지 않음(여자 표는 나이에 단조라 전체가 단조), 격자 밖 나이는 가장자리로 고정
+    assert (np.diff(surface.al_by_z, axis=2) > 0).all()
+    assert (np.diff(surface.al_by_z[1], axis=0) >= 0).all()
+    low = surface.zs < -1.880794
+    edge = surface.al_by_z[0][:, [int(np.argmax(~low))]]
+    assert (np.diff(surface.al_by_z[0][:, low] - edge, axis=0) >= -1e-5).all()
+    assert al_centile("F", 30.0, 25.0)[0] == pytest.approx(al_centile("F", 21.0, 25.0)[0])
+
+def test_centile_crossings():
+    male, _ = get_axial_length_nomogram()
+    ages = [8.0, 10.0, 12.0]
+    values = [male["p25"][4], male["p75"][6] + 0.01, male["p75"][8] - 0.2]
+    assert centile_crossings("男", ages, values) == [(1, 50, 1), (1, 75, 1), (2, 75, -1)]
+    assert centile_crossings("?", ages, values) == []
+
+def test_centile_predict_tracks_last_centile():
+    male, _ = get_axial_length_nomogram()
+    ages = pd.Series([8.0, 10.0, 12.0])
+    values = pd.Series([male["p75"][4], male["p75"][6], male["p75"][8]])
+    res = centile_predict(ages, values, "男", target_age=18.0)
+    assert res["valid"] and res["centile_last"] == pytest.approx(75.0, abs=1e-3) and res["crossings"] == 0
+    assert res["pred_at_20"] == pytest.approx(male["p75"][-1])
+    assert res["pi_low"] <= res["pred_at_20"] <= res["pi_high"]
+    assert not centile_predict(ages, values, None)["valid"]
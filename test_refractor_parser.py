@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+자동굴절계(REF.DATA, KRT.DATA)・각막두께 OCR 파서 테스트 (fixtures/refractor의 OCR 텍스트와 expected.json 비교)
+"""
+import json
+from pathlib import Path
+
+import pytest
+
+from axl_ocr import (
+    Keratometry, Refraction, parse_keratometry_text, parse_pachymetry_text, parse_refraction_line, parse_refractor_text,
+)
+
+FIXTURES = Path(__file__).parent / "fixtures" / "refractor"
+EXPECTED = json.loads((FIXTURES / "expected.json").read_text(encoding="utf-8"))
+
+def _as_lists(reading):
+    return {
+        "date": reading.date.isoformat() if reading.date else None,
+        "od": [list(r) for r in reading.od],
+        "os": [list(r) for r in reading.os],
+        "od_ave": list(reading.od_ave) if reading.od_ave else None,
+        "os_ave": list(reading.os_ave) if reading.os_ave else None,
+        "from_ref_block": reading.from_ref_block,
+    }
+
+@pytest.mark.parametrize("name", sorted(EXPECTED))
+def test_fixture_corpus(name):
+    reading = parse_refractor_text((FIXTURES / name).read_text(encoding="utf-8"))
+    assert _as_lists(reading) == EXPECTED[name]
+
+def test_final_prefers_ave_row():
+    reading = parse_refractor_text((FIXTURES / "01_nidek_decimal_ave.txt").read_text(encoding="utf-8"))
+    assert reading.od_final == Refraction(-2.25, -0.5, 175)
+    assert reading.od_final.se == pytest.approx(-2.5)
+    # AVE 행이 없으면 마지막 측정치
+    reading = parse_refractor_text((FIXTURES / "02_dotless_ocr.txt").read_text(encoding="utf-8"))
+    assert reading.od_final == Refraction(-1.5, -0.5, 88)
+
+def test_parse_refraction_line():
+    assert parse_refraction_line(" -225 -050 175") == Refraction(-2.25, -0.5, 175)
+    assert parse_refraction_line("+1.00 +0.50 90") == Refraction(1.0, -0.5, 90)
+    assert parse_refraction_line("PD: 62") is None
+
+def test_keratometry_block():
+    reading = parse_keratometry_text((FIXTURES / "09_tonoref_krt_pachy.txt").read_text(encoding="utf-8"))
+    assert reading.od == Keratometry(43.0, 43.83, 43.41, 180)
+    # <b>로 잘못 읽힌 좌안 표시, R1이 강주경선인 경우 K1/K2 정렬
+    assert reading.os == Keratometry(43.27, 44.29, 43.78, 5)
+
+def test_keratometry_labels_and_radius_only():
+    reading = parse_keratometry_text("K1: 42.75D @ 178\nK2: 43.50D @ 88")
+    assert reading.od == Keratometry(42.75, 43.5, 43.12, 178) and reading.os is None
+    reading = parse_keratometry_text("KRT.DATA\n<R>\nR1 7.50 180\nR2 7.40 90")
+    assert reading.od.k1 == pytest.approx(45.0) and reading.od.axis == 180
+
+def test_pachymetry():
+    reading = parse_pachymetry_text((FIXTURES / "09_tonoref_krt_pachy.txt").read_text(encoding="utf-8"))
+    assert (reading.od_ct, reading.os_ct) == (545.0, 552.0)
+    reading = parse_pachymetry_text("CCT OD 548 OS 551\nIOP 15 mmHg")
+    assert (reading.od_ct, reading.os_ct) == (548.0, 551.0)
+    # 눈 표시가 값보다 먼저 모여 있는 머리글, 키워드 줄 아래로 이어지는 블록
+    for text in ("R/L CCT 548 551", "OD/OS CCT 548 551", "      R     L\nCCT  548   551",
+                 "Pachymetry (um)\n R 548\n L 551", "R CCT 548 551"):
+        reading = parse_pachymetry_text(text)
+        assert (reading.od_ct, reading.os_ct) == (548.0, 551.0), text
+    # 블록은 빈 줄에서 끝나고, 가장 가까운 표시가 우선
+    reading = parse_pachymetry_text("Pachymetry\n L 551\n\nR 548")
+    assert (reading.od_ct, reading.os_ct) == (None, 551.0)
+    reading = parse_pachymetry_text("LEFT eye report\nOD 548 µm")
+    assert (reading.od_ct, reading.os_ct) == (548.0, None)
+    assert not parse_pachymetry_text("REF.DATA\n<R>\n -125 -050 175").success
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+번들 저장소 테스트: 백엔드별 저장/읽기, 색인 요약/추가 기록, CSV -> Parquet 이전, 저널 재생/압축/버전,
+동시 저장의 date 기준 3-way 병합, SQLite 저장소
+"""
+import pandas as pd
+import pytest
+
+from axl_storage import (
+    INDEX_COLUMNS, JOURNAL_FILE, LOCK_FILE, MODALITIES, LazyBundle, compact_journal, empty_frame, file_lock, get_backend,
+    journal_add, journal_delete, load_frames, load_summary_frame, merge_frames, read_journal, replay_journal,
+    PATIENT_INDEX_FILE, PATIENT_INDEX_LOG, SQLITE_DB_NAME, save_bundle_merged, summarize_bundle, write_bundle,
+)
+
+BACKENDS = ["csv", "parquet", "sqlite"]
+META = {"name": "テスト", "sex": "男", "dob": "2014-04-01", "current_age": None}
+
+def _frame(kind, dates, **values):
+    df = empty_frame(kind).reindex(range(len(dates)))
+    df["date"] = pd.to_datetime(dates)
+    for col, vals in values.items():
+        df[col] = vals
+    df["remarks"] = [[] for _ in dates]
+    return df
+
+def _bundle():
+    return {
+        "axl": _frame("axl", ["2023-01-05", "2024-01-10"], OD_mm=[23.9, 24.1], OS_mm=[23.8, 24.0]),
+        "re": _frame("re", ["2024-03-01"], OD_sph=[-1.25], OD_cyl=[-0.5]),
+        "k": None,
+        "ct": _frame("ct", ["2022-12-01"], OD_ct=[545.0]),
+    }
+
+@pytest.fixture(params=BACKENDS)
+def bundle_dir(request, tmp_path):
+    backend = get_backend(request.param)
+    pdir = tmp_path / "P001"
+    pdir.mkdir()
+    write_bundle(pdir, _bundle(), META, backend)
+    return pdir, backend
+
+def test_summary_frames_match_full_frames(bundle_dir):
+    pdir, backend = bundle_dir
+    # 저널에 남은 기록도 요약에 반영
+    backend.record(pdir, "re", added=_frame("re", ["2024-06-01"], OD_sph=[-1.75]))
+    full = summarize_bundle("P001", META, load_frames(pdir, backend))
+    partial = summarize_bundle("P001", META, {kind: load_summary_frame(pdir, kind, backend) for kind in MODALITIES})
+    for col in ("last_exam", "od_al", "os_al", "n_rows"):
+        assert partial[col] == full[col], col
+    assert (full["last_exam"], full["od_al"], full["n_rows"]) == ("2024-06-01", 24.1, 5)
+
+def test_index_updates_append_one_line_and_compact(tmp_path, monkeypatch):
+    import axl_storage
+    csv = get_backend("csv")
+    summary = summarize_bundle("P001", META, _bundle())
+    csv.write_index(tmp_path, pd.DataFrame([summarize_bundle("P000", META, _bundle())], columns=INDEX_COLUMNS))
+    snapshot = (tmp_path / PATIENT_INDEX_FILE).stat().st_mtime_ns
+    csv.update_index(tmp_path, summary)
+    # 바뀐 값이 없으면 다시 기록하지 않음 (updated_at만 다름)
+    csv.update_index(tmp_path, {**summary, "updated_at": "2099-01-01T00:00:00"})
+    csv.update_index(tmp_path, {**summary, "od_al": 24.5})
+    assert (tmp_path / PATIENT_INDEX_FILE).stat().st_mtime_ns == snapshot
+    assert len((tmp_path / PATIENT_INDEX_LOG).read_text(encoding="utf-8").splitlines()) == 2
+    index = csv.read_index(tmp_path).set_index("patient_id")
+    assert sorted(index.index) == ["P000", "P001"] and index.loc["P001", "od_al"] == 24.5
+    # 기록이 쌓이면 스냅샷으로 압축
+    monkeypatch.setattr(axl_storage, "INDEX_LOG_COMPACT_THRESHOLD", 3)
+    csv.update_index(tmp_path, {**summary, "od_al": 24.6})
+    assert not (tmp_path / PATIENT_INDEX_LOG).exists()
+    assert csv.read_index(tmp_path).set_index("patient_id").loc["P001", "od_al"] == 24.6
+
+def test_legacy_csv_migrates_only_under_exclusive_lock(tmp_path):
+    pytest.importorskip("pyarrow")
+    parquet = get_backend("parquet")
+    pdir = tmp_path / "P001"
+    pdir.mkdir()
+    write_bundle(pdir, _bundle(), META, get_backend("csv"))
+    target = parquet.path(pdir, "axl")
+    # 읽기만으로는 쓰지 않음
+    assert len(parquet.read_frame(pdir, "axl")) == 2 and not target.exists()
+    # 다른 세션이 읽는 중(공유 잠금)이면 이전을 건너뛰고 CSV를 그대로 읽음
+    with file_lock(pdir / LOCK_FILE, shared=True):
+        assert len(LazyBundle(pdir, parquet).get("axl")) == 2
+    assert not target.exists()
+    assert len(LazyBundle(pdir, parquet).get("axl")) == 2 and target.exists()
+    # 전체 저장은 이 세션이 건드리지 않은 모달리티도 옮김
+    write_bundle(pdir, {"axl": parquet.read_frame(pdir, "axl")}, META, parquet)
+    assert parquet.path(pdir, "ct").exists() and not parquet.needs_migration(pdir, "re")
+
+def test_replay_journal_add_delete_clear():
+    snapshot = {"axl": _frame("axl", ["2024-01-10", "2024-02-10"], OD_mm=[24.0, 24.1]), "re": None}
+    entries = [
+        # 같은 날짜는 나중 기록이 우선
+        {"op": "add", "kind": "axl", "rows": [{"date": "2024-02-10", "OD_mm": 24.2, "remarks": ["OK-lens"]}]},
+        {"op": "add", "kind": "axl", "rows": [{"date": "2024-03-10", "OD_mm": 24.3, "remarks": []}]},
+        {"op": "delete", "kind": "axl", "dates": ["2024-01-10T00:00:00"]},
+        {"op": "add", "kind": "re", "rows": [{"date": "2024-03-10", "OD_sph": -1.0, "remarks": []}]},
+        {"op": "clear", "kind": "re"},
+        {"op": "add", "kind": "unknown", "rows": [{"date": "2024-03-10"}]},
+    ]
+    out = replay_journal(snapshot, entries)
+    assert out["axl"]["date"].dt.strftime("%Y-%m-%d").tolist() == ["2024-02-10", "2024-03-10"]
+    assert out["axl"]["OD_mm"].tolist() == [24.2, 24.3]
+    assert out["axl"]["remarks"].iloc[0] == ["OK-lens"]
+    assert out["re"].empty and "unknown" not in out
+    # 입력 스냅샷은 그대로
+    assert len(snapshot["axl"]) == 2
+
+def test_journal_counts_lines_and_compacts(tmp_path):
+    backend = get_backend("csv")
+    pdir = tmp_path / "P001"
+    pdir.mkdir()
+    write_bundle(pdir, _bundle(), META, backend)
+    assert journal_add(pdir, "axl", _frame("axl", ["2024-06-01"], OD_mm=[24.3])) == 1
+    assert journal_delete(pdir, "axl", ["2023-01-05"]) == 2
+    # 다른 프로세스가 추가한 줄도 다시 세어 반영
+    with open(pdir / JOURNAL_FILE, "a", encoding="utf-8") as f:
+        f.write('{"op": "clear", "kind": "ct"}\n')
+    assert journal_delete(pdir, "re", ["2024-03-01"]) == 4
+    assert len(read_journal(pdir)) == 4
+
+    frames = compact_journal(pdir, backend)
+    assert not (pdir / JOURNAL_FILE).exists() and compact_journal(pdir, backend) is None
+    assert frames["axl"]["OD_mm"].tolist() == [24.1, 24.3]
+    assert frames["re"].empty and frames["ct"].empty
+    # 스냅샷만으로 같은 결과, 압축 뒤 저널은 1줄부터
+    on_disk = load_frames(pdir, backend)
+    assert on_disk["axl"]["OD_mm"].tolist() == [24.1, 24.3]
+    assert journal_delete(pdir, "axl", ["2024-06-01"]) == 1
+
+def _al(df):
+    return dict(zip(df["date"].dt.strftime("%Y-%m-%d"), df["OD_mm"]))
+
+BASE = _frame("axl", ["2024-01-10", "2024-02-10", "2024-03-10"], OD_mm=[24.0, 24.1, 24.2])
+
+def test_merge_keeps_edits_to_different_dates():
+    ours = _frame("axl", ["2024-01-10", "2024-02-10", "2024-03-10", "2024-04-10"], OD_mm=[24.0, 24.15, 24.2, 24.3])
+    theirs = _frame("axl", ["2024-01-10", "2024-02-10", "2024-03-10", "2024-05-10"], OD_mm=[23.95, 24.1, 24.2, 24.4])
+    merged, conflicts = merge_frames("axl", BASE, ours, theirs)
+    assert conflicts == []
+    assert _al(merged) == {"2024-01-10": 23.95, "2024-02-10": 24.15, "2024-03-10": 24.2,
+                           "2024-04-10": 24.3, "2024-05-10": 24.4}
+
+def test_merge_same_date_conflict_keeps_this_session():
+    ours = _frame("axl", ["2024-01-10", "2024-02-10", "2024-03-10"], OD_mm=[24.0, 24.15, 24.2])
+    theirs = _frame("axl", ["2024-01-10", "2024-02-10", "2024-03-10"], OD_mm=[24.0, 24.12, 24.2])
+    merged, conflicts = merge_frames("axl", BASE, ours, theirs)
+    assert conflicts == [pd.Timestamp("2024-02-10")]
+    assert _al(merged)["2024-02-10"] == 24.15
+    # 양쪽이 같은 값으로 바꾸면 충돌 아님
+    assert merge_frames("axl", BASE, ours, ours)[1] == []
+
+def test_merge_delete_versus_edit_keeps_the_edit():
+    edited = _frame("axl", ["2024-01-10", "2024-02-10", "2024-03-10"], OD_mm=[24.0, 24.15, 24.2])
+    deleted = _frame("axl", ["2024-01-10", "2024-03-10"], OD_mm=[24.0, 24.2])
+    for ours, theirs in ((deleted, edited), (edited, deleted)):
+        merged, conflicts = merge_frames("axl", BASE, ours, theirs)
+        assert conflicts == [pd.Timestamp("2024-02-10")]
+        assert _al(merged) == {"2024-01-10": 24.0, "2024-02-10": 24.15, "2024-03-10": 24.2}
+    # 한쪽만 지운 날짜는 지워짐
+    merged, conflicts = merge_frames("axl", BASE, deleted, BASE)
+    assert conflicts == [] and "2024-02-10" not in _al(merged)
+
+def test_record_keeps_version_in_journal_and_meta_untouched(bundle_dir):
+    pdir, backend = bundle_dir
+    start = backend.bump_version(pdir)
+    meta_file = pdir / "meta.json"
+    files = lambda: {f.name: f.stat().st_mtime_ns for f in pdir.iterdir() if f.name != JOURNAL_FILE}
+    before = files()
+    n_entries, version = backend.record(pdir, "axl", added=_frame("axl", ["2024-06-01"], OD_mm=[24.3]))
+    assert version == start + 1 == backend.read_version(pdir)
+    # 같은 meta면 다시 쓰지 않고, 파일 백엔드는 저널 한 줄 외에 건드리는 파일이 없음
+    assert not backend.update_meta(pdir, META)
+    assert files() == before
+    if backend.uses_file_lock:
+        assert n_entries == 1 and read_journal(pdir)[-1]["version"] == version
+        assert backend.update_meta(pdir, {**META, "name": "別名"}) and meta_file.exists()
+        # 저널을 스냅샷으로 옮겨도 버전은 유지
+        compact_journal(pdir, backend)
+        assert not (pdir / JOURNAL_FILE).exists() and backend.read_version(pdir) == version
+    assert backend.record(pdir, "re", deleted=[pd.Timestamp("2024-03-01")])[1] == version + 1
+    _, new_version, _ = save_bundle_merged(pdir, load_frames(pdir, backend), META, {}, version + 1, backend)
+    assert new_version == version + 2
+
+@pytest.mark.parametrize("backend_name", BACKENDS)
+def test_save_bundle_merged_merges_only_after_another_save(tmp_path, backend_name):
+    backend = get_backend(backend_name)
+    pdir = tmp_path / "P001"
+    pdir.mkdir()
+    write_bundle(pdir, {"axl": BASE}, META, backend)
+    version = backend.bump_version(pdir)
+    # 다른 세션이 먼저 저장 (5월 추가)
+    theirs = _frame("axl", ["2024-01-10", "2024-02-10", "2024-03-10", "2024-05-10"], OD_mm=[24.0, 24.1, 24.2, 24.4])
+    save_bundle_merged(pdir, {"axl": theirs}, META, {"axl": BASE}, version, backend)
+    # 이 세션은 불러온 시점(version) 기준으로 4월 추가, 1월 삭제
+    ours = _frame("axl", ["2024-02-10", "2024-03-10", "2024-04-10"], OD_mm=[24.1, 24.2, 24.3])
+    frames, new_version, conflicts = save_bundle_merged(pdir, {"axl": ours}, META, {"axl": BASE}, version, backend)
+    assert new_version == version + 2 and conflicts == {}
+    expected = {"2024-02-10": 24.1, "2024-03-10": 24.2, "2024-04-10": 24.3, "2024-05-10": 24.4}
+    assert _al(frames["axl"]) == expected == _al(load_frames(pdir, backend)["axl"])
+    # 버전이 같으면 병합 없이 그대로 덮어씀
+    frames, _, _ = save_bundle_merged(pdir, {"axl": BASE}, META, {"axl": ours}, new_version, backend)
+    assert _al(load_frames(pdir, backend)["axl"]) == _al(BASE)
+
+def _folder_patient(root, pid):
+    pdir = root / pid
+    pdir.mkdir(parents=True)
+    write_bundle(pdir, _bundle(), dict(META, name=pid), get_backend("parquet" if _has_pyarrow() else "csv"))
+
+def _has_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def test_sqlite_record_and_query(tmp_path):
+    sqlite = get_backend("sqlite")
+    for pid in ("P001", "P002"):
+        write_bundle(tmp_path / pid, _bundle(), dict(META, name=pid), sqlite)
+    sqlite.record(tmp_path / "P002", "axl", added=_frame("axl", ["2024-06-01"], OD_mm=[24.5]), deleted=["2023-01-05"])
+    df = sqlite.query(tmp_path, "axl", patient_ids=["P002"], date_from="2024-01-01")
+    assert df["OD_mm"].tolist() == [24.1, 24.5] and set(df["patient_id"]) == {"P002"}
+    assert len(sqlite.query(tmp_path, "axl")) == 4
+    assert sqlite.has_frame(tmp_path / "P001", "ct") and not sqlite.has_frame(tmp_path / "P001", "k")
+    with pytest.raises(ValueError):
+        sqlite.has_frame(tmp_path / "P001", "axl; DROP TABLE meta")
+
+def test_sqlite_survives_deleted_db(tmp_path):
+    sqlite = get_backend("sqlite")
+    write_bundle(tmp_path / "P001", _bundle(), META, sqlite)
+    (tmp_path / SQLITE_DB_NAME).unlink()
+    # 같은 프로세스에서 DB가 사라져도 테이블을 다시 만들고 동작
+    assert sqlite.read_frame(tmp_path / "P001", "axl") is None
+    assert not sqlite.has_frame(tmp_path / "P001", "axl") and sqlite.list_ids(tmp_path) == []
+    write_bundle(tmp_path / "P001", _bundle(), META, sqlite)
+    assert len(sqlite.read_frame(tmp_path / "P001", "axl")) == 2
+
+def test_sqlite_imports_folder_bundles(tmp_path):
+    sqlite = get_backend("sqlite")
+    _folder_patient(tmp_path, "P001")
+    # DB를 처음 만들 때 자동으로 가져옴
+    assert sqlite.list_ids(tmp_path) == ["P001"]
+    assert len(sqlite.read_frame(tmp_path / "P001", "axl")) == 2
+    # 그 뒤에 생긴 폴더는 import_dirs로, 이미 있는 환자는 건너뜀
+    _folder_patient(tmp_path, "P002")
+    assert sqlite.list_ids(tmp_path) == ["P001"]
+    assert sqlite.import_dirs(tmp_path) == 1 and sqlite.import_dirs(tmp_path) == 0
+    assert sqlite.list_ids(tmp_path) == ["P001", "P002"]
+    assert sorted(sqlite.read_index(tmp_path)["patient_id"]) == ["P001", "P002"]
+    assert len(sqlite.query(tmp_path, "axl")) == 4